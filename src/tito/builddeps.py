@@ -0,0 +1,246 @@
+# Copyright (c) 2008-2011 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+"""
+Checks spec files' BuildRequires against the installed packages before
+building, so missing build dependencies are found before any time is spent
+on tarballs and srpms.
+"""
+import os
+import re
+import shlex
+import sys
+
+from tito.cache import digest, file_digest, file_stamp, read_json, \
+    write_json
+from tito.common import debug, run_command
+from tito.compat import getstatusoutput
+from tito.exception import TitoException
+
+try:
+    from shlex import quote
+except ImportError:
+    from pipes import quote
+
+# Dependency sense flags, see rpmds.h:
+RPMSENSE_LESS = 2
+RPMSENSE_GREATER = 4
+RPMSENSE_EQUAL = 8
+
+
+def rpmbuild_macros(options):
+    """
+    Return the macros set by the given rpmbuild command line options
+    (--define, --undefine, --with, --without and --eval '%undefine ...'),
+    as (name, value) pairs in the order given, with a value of None for
+    those undefined.
+    """
+    macros = []
+    args = shlex.split(options)
+    while args:
+        arg = args.pop(0)
+        if arg.startswith("--") and "=" in arg:
+            arg, value = arg.split("=", 1)
+        elif arg in ['--define', '-D', '--undefine', '--with', '--without',
+                '--eval', '-E'] and args:
+            value = args.pop(0)
+        else:
+            continue
+        if arg in ['--define', '-D']:
+            parts = value.split(None, 1)
+            if parts:
+                macros.append((parts[0], len(parts) > 1 and parts[1] or ""))
+        elif arg == '--undefine':
+            macros.append((value, None))
+        elif arg in ['--with', '--without']:
+            macros.append(("_%s_%s" % (arg[2:], value),
+                "%s-%s" % (arg, value)))
+        else:
+            for name in re.findall(r"%undefine\s+(\w+)", value):
+                macros.append((name, None))
+    return macros
+
+
+def missing_build_deps(spec_files, macros=None, cache_dir=None):
+    """
+    Return the BuildRequires of all the given spec files which nothing
+    installed provides, checking them against the rpm database together.
+    """
+    requires = []
+    for spec_file in spec_files:
+        for dep in get_build_requires(spec_file, macros, cache_dir):
+            if dep not in requires:
+                requires.append(dep)
+    return find_missing(requires)
+
+
+def get_build_requires(spec_file, macros=None, cache_dir=None):
+    """
+    Return the BuildRequires of the given spec file as rpm dependencies
+    (i.e. "python3-devel >= 3.6"), evaluated with the given macros set as
+    by rpmbuild_macros, so conditional BuildRequires come out as rpmbuild
+    will see them.
+
+    Parsing the spec evaluates all its macros, so the result is kept in
+    cache_dir, if given, by the spec's contents and macros.
+    """
+    macros = macros or []
+    cache_file = None
+    if cache_dir:
+        cache_file = os.path.join(cache_dir, "%s.json" % digest(
+            file_digest(spec_file), macros,
+            file_stamp(os.path.expanduser("~/.rpmmacros"))))
+        requires = read_json(cache_file)
+        if requires is not None:
+            debug("Using cached BuildRequires of %s" % spec_file)
+            return requires
+
+    try:
+        import rpm
+    except ImportError:
+        rpm = None
+    # Undefining a macro for one spec can't be undone in this process, so
+    # leave that to rpmspec:
+    if rpm and [name for (name, value) in macros if value is None and
+            rpm.expandMacro("%%{?%s:1}" % name)]:
+        rpm = None
+    if rpm:
+        requires = _parse_build_requires(rpm, spec_file, macros)
+    else:
+        requires = _query_build_requires(spec_file, macros)
+
+    if cache_file:
+        write_json(cache_file, requires)
+    return requires
+
+
+def _parse_build_requires(rpm, spec_file, macros):
+    """
+    get_build_requires using the rpm Python bindings to parse the spec.
+    Any macros to undefine are known not to be defined.
+    """
+    defined = [(name, value) for (name, value) in macros if value is not None]
+    for name, value in defined:
+        rpm.addMacro(name, value)
+    try:
+        try:
+            spec = rpm.spec(spec_file)
+        except ValueError:
+            raise TitoException("Unable to parse %s: %s" % (spec_file,
+                sys.exc_info()[1]))
+    finally:
+        for name, value in reversed(defined):
+            rpm.delMacro(name)
+
+    header = spec.sourceHeader
+    requires = []
+    for name, flags, version in zip(header[rpm.RPMTAG_REQUIRENAME],
+            header[rpm.RPMTAG_REQUIREFLAGS],
+            header[rpm.RPMTAG_REQUIREVERSION]):
+        requires.append(format_dep(_text(name), flags, _text(version)))
+    return [dep for dep in requires if not dep.startswith("rpmlib(")]
+
+
+def _query_build_requires(spec_file, macros):
+    """
+    get_build_requires without the rpm Python bindings, using rpmspec.
+    """
+    options = []
+    for name, value in macros:
+        if value is None:
+            options.append("--undefine %s" % quote(name))
+        else:
+            options.append("--define %s" % quote("%s %s" % (name, value)))
+    output = run_command("rpmspec -q --buildrequires %s %s" % (
+        " ".join(options), quote(spec_file)))
+    return [line.strip() for line in output.splitlines()
+        if line.strip() and not line.startswith("rpmlib(")]
+
+
+def _text(value):
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    return value
+
+
+def format_dep(name, flags, version):
+    """
+    Return a dependency as rpm would show it, i.e. "foo >= 1.0".
+    """
+    sense = ""
+    if flags & RPMSENSE_LESS:
+        sense += "<"
+    if flags & RPMSENSE_GREATER:
+        sense += ">"
+    if flags & RPMSENSE_EQUAL:
+        sense += "="
+    if sense and version:
+        return "%s %s %s" % (name, sense, version)
+    return name
+
+
+def find_missing(requires):
+    """
+    Return those of the given dependencies which nothing installed provides.
+
+    Only the names are checked (a file path, or a package or capability
+    name): if something installed provides an older version, or the
+    dependency is a rich one ("(a or b)"), rpmbuild itself has the final say.
+    """
+    names = []
+    for dep in requires:
+        if dep.startswith("("):
+            continue
+        name = dep.split()[0]
+        if name not in names:
+            names.append(name)
+    if not names:
+        return []
+
+    try:
+        import rpm
+    except ImportError:
+        missing = _query_missing(names)
+    else:
+        missing = _match_missing(rpm, names)
+    return [dep for dep in requires if dep.split()[0] in missing]
+
+
+def _match_missing(rpm, names):
+    """
+    find_missing with the rpm Python bindings, using the rpm database's
+    indexes of what installed packages provide.
+    """
+    ts = rpm.TransactionSet()
+    missing = []
+    for name in names:
+        tag = name.startswith("/") and 'basenames' or 'providename'
+        for header in ts.dbMatch(tag, name):
+            break
+        else:
+            missing.append(name)
+    return missing
+
+
+def _query_missing(names):
+    """
+    find_missing without the rpm Python bindings, using a single rpm -q.
+    """
+    (status, output) = getstatusoutput("rpm -q --whatprovides %s" %
+        " ".join([quote(name) for name in names]))
+    if status == 0:
+        return []
+    missing = []
+    for line in output.splitlines():
+        if line.startswith("no package provides "):
+            missing.append(line[len("no package provides "):].strip())
+    return missing
@@ -11,14 +11,26 @@
 # granted to use or replicate Red Hat trademarks that are incorporated
 # in this software or its documentation.
 
+import hashlib
 import re
 import os.path
 import shutil
+import sys
 
 from tito.builder.main import BuilderBase
+from tito.cache import get_cache_dir, digest, file_digest, cached_file, \
+    store_file, prune_cache
 from tito.config_object import ConfigObject
-from tito.common import error_out, debug, get_spec_version_and_release, \
-    get_class_by_name
+from tito.common import error_out, warn_out, debug, run_command, \
+    get_spec_version_and_release, get_class_by_name, place_file, run_parallel
+
+try:
+    from urllib2 import urlopen
+except ImportError:
+    from urllib.request import urlopen
+
+# Default maximum size of the downloaded sources cache in megabytes:
+DEFAULT_SOURCE_CACHE_SIZE = 2048
 
 
 class FetchBuilder(ConfigObject, BuilderBase):
@@ -210,3 +222,162 @@ def replace_in_spec(self, replacements):
         in_f.close()
         out_f.close()
         shutil.move(self.spec_file + ".new", self.spec_file)
+
+
+def read_sources_file(path):
+    """
+    Return the checksums in a dist-git style "sources" file as a dict of
+    file name to (algorithm, hex digest), or an empty dict if there is none.
+
+    Both the "SHA512 (name) = digest" format and the older "md5digest  name"
+    format are understood.
+    """
+    checksums = {}
+    if not os.path.exists(path):
+        return checksums
+    tagged_re = re.compile(r"^(\w+) \((.+)\) = ([0-9a-fA-F]+)$")
+    md5_re = re.compile(r"^([0-9a-fA-F]{32})\s+(.+)$")
+    f = open(path, 'r')
+    try:
+        for line in f.readlines():
+            line = line.strip()
+            match = tagged_re.match(line)
+            if match:
+                checksums[match.group(2)] = (match.group(1).lower(),
+                    match.group(3).lower())
+                continue
+            match = md5_re.match(line)
+            if match:
+                checksums[match.group(2)] = ('md5', match.group(1).lower())
+    finally:
+        f.close()
+    return checksums
+
+
+class SpecSourceStrategy(SourceStrategy):
+    """
+    Fetches every Source in the spec file, which may be paths relative to the
+    spec file or file://, http:// and https:// URLs, and builds the version
+    and release the spec file already has.
+
+    Sources listed in a dist-git style "sources" file next to the spec file
+    are verified against their checksums. Downloaded sources are kept in a
+    cache in the build dir shared by all packages, by checksum when one is
+    known and otherwise by URL, and are linked into the sources directory
+    from there so they are never downloaded twice.
+    """
+    def fetch(self):
+        spec_name = '%s.spec' % self.builder.project_name
+        self.spec_file = os.path.join(self.builder.rpmbuild_sourcedir,
+            spec_name)
+        shutil.copyfile(os.path.join(self.builder.start_dir, spec_name),
+            self.spec_file)
+        print("  %s" % spec_name)
+
+        self.checksums = read_sources_file(os.path.join(
+            self.builder.start_dir, "sources"))
+        self.cache_dir = get_cache_dir(self.builder.rpmbuild_basedir,
+            "sources")
+
+        jobs = None
+        if 'fetch_jobs' in self.builder.args:
+            jobs = int(self.builder.args['fetch_jobs'][0])
+
+        spec_sources = self._list_sources()
+        debug("Got sources: %s" % spec_sources)
+        fetched = {}
+        for source, path in run_parallel(self._fetch_source, spec_sources,
+                jobs):
+            print("  %s" % os.path.basename(path))
+            fetched[source] = path
+        self.sources = [fetched[source] for source in spec_sources]
+        prune_cache(self.cache_dir, self._get_cache_size())
+
+        (self.version, self.release) = \
+            self.builder.build_tag.rsplit('-', 2)[1:]
+
+    def _list_sources(self):
+        """
+        Return the Source lines of the spec file, with macros expanded.
+        """
+        output = run_command("/usr/bin/spectool --list-files --sources '%s'"
+            % self.spec_file)
+        sources = []
+        for line in output.splitlines():
+            if re.match(r"^Source\d*:", line):
+                sources.append(line.split(":", 1)[1].strip())
+        return sources
+
+    def _fetch_source(self, source):
+        """
+        Put the given source in the sources directory and return its path
+        there. Runs concurrently for every source.
+        """
+        # As with rpmbuild, the name is whatever follows the last slash, so
+        # "https://.../v1.0.tar.gz#/foo-1.0.tar.gz" is foo-1.0.tar.gz:
+        name = os.path.basename(source)
+        dest = os.path.join(self.builder.rpmbuild_sourcedir, name)
+        checksum = self.checksums.get(name)
+
+        if "://" not in source:
+            path = os.path.join(self.builder.start_dir, source)
+            if not os.path.exists(path):
+                error_out("Source not found: %s" % path)
+            if checksum:
+                self._verify(name, checksum, file_digest(path, checksum[0]))
+            return place_file(path, dest)
+
+        # Only verified sources and remote URLs are cached, the file behind
+        # a file:// URL can change at any time:
+        key = None
+        if checksum:
+            key = "%s-%s" % checksum
+        elif source.startswith("http://") or source.startswith("https://"):
+            key = "url-%s" % digest(source)
+        if key:
+            cached = cached_file(self.cache_dir, key)
+            if cached:
+                debug("Using cached source: %s" % cached)
+                self.builder.timer.cache_hit("sources")
+                return place_file(cached, dest)
+
+        debug("Downloading %s" % source)
+        hasher = hashlib.new(checksum[0] if checksum else 'sha256')
+        try:
+            response = urlopen(source)
+            try:
+                out_f = open(dest, 'wb')
+                try:
+                    for chunk in iter(lambda: response.read(1024 * 1024), b''):
+                        hasher.update(chunk)
+                        out_f.write(chunk)
+                finally:
+                    out_f.close()
+            finally:
+                response.close()
+        except (IOError, OSError):
+            error_out("Unable to fetch %s: %s" % (source, sys.exc_info()[1]))
+
+        if checksum:
+            self._verify(name, checksum, hasher.hexdigest())
+        if key:
+            store_file(self.cache_dir, key, dest)
+        return dest
+
+    def _verify(self, name, checksum, actual):
+        if actual != checksum[1]:
+            error_out("%s checksum mismatch for %s: expected %s, got %s" %
+                (checksum[0].upper(), name, checksum[1], actual))
+
+    def _get_cache_size(self):
+        """
+        Return the maximum size of the source cache in bytes.
+        """
+        user_config = self.builder.user_config or {}
+        try:
+            return int(user_config.get('SOURCE_CACHE_SIZE',
+                DEFAULT_SOURCE_CACHE_SIZE)) * 1024 * 1024
+        except ValueError:
+            warn_out("Invalid SOURCE_CACHE_SIZE in ~/.titorc: %s" %
+                user_config['SOURCE_CACHE_SIZE'])
+            return DEFAULT_SOURCE_CACHE_SIZE * 1024 * 1024
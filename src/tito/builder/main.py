@@ -20,11 +20,15 @@
 import sys
 import re
 import shutil
-import rpm
-from pkg_resources import require
-from distutils.version import LooseVersion as loose_version
+import time
 from tempfile import mkdtemp
 
+try:
+    from shlex import quote
+except ImportError:
+    from pipes import quote
+
+from tito.builddeps import missing_build_deps, rpmbuild_macros
 from tito.common import scl_to_rpm_option, get_latest_tagged_version, \
     find_wrote_in_rpmbuild_output, debug, error_out, run_command_print, \
     find_spec_file, run_command, get_build_commit, get_relative_project_dir, \
@@ -33,12 +37,32 @@
     get_commit_count, find_gemspec_file, create_builder, compare_version,\
     find_cheetah_template_file, render_cheetah, replace_spec_release, \
     find_spec_like_file, warn_out, get_commit_timestamp, chdir, mkdir_p, \
-    find_git_root, info_out, munge_specfile, BUILDCONFIG_SECTION
+    find_git_root, info_out, munge_specfile, update_tgz, get_tito_version, \
+    run_parallel, place_file, get_trash_dir, remove_tree, cpu_count, \
+    find_file_with_extension, BUILDCONFIG_SECTION
+from tito.cache import get_cache_dir, digest, file_digest, file_stamp, \
+    cached_file, store_file, prune_cache, prune_tree
 from tito.compat import getstatusoutput
 from tito.exception import RunCommandException
 from tito.exception import TitoException
+from tito.executor import get_worker_pool
+from tito.scratch import get_scratch_space, estimate_size, record_size, \
+    tree_size
 from tito.config_object import ConfigObject
 from tito.tar import TarFixer
+from tito.timing import BuildTimer, HISTORY_FILENAME
+
+# Maximum size of the srpm cache in megabytes, see SRPM_CACHE_SIZE:
+DEFAULT_SRPM_CACHE_SIZE = 512
+
+# Maximum size of the generated patches cache in megabytes:
+DEFAULT_PATCH_CACHE_SIZE = 64
+
+# Maximum size of each of the Maven caches in megabytes, see MAVEN_CACHE_SIZE:
+DEFAULT_MAVEN_CACHE_SIZE = 4096
+
+# Ways MeadBuilder can check out the source to run Maven in:
+CHECKOUT_STRATEGIES = ['worktree', 'shared', 'clone']
 
 
 class BuilderBase(object):
@@ -80,6 +104,17 @@ def __init__(self, name=None, build_dir=None,
         self.quiet = self._get_optional_arg(kwargs, 'quiet', False)
         self.verbose = self._get_optional_arg(kwargs, 'verbose', False)
 
+        # Times each stage of the build for tito report --build-times:
+        self.timer = BuildTimer()
+
+        # Build workers to run rpmbuild and mock on, if any are configured:
+        self.workers = get_worker_pool(user_config)
+
+        # Scratch space to put rpmbuild's BUILD dir on, if configured, and
+        # the directory we reserved there:
+        self.scratch = get_scratch_space(user_config)
+        self.scratch_dir = None
+
         rpmbuildopts = self._get_optional_arg(args, 'rpmbuild_options', None)
         if rpmbuildopts:
             self.rpmbuild_options = ' '.join(rpmbuildopts)
@@ -98,6 +133,9 @@ def __init__(self, name=None, build_dir=None,
         self.rpmbuild_dir = mkdtemp(dir=self.rpmbuild_basedir,
             prefix="rpmbuild-%s" % self.project_name)
         debug("Building in temp dir: %s" % self.rpmbuild_dir)
+        # Where cleanup moves the temp dir to be deleted in the background,
+        # if enabled:
+        self.trash_dir = get_trash_dir(self.rpmbuild_basedir, user_config)
         self.rpmbuild_sourcedir = os.path.join(self.rpmbuild_dir, "SOURCES")
         self.rpmbuild_builddir = os.path.join(self.rpmbuild_dir, "BUILD")
 
@@ -117,6 +155,14 @@ def __init__(self, name=None, build_dir=None,
         # Use most suitable package manager for current OS
         self.package_manager = package_manager()
 
+        # Queue shared with other builders in this run to install our rpms
+        # into, if any, otherwise we install them ourselves:
+        self.install_queue = self._get_optional_arg(kwargs, 'install_queue',
+            None)
+        # Whether our rpms are waiting in the shared queue, in which case
+        # the build times are recorded once they've been installed:
+        self.install_pending = False
+
     def _get_optional_arg(self, kwargs, arg, default):
         """
         Return the value of an optional keyword argument if it's present,
@@ -144,31 +190,65 @@ def run(self, options):
 
         # Reset list of artifacts on each call to run().
         self.artifacts = []
+        self.timer.reset()
+        self.install_pending = False
 
+        ok = False
         try:
             try:
+                if options.rpm:
+                    # Before any tarball work, so a build which can't work
+                    # fails straight away:
+                    with self.timer.stage("builddeps"):
+                        self._check_build_deps()
                 if options.tgz:
-                    self.tgz()
+                    with self.timer.stage("tgz"):
+                        self.tgz()
                 if options.srpm:
-                    self.srpm()
+                    with self.timer.stage("srpm"):
+                        self.srpm()
                 if options.rpm:
                     # TODO: not protected anymore
-                    self.rpm()
-                    self._auto_install()
+                    with self.timer.stage("rpm"):
+                        self.rpm()
+                    with self.timer.stage("_auto_install"):
+                        self._auto_install()
+                ok = True
             except KeyboardInterrupt:
                 print("Interrupted, cleaning up...")
         finally:
             self.cleanup()
+            if not self.install_pending:
+                self._record_build_times(ok)
 
         return self.artifacts
 
+    def _check_build_deps(self):
+        """
+        Check the build dependencies are installed before building rpms.
+        Implemented by builders which can find their spec file without
+        setting up the sources.
+        """
+        pass
+
+    def _record_build_times(self, ok):
+        """
+        Add this build's timings to the history in the build dir, if it did
+        anything.
+        """
+        if self.timer.stages and os.path.isdir(self.rpmbuild_basedir):
+            self.timer.record(os.path.join(self.rpmbuild_basedir,
+                HISTORY_FILENAME), self.project_name, self.build_tag,
+                self.__class__.__name__, self.artifacts, ok)
+
     def cleanup(self):
         """
         Remove all temporary files and directories.
         """
+        self._release_scratch()
         if not self.no_cleanup:
             debug("Cleaning up %s" % self.rpmbuild_dir)
-            shutil.rmtree(self.rpmbuild_dir)
+            remove_tree(self.rpmbuild_dir, self.trash_dir)
         else:
             warn_out("Leaving rpmbuild files in: %s" % self.rpmbuild_dir)
 
@@ -221,6 +301,19 @@ def srpm(self, dist=None):
 
         rpmbuild_options = self.rpmbuild_options + self._scl_to_rpmbuild_option()
 
+        cache_dir, cache_key = self._get_srpm_cache(rpmbuild_options,
+            define_dist)
+        if cache_key:
+            cached = cached_file(cache_dir, cache_key)
+            if cached:
+                self.srpm_location = os.path.join(self.rpmbuild_basedir,
+                    os.path.basename(cached))
+                place_file(cached, self.srpm_location, link=False)
+                info_out("Using cached srpm: %s" % self.srpm_location)
+                self.timer.cache_hit("srpm")
+                self.artifacts.append(self.srpm_location)
+                return
+
         cmd = ('rpmbuild --define "_source_filedigest_algorithm md5"  --define'
             ' "_binary_filedigest_algorithm md5" %s %s %s --nodeps -bs %s' % (
                 rpmbuild_options, self._get_rpmbuild_dir_options(),
@@ -229,6 +322,53 @@ def srpm(self, dist=None):
         self.srpm_location = find_wrote_in_rpmbuild_output(output)[0]
         self.artifacts.append(self.srpm_location)
 
+        if cache_key:
+            store_file(cache_dir, cache_key, self.srpm_location)
+            prune_cache(cache_dir, self._get_srpm_cache_size())
+
+    def _get_srpm_sourcedir(self):
+        """
+        Return the directory rpmbuild reads Source and Patch files from.
+        """
+        return self.rpmbuild_sourcedir
+
+    def _get_srpm_cache(self, rpmbuild_options, define_dist):
+        """
+        Return the cache directory and key identifying the srpm the given
+        rpmbuild invocation would produce, or (None, None) if the srpm cache
+        is disabled in ~/.titorc.
+
+        The key covers the spec file as it will be built, every file in the
+        sources directory, and the options and macros passed to rpmbuild.
+        """
+        user_config = self.user_config or {}
+        if user_config.get('SRPM_CACHE', '1') in ['0', '', 'False', 'false']:
+            return (None, None)
+
+        parts = [os.path.basename(self.spec_file), file_digest(self.spec_file),
+            rpmbuild_options, define_dist,
+            file_stamp(os.path.expanduser("~/.rpmmacros"))]
+        sourcedir = self._get_srpm_sourcedir()
+        for name in sorted(os.listdir(sourcedir)):
+            path = os.path.join(sourcedir, name)
+            if os.path.isfile(path):
+                parts.extend([name, file_digest(path)])
+        cache_dir = get_cache_dir(self.rpmbuild_basedir, "srpm")
+        return (cache_dir, digest(*parts))
+
+    def _get_srpm_cache_size(self):
+        """
+        Return the maximum size of the srpm cache in bytes.
+        """
+        user_config = self.user_config or {}
+        try:
+            return int(user_config.get('SRPM_CACHE_SIZE',
+                DEFAULT_SRPM_CACHE_SIZE)) * 1024 * 1024
+        except ValueError:
+            warn_out("Invalid SRPM_CACHE_SIZE in ~/.titorc: %s" %
+                user_config['SRPM_CACHE_SIZE'])
+            return DEFAULT_SRPM_CACHE_SIZE * 1024 * 1024
+
     # Assume that if tito's --no-cleanup option is set, also disable %clean in rpmbuild:
     def _get_clean_option(self):
         if self.no_cleanup:
@@ -237,6 +377,9 @@ def _get_clean_option(self):
                 return "--noclean"
             else:
                 return ""
+        elif self.scratch_dir:
+            # Removed with the scratch dir, once we've seen how big it got:
+            return ""
         else:
             return "--clean"
 
@@ -251,6 +394,9 @@ def rpm(self):
         self._create_build_dirs()
         if not self.ran_tgz:
             self.tgz()
+        if self.workers:
+            return self._rpm_on_worker()
+        self._reserve_scratch()
 
         cmd = 'rpmbuild {0}'.format(
             " ".join([
@@ -292,6 +438,97 @@ def rpm(self):
         print
         info_out("Successfully built: %s" % '\n\t- '.join(files_written))
 
+    def _get_scratch_history(self):
+        return os.path.join(get_cache_dir(self.rpmbuild_basedir, "scratch"),
+            "%s.json" % self.project_name)
+
+    def _reserve_scratch(self):
+        """
+        Move rpmbuild's BUILD dir to the scratch space, if one is configured
+        and it has room for this build. rpms are still written straight to
+        the build dir.
+        """
+        if not self.scratch or self.scratch_dir:
+            return
+        try:
+            history = self._get_scratch_history()
+        except OSError:
+            history = None
+        size = estimate_size(history, self.sources)
+        self.scratch_dir = self.scratch.reserve("rpmbuild-%s" %
+            self.project_name, size)
+        if not self.scratch_dir:
+            info_out("Not enough scratch space, building in %s" %
+                self.rpmbuild_builddir)
+            return
+        self.rpmbuild_builddir = os.path.join(self.scratch_dir, "BUILD")
+        mkdir_p(self.rpmbuild_builddir)
+        debug("Building in scratch dir: %s" % self.rpmbuild_builddir)
+
+    def _release_scratch(self):
+        """
+        Record how much scratch space the build used, for the estimate next
+        time, and give it back.
+        """
+        if not self.scratch_dir:
+            return
+        size = tree_size(self.rpmbuild_builddir)
+        if size:
+            try:
+                record_size(self._get_scratch_history(), size)
+            except OSError:
+                pass
+        self.scratch.release(self.scratch_dir, remove=not self.no_cleanup)
+        if self.no_cleanup:
+            warn_out("Leaving rpmbuild BUILD files in: %s" %
+                self.rpmbuild_builddir)
+        self.scratch_dir = None
+        self.rpmbuild_builddir = os.path.join(self.rpmbuild_dir, "BUILD")
+
+    def _rpm_on_worker(self):
+        """
+        Rebuild our srpm on the next idle build worker, and copy the rpms it
+        produces back to where a local build would have written them.
+        """
+        if not getattr(self, 'srpm_location', None):
+            self.srpm()
+
+        cmd = 'rpmbuild {0}'.format(
+            " ".join([
+                '--define "_topdir $PWD"',
+                '--define "_source_filedigest_algorithm md5"',
+                '--define "_binary_filedigest_algorithm md5"',
+                self.rpmbuild_options,
+                self._scl_to_rpmbuild_option(),
+                "--define 'dist {0}'".format(self.dist) if self.dist else "",
+                self._get_verbosity_option(),
+                '--rebuild {0}'.format(os.path.basename(self.srpm_location)),
+            ])
+        )
+
+        def log(line):
+            if not self.quiet:
+                print(line)
+
+        try:
+            rpms = self.workers.run(cmd, [self.srpm_location],
+                ["RPMS/*/*.rpm"], self.rpmbuild_dir, log=log)
+        except (RunCommandException, TitoException):
+            err = sys.exc_info()[1]
+            error_out("Build worker failed: %s" % err)
+
+        # Same <build dir>/<arch>/ layout as rpmbuild's _rpmdir:
+        files_written = [self.srpm_location]
+        for rpm in rpms:
+            arch_dir = os.path.join(self.rpmbuild_basedir,
+                os.path.basename(os.path.dirname(rpm)))
+            mkdir_p(arch_dir)
+            files_written.append(place_file(rpm, arch_dir))
+        self.artifacts.extend(files_written[1:])
+
+        print
+        info_out("Successfully built: %s" % '\n\t- '.join(files_written))
+
     def _scl_to_rpmbuild_option(self):
         """ Returns rpmbuild option which disable or enable SC and print warning if needed """
         return scl_to_rpm_option(self.scl)
@@ -301,40 +538,25 @@ def _auto_install(self):
         If requested, auto install the RPMs we just built.
         """
         if self.auto_install:
-            print
-            print("Auto-installing packages:")
-            print
-
-            dont_install = []
-            if 'NO_AUTO_INSTALL' in self.user_config:
-                dont_install = self.user_config['NO_AUTO_INSTALL'].split(" ")
-                debug("Will not auto-install any packages matching: %s" % dont_install)
-
-            do_install = []
-            for to_inst in self.artifacts:
-                # Only install rpms:
-                if not to_inst.endswith(".rpm") or to_inst.endswith(".src.rpm"):
-                    continue
-
-                install = True
-                for skip in dont_install:
-                    if skip in to_inst:
-                        install = False
-                        print("Skipping: %s" % to_inst)
-                        break
-                if install:
-                    do_install.append(to_inst)
-
-            print
-            reinstall = self.package_manager.is_installed(self.project_name, self.build_version)
-            cmd = self.package_manager.install(do_install, reinstall=reinstall, auto=True, offline=True,
-                                               escalate=self.escalate_privileges)
-            print("%s" % cmd)
-            try:
-                run_command_print(cmd)
-                print
-            except KeyboardInterrupt:
-                pass
+            if self.install_queue:
+                self.install_pending = self.install_queue.add(
+                    self.project_name, self.build_version, self.artifacts,
+                    self._installed)
+                return
+            install_queue = InstallQueue(self.user_config,
+                escalate=self.escalate_privileges)
+            install_queue.add(self.project_name, self.build_version,
+                self.artifacts)
+            install_queue.install()
+
+    def _installed(self, seconds):
+        """
+        Called by the shared install queue once it has installed our rpms,
+        to record the build along with how long the install took.
+        """
+        self.install_pending = False
+        self.timer.add("_auto_install", seconds)
+        self._record_build_times(True)
 
 
 class Builder(ConfigObject, BuilderBase):
@@ -347,6 +569,10 @@ class Builder(ConfigObject, BuilderBase):
     """
     REQUIRED_ARGS = []
 
+    # Whether test builds can be built in place, from the working tree,
+    # rather than from a tarball of it:
+    BUILD_IN_PLACE_SUPPORTED = True
+
     # TODO: drop version
     def __init__(self, name=None, tag=None, build_dir=None,
             config=None, user_config=None,
@@ -383,12 +609,13 @@ def __init__(self, name=None, tag=None, build_dir=None,
 
         if self.config.has_section("requirements"):
             if self.config.has_option("requirements", "tito"):
-                if loose_version(self.config.get("requirements", "tito")) > \
-                        loose_version(require('tito')[0].version):
+                tito_version = get_tito_version()
+                if compare_version(self.config.get("requirements", "tito"),
+                        tito_version) > 0:
                     error_out([
                         "tito version %s or later is needed to build this project." %
                         self.config.get("requirements", "tito"),
-                        "Your version: %s" % require('tito')[0].version
+                        "Your version: %s" % tito_version
                     ])
 
         self.display_version = self._get_display_version()
@@ -429,6 +656,106 @@ def __init__(self, name=None, tag=None, build_dir=None,
         # Set to path to srpm once we build one.
         self.srpm_location = None
 
+        self.build_in_place = self._get_build_in_place(args)
+
+        # Install any missing build dependencies rather than stopping:
+        self.install_build_deps = bool(args) and 'install_build_deps' in args
+
+    def _check_build_deps(self):
+        """
+        Check the spec's BuildRequires are all installed, unless disabled
+        with BUILD_DEPS_CHECK in ~/.titorc. Missing ones are installed in a
+        single transaction if the install_build_deps builder arg was given,
+        otherwise the build stops.
+        """
+        user_config = self.user_config or {}
+        if self.workers or user_config.get('BUILD_DEPS_CHECK', '1') in \
+                ['0', '', 'False', 'false']:
+            return
+        if '--nodeps' in self.rpmbuild_options.split():
+            return
+        spec_file = self._get_build_deps_spec()
+        if not spec_file:
+            return
+        try:
+            cache_dir = get_cache_dir(self.rpmbuild_basedir, "builddeps")
+        except OSError:
+            cache_dir = None
+        try:
+            missing = missing_build_deps([spec_file], rpmbuild_macros(
+                self._get_build_deps_options()), cache_dir)
+        except (TitoException, RunCommandException):
+            # rpmbuild will have its say later:
+            warn_out("Unable to check build dependencies: %s" %
+                sys.exc_info()[1])
+            return
+        if not missing:
+            return
+
+        if not isinstance(self.package_manager, (Dnf, Yum)):
+            error_out("Missing build dependencies: %s" % ", ".join(missing))
+        packages = [quote(dep) for dep in missing]
+        if not self.install_build_deps:
+            error_out(["Missing build dependencies: %s" % ", ".join(missing),
+                "Please run '%s' as root, or build with --arg "
+                "install_build_deps." % self.package_manager.install(packages,
+                    escalate=False)])
+        info_out("Installing missing build dependencies: %s" %
+            ", ".join(missing))
+        run_command_print(self.package_manager.install(packages, auto=True,
+            escalate=self.escalate_privileges))
+
+    def _get_build_deps_options(self):
+        """
+        Return the rpmbuild options which rpm() will define macros with,
+        as they decide any conditional BuildRequires.
+        """
+        options = [self.rpmbuild_options, scl_to_rpm_option(self.scl,
+            silent=True)]
+        if self.dist:
+            options.append("--define 'dist %s'" % self.dist)
+        return " ".join(options)
+
+    def _get_build_deps_spec(self):
+        """
+        Return the path to a copy of the spec file as of the commit being
+        built, or None if there isn't a spec file (i.e. only a template).
+        """
+        spec = find_file_with_extension(self.start_dir, '.spec')
+        if spec is None or self.build_in_place:
+            return spec
+        copy = os.path.join(self.rpmbuild_dir, os.path.basename(spec))
+        with chdir(self.git_root):
+            (status, output) = getstatusoutput("git show %s:%s > %s" % (
+                self.git_commit_id, os.path.normpath(os.path.join(
+                    self.relative_project_dir, os.path.basename(spec))),
+                copy))
+        if status != 0:
+            debug("Checking build dependencies of working copy: %s" % output)
+            return spec
+        return copy
+
+    def _get_build_in_place(self, args):
+        """
+        Check whether the build_in_place builder arg was given and can be
+        honoured here.
+        """
+        if not args or 'build_in_place' not in args:
+            return False
+        if not self.BUILD_IN_PLACE_SUPPORTED:
+            warn_out("%s can not build in place, ignoring build_in_place" %
+                self.__class__.__name__)
+            return False
+        if not self.test:
+            warn_out("build_in_place only applies to --test builds, ignoring")
+            return False
+        (status, output) = getstatusoutput("rpmbuild --help")
+        if '--build-in-place' not in output:
+            warn_out("rpmbuild does not support --build-in-place (rpm 4.15 "
+                "or newer is needed), building from a tarball")
+            return False
+        return True
+
     def _create_build_dirs(self):
         """
         Create the build directories. Can safely be called multiple times.
@@ -494,10 +821,11 @@ def tgz(self):
         Returns full path to the created tarball.
         """
         self._setup_sources()
+        if self.build_in_place:
+            self._create_in_place_tgz()
 
-        run_command("cp %s/%s %s/" %
-                (self.rpmbuild_sourcedir, self.tgz_filename,
-                    self.rpmbuild_basedir))
+        place_file(os.path.join(self.rpmbuild_sourcedir, self.tgz_filename),
+            self.rpmbuild_basedir)
 
         self.ran_tgz = True
         full_path = os.path.join(self.rpmbuild_basedir, self.tgz_filename)
@@ -509,10 +837,15 @@ def tgz(self):
     def rpm(self):
         """ Build an RPM. """
         self._create_build_dirs()
-        if not self.ran_tgz:
+        if self.build_in_place:
+            # No tarball needed, rpmbuild reads the working tree:
+            self._setup_sources()
+        elif not self.ran_tgz:
             self.tgz()
         if self.test:
             self._setup_test_specfile()
+        if self.build_in_place:
+            return self._rpm_in_place()
         BuilderBase.rpm(self)
 
     def _setup_sources(self):
@@ -523,6 +856,8 @@ def _setup_sources(self):
         Created in the temporary rpmbuild SOURCES directory.
         """
         self._create_build_dirs()
+        if self.build_in_place:
+            return self._setup_in_place_sources()
 
         debug("Creating %s from git tag: %s..." % (self.tgz_filename,
             self.git_commit_id))
@@ -562,9 +897,107 @@ def _setup_test_specfile(self):
                 self.tgz_filename,
             )
 
+            self.unmunged_build_version = self.build_version
             self.build_version += ".git." + str(self.commit_count) + "." + str(sha)
             self.ran_setup_test_specfile = True
 
+    def _get_in_place_dir(self):
+        return os.path.normpath(os.path.join(self.git_root,
+            self.relative_project_dir))
+
+    def _setup_in_place_sources(self):
+        """
+        Copy just the spec file from the working tree, for building in place.
+        Nothing else is exported, and the copy is kept (along with any test
+        version munged into it) until refresh_sources replaces it.
+        """
+        if self.spec_file and os.path.exists(self.spec_file):
+            return
+        spec = find_spec_like_file(self._get_in_place_dir())
+        self.spec_file_name = os.path.basename(spec)
+        self.spec_file = os.path.join(self.rpmbuild_gitcopy,
+            self.spec_file_name)
+        debug("Building in place, using spec file: %s" % spec)
+        shutil.copy2(spec, self.spec_file)
+
+    def _create_in_place_tgz(self):
+        """
+        Create the tarball from the working tree's tracked files, rather than
+        the last commit, so an srpm has the sources the rpms were built from.
+        """
+        with chdir(self.git_root):
+            # Prints nothing if there are no local changes:
+            commit = run_command("git stash create").strip() or \
+                self.git_commit_id
+        debug("Creating %s from working tree: %s..." % (self.tgz_filename,
+            commit))
+        create_tgz(self.git_root, self.tgz_dir, commit,
+            self.relative_project_dir,
+            os.path.join(self.rpmbuild_sourcedir, self.tgz_filename))
+
+    def _rpm_in_place(self):
+        """
+        Build binary rpms with rpmbuild --build-in-place, compiling the
+        working tree directly rather than unpacking a tarball of it.
+        """
+        cmd = 'cd {0} && rpmbuild {1}'.format(
+            self._get_in_place_dir(),
+            " ".join([
+                '--define "_binary_filedigest_algorithm md5"',
+                self.rpmbuild_options,
+                self._scl_to_rpmbuild_option(),
+                '--define "_topdir {0}"'.format(self.rpmbuild_dir),
+                '--define "_rpmdir {0}"'.format(self.rpmbuild_basedir),
+                "--define 'dist {0}'".format(self.dist) if self.dist else "",
+                self._get_verbosity_option(),
+                '--build-in-place -bb {0}'.format(self.spec_file),
+            ])
+        )
+        try:
+            if self.quiet:
+                output = run_command(cmd)
+            else:
+                output = run_command_print(cmd)
+        except RunCommandException:
+            error_out('%s' % sys.exc_info()[1])
+        files_written = find_wrote_in_rpmbuild_output(output)
+        self.artifacts.extend(files_written)
+
+        print
+        info_out("Successfully built in place: %s" %
+            '\n\t- '.join(files_written))
+
+    def refresh_sources(self, changed_files):
+        """
+        Apply files changed in the project directory since the sources were
+        set up to the existing rpmbuild_gitcopy, and regenerate the tarball
+        from the cached one rather than re-archiving the whole tree.
+
+        changed_files are relative to the project directory. Used by
+        'tito build --watch'.
+        """
+        spec_changed = False
+        for relative in changed_files:
+            src = os.path.join(self.start_dir, relative)
+            dest = os.path.join(self.rpmbuild_gitcopy, relative)
+            if os.path.isfile(src):
+                mkdir_p(os.path.dirname(dest))
+                shutil.copy2(src, dest)
+            elif os.path.isfile(dest):
+                os.remove(dest)
+            if dest == self.spec_file:
+                spec_changed = True
+
+        tgz = os.path.join(self.rpmbuild_sourcedir, self.tgz_filename)
+        if os.path.exists(tgz):
+            debug("Updating %s with: %s" % (self.tgz_filename, changed_files))
+            update_tgz(self.start_dir, self.tgz_dir, changed_files, tgz)
+
+        # A fresh copy of the spec needs the test version munged in again:
+        if spec_changed and self.ran_setup_test_specfile:
+            self.build_version = self.unmunged_build_version
+            self.ran_setup_test_specfile = False
+
     def _get_rpmbuild_dir_options(self):
         return ('--define "_topdir %s" --define "_sourcedir %s" --define "_builddir %s" --define '
             '"_srcrpmdir %s" --define "_rpmdir %s" ' % (
@@ -603,6 +1036,7 @@ class NoTgzBuilder(Builder):
     Builder for packages that do not require the creation of a tarball.
     Usually these packages have source tarballs checked directly into git.
     """
+    BUILD_IN_PLACE_SUPPORTED = False
 
     def tgz(self):
         """ Override parent behavior, we already have a tgz. """
@@ -611,11 +1045,19 @@ def tgz(self):
         self._setup_sources()
         self.ran_tgz = True
 
+        # A list, which later stages (and subclasses) may go through again:
+        self.sources = [os.path.join(self.rpmbuild_gitcopy, x)
+            for x in self._list_spec_sources()]
+        debug("  Sources: %s" % self.sources)
+
+    def _list_spec_sources(self):
+        """
+        Return the file names of the Source and Patch lines in the spec file,
+        with any macros expanded.
+        """
         debug("Scanning for sources.")
         cmd = "/usr/bin/spectool --list-files '%s' | awk '{print $2}' |xargs -l1 --no-run-if-empty basename " % self.spec_file
-        result = run_command(cmd)
-        self.sources = map(lambda x: os.path.join(self.rpmbuild_gitcopy, x), result.split("\n"))
-        debug("  Sources: %s" % self.sources)
+        return run_command(cmd).split("\n")
 
     def _get_rpmbuild_dir_options(self):
         """
@@ -631,9 +1073,13 @@ def _get_rpmbuild_dir_options(self):
                 self.rpmbuild_gitcopy, self.rpmbuild_builddir,
                 self.rpmbuild_basedir, self.rpmbuild_basedir))
 
+    def _get_srpm_sourcedir(self):
+        """ Override parent behavior, sources live in the git copy. """
+        return self.rpmbuild_gitcopy
+
     def _setup_test_specfile(self):
         """ Override parent behavior. """
-        if self.test:
+        if self.test and not self.ran_setup_test_specfile:
             # If making a test rpm we need to get a little crazy with the spec
             # file we're building off. (note that this is a temp copy of the
             # spec) Swap out the actual release for one that includes the git
@@ -644,6 +1090,7 @@ def _setup_test_specfile(self):
                 self.git_commit_id[:7],
                 self.commit_count
             )
+            self.ran_setup_test_specfile = True
 
 
 class GemBuilder(NoTgzBuilder):
@@ -834,24 +1281,34 @@ def patch_upstream(self):
                     self.relative_project_dir)
         os.chdir(patch_dir)
         debug("patch dir = %s" % patch_dir)
-        print("Generating patch [%s]" % patch_filename)
-        debug("Patch: %s" % patch_file)
-        patch_command = "git diff --relative %s..%s > %s" % \
-                (self.upstream_tag, self.git_commit_id,
-                        patch_file)
-        debug("Generating patch with: %s" % patch_command)
-        output = run_command(patch_command)
-        print(output)
-        (status, output) = getstatusoutput(
-            "grep 'Binary files .* differ' %s " % patch_file)
-        if status == 0 and output != "":
-            error_out("You are doomed. Diff contains binary files. You can not use this builder")
+
+        cache_dir = get_cache_dir(self.rpmbuild_basedir, "patches")
+        cache_key = self._get_patch_cache_key()
+        cached = cached_file(cache_dir, cache_key)
+        if cached:
+            print("Using cached patch [%s]" % patch_filename)
+            self.timer.cache_hit("patches")
+            place_file(cached, patch_file)
+        else:
+            if self._has_binary_changes(self.upstream_tag, self.git_commit_id):
+                error_out("You are doomed. Diff contains binary files. You can not use this builder")
+
+            print("Generating patch [%s]" % patch_filename)
+            debug("Patch: %s" % patch_file)
+            patch_command = "git diff --relative %s..%s > %s" % \
+                    (self.upstream_tag, self.git_commit_id,
+                            patch_file)
+            debug("Generating patch with: %s" % patch_command)
+            output = run_command(patch_command)
+            print(output)
+            store_file(cache_dir, cache_key, patch_file)
+            prune_cache(cache_dir, DEFAULT_PATCH_CACHE_SIZE * 1024 * 1024)
 
         # Creating two copies of the patch here in the temp build directories
         # just out of laziness. Some builders need sources in SOURCES and
         # others need them in the git copy. Being lazy here avoids one-off
         # hacks and both copies get cleaned up anyhow.
-        run_command("cp %s %s" % (patch_file, self.rpmbuild_sourcedir))
+        place_file(patch_file, self.rpmbuild_sourcedir)
 
         (patch_number, patch_insert_index, patch_apply_index, lines) = self._patch_upstream()
 
@@ -861,6 +1318,32 @@ def patch_upstream(self):
             lines.insert(patch_apply_index, "%%patch%s -p1\n" % (patch_number))
         self._write_spec(lines)
 
+    def _get_patch_cache_key(self, *extra):
+        """
+        Return the key identifying the patches from the upstream tag to the
+        commit being built (plus anything else they depend on) in the patch
+        cache. Must be run from within the git repo.
+        """
+        (upstream_commit, build_commit) = run_command(
+            "git rev-parse %s^{commit} %s^{commit}" % (self.upstream_tag,
+                self.git_commit_id)).split()
+        return digest(self.__class__.__name__, upstream_commit, build_commit,
+            self.relative_project_dir, *extra)
+
+    def _has_binary_changes(self, from_ref, to_ref):
+        """
+        Return True if any file in the project dir changed in a way git can
+        only show as a binary diff between the given refs.
+        """
+        # Binary files are listed with "-" for lines added and removed:
+        output = run_command("git diff --numstat --relative %s..%s" %
+            (from_ref, to_ref))
+        for line in output.splitlines():
+            if line.startswith("-\t-\t"):
+                debug("Binary change: %s" % line[4:])
+                return True
+        return False
+
     def _write_spec(self, lines):
         """ Write 'lines' to self.spec_file """
         # Now write out the modified lines to the spec file copy:
@@ -912,6 +1395,8 @@ class SatelliteBuilder(UpstreamBuilder):
 
 
 class MeadBuilder(Builder):
+    BUILD_IN_PLACE_SUPPORTED = False
+
     def __init__(self, name=None, tag=None, build_dir=None,
         config=None, user_config=None, args=None, **kwargs):
 
@@ -938,6 +1423,109 @@ def __init__(self, name=None, tag=None, build_dir=None,
         if 'maven_arg' in args:
             self.maven_args.extend(args['maven_arg'])
 
+        # How to get a copy of the source at the commit being built for
+        # Maven: a git worktree (the default), a clone sharing this repo's
+        # objects, or a full independent clone.
+        self.checkout = 'worktree'
+        if 'checkout' in args:
+            self.checkout = args['checkout'][0]
+        if self.checkout not in CHECKOUT_STRATEGIES:
+            raise TitoException("Unknown checkout strategy '%s', use one of: %s" %
+                (self.checkout, ", ".join(CHECKOUT_STRATEGIES)))
+        self.ran_worktree = False
+
+        # Unless the user opted out, or picked their own local repository,
+        # Maven resolves dependencies into a repository kept in the build dir
+        # between builds, and the artifacts it deploys for a given commit and
+        # settings are kept for reuse:
+        user_config = user_config or {}
+        self.maven_repo = None
+        self.deploy_cache = None
+        self.deploy_cached = False
+        if user_config.get('MAVEN_CACHE', '1') not in ['0', '', 'False', 'false']:
+            self.deploy_cache = get_cache_dir(self.rpmbuild_basedir, "maven", "deploy")
+            if not [p for p in self.maven_properties if p.startswith("maven.repo.local=")]:
+                self.maven_repo = get_cache_dir(self.rpmbuild_basedir, "maven", "repository")
+        try:
+            self.maven_cache_size = int(user_config.get('MAVEN_CACHE_SIZE',
+                DEFAULT_MAVEN_CACHE_SIZE)) * 1024 * 1024
+        except ValueError:
+            raise TitoException("Invalid MAVEN_CACHE_SIZE in ~/.titorc: %s" %
+                user_config['MAVEN_CACHE_SIZE'])
+
+    def _deploy_key(self):
+        return digest(self.git_commit_id, self.maven_properties, self.maven_args)
+
+    def _use_cached_deploy(self):
+        """
+        Switch to the artifacts deployed by an earlier build of this commit
+        with the same Maven settings, if there are any.
+        """
+        if not self.deploy_cache:
+            return False
+        cached = os.path.join(self.deploy_cache, self._deploy_key())
+        if not os.path.isdir(cached):
+            return False
+        info_out("Using Maven artifacts previously deployed from %s" %
+            self.git_commit_id[:7])
+        os.utime(cached, None)
+        remove_tree(self.deploy_dir)
+        self.deploy_dir = cached
+        self.deploy_cached = True
+        self.timer.cache_hit("maven")
+        return True
+
+    def _cache_deploy(self):
+        """
+        Keep the artifacts Maven just deployed for later builds, and prune
+        the Maven caches.
+        """
+        if not self.deploy_cache:
+            return
+        prune_cache(self.deploy_cache, self.maven_cache_size)
+        if self.maven_repo:
+            prune_tree(self.maven_repo, self.maven_cache_size)
+
+        cached = os.path.join(self.deploy_cache, self._deploy_key())
+        try:
+            os.rename(self.deploy_dir, cached)
+        except OSError:
+            # Most likely a concurrent build of the same commit got there first:
+            debug("Unable to cache Maven artifacts in: %s" % cached)
+            return
+        self.deploy_dir = cached
+        self.deploy_cached = True
+
+    def _checkout_source(self):
+        """
+        Check out the commit being built for Maven using the configured
+        strategy, returning the path to the checkout.
+        """
+        git_root = find_git_root()
+        if self.checkout == 'clone':
+            run_command("git clone --no-hardlinks %s %s" % (git_root, self.maven_clone_dir))
+            with chdir(self.maven_clone_dir):
+                run_command("git checkout %s" % self.git_commit_id)
+            return self.maven_clone_dir
+
+        checkout_dir = os.path.join(self.maven_clone_dir, self.project_name)
+        if self.checkout == 'worktree':
+            try:
+                with chdir(git_root):
+                    run_command("git worktree add --detach %s %s" %
+                        (checkout_dir, self.git_commit_id))
+                self.ran_worktree = True
+                return checkout_dir
+            except RunCommandException:
+                # i.e. git older than 2.5:
+                warn_out("Unable to create a git worktree, using a shared clone instead.")
+
+        # Borrow this repo's objects rather than copying them:
+        run_command("git clone --shared --no-checkout %s %s" % (git_root, checkout_dir))
+        with chdir(checkout_dir):
+            run_command("git checkout -q %s" % self.git_commit_id)
+        return checkout_dir
+
     def _find_tarball(self):
         for directory, unused, filenames in os.walk(self.deploy_dir):
             for f in filenames:
@@ -950,38 +1538,49 @@ def cleanup(self):
         """
         Remove all temporary files and directories.
         """
+        self._release_scratch()
         if not self.no_cleanup:
             for d in [self.rpmbuild_dir, self.deploy_dir, self.maven_clone_dir]:
+                if d == self.deploy_dir and self.deploy_cached:
+                    continue
                 debug("Cleaning up %s" % d)
-                shutil.rmtree(d)
+                remove_tree(d, self.trash_dir)
+            if self.ran_worktree:
+                # Forget the worktree now that its directory is gone:
+                with chdir(self.git_root):
+                    run_command("git worktree prune")
         else:
             warn_out("Leaving rpmbuild files in: %s" % self.rpmbuild_dir)
 
     def tgz(self):
         destination_file = os.path.join(self.rpmbuild_basedir, self.tgz_filename)
         formatted_properties = ["-D%s" % x for x in self.maven_properties]
-
-        run_command("git clone --no-hardlinks %s %s" % (find_git_root(), self.maven_clone_dir))
-        with chdir(self.maven_clone_dir):
-            run_command("git checkout %s" % self.git_commit_id)
-
-            try:
-                info_out("Running Maven build...")
-                # We always want to deploy to a tito controlled location during local builds
-                local_properties = formatted_properties + [
-                    "-DaltDeploymentRepository=local-output::default::file://%s" % self.deploy_dir]
-                run_command("mvn %s %s deploy" % (
-                    " ".join(self.maven_args),
-                    " ".join(local_properties)))
-            except RunCommandException as e:
-                error_out("Maven build failed! %s" % e.output)
+        if self.maven_repo:
+            formatted_properties.append("-Dmaven.repo.local=%s" % self.maven_repo)
+
+        if not self._use_cached_deploy():
+            with chdir(self._checkout_source()):
+                try:
+                    info_out("Running Maven build...")
+                    # We always want to deploy to a tito controlled location during local builds
+                    local_properties = formatted_properties + [
+                        "-DaltDeploymentRepository=local-output::default::file://%s" % self.deploy_dir]
+                    with self.timer.stage("maven"):
+                        run_command("mvn %s %s deploy" % (
+                            " ".join(self.maven_args),
+                            " ".join(local_properties)))
+                except RunCommandException as e:
+                    error_out("Maven build failed! %s" % e.output)
+            self._cache_deploy()
 
         self._create_build_dirs()
 
         full_path = self._find_tarball()
         if full_path:
             fh = gzip.open(full_path, 'rb')
-            fixed_tar = os.path.join(os.path.splitext(full_path)[0])
+            # Write outside the deploy dir, which may be cached:
+            fixed_tar = os.path.join(self.rpmbuild_sourcedir,
+                os.path.basename(os.path.splitext(full_path)[0]))
             fixed_tar_fh = open(fixed_tar, 'wb')
             timestamp = get_commit_timestamp(self.git_commit_id)
             try:
@@ -1020,7 +1619,7 @@ def tgz(self):
 
                 # Place the Maven artifacts in the SOURCES directory for rpmbuild to use
                 for artifact in dir_artifacts_with_path:
-                    shutil.copy(artifact, self.rpmbuild_sourcedir)
+                    place_file(artifact, self.rpmbuild_sourcedir)
 
                 dir_artifacts_with_path = map(lambda x: os.path.relpath(x, self.deploy_dir), dir_artifacts_with_path)
                 all_artifacts_with_path.extend(dir_artifacts_with_path)
@@ -1069,6 +1668,7 @@ class MockBuilder(Builder):
     OS version than you may be currently using.
     """
     REQUIRED_ARGS = ['mock']
+    BUILD_IN_PLACE_SUPPORTED = False
 
     def __init__(self, name=None, tag=None, build_dir=None,
             config=None, user_config=None,
@@ -1084,7 +1684,18 @@ def __init__(self, name=None, tag=None, build_dir=None,
                 user_config=user_config,
                 args=args, **kwargs)
 
-        self.mock_tag = args['mock'][0]
+        # One or more mock configs to build in, i.e. --arg mock=a --arg mock=b
+        # or builder.mock = a b in releasers.conf:
+        self.mock_tags = []
+        for mock_arg in args['mock']:
+            self.mock_tags.extend(mock_arg.split())
+        self.mock_tag = self.mock_tags[0]
+
+        # How many mock chroots may build at once, defaults to one per CPU:
+        self.mock_jobs = None
+        if 'mock_jobs' in args:
+            self.mock_jobs = int(args['mock_jobs'][0])
+
         self.mock_cmd_args = ""
         if 'mock_config_dir' in args:
             mock_config_dir = args['mock_config_dir'][0]
@@ -1103,9 +1714,38 @@ def __init__(self, name=None, tag=None, build_dir=None,
             self.mock_cmd_args = "%s --no-clean --no-cleanup-after" % \
                     (self.mock_cmd_args)
 
+        # Optional control over mock's caches, i.e. mock_root_cache=0 or
+        # mock_bootstrap_image=registry.fedoraproject.org/fedora:rawhide
+        for arg, plugin in [('mock_root_cache', 'root_cache'),
+                ('mock_package_cache', 'yum_cache')]:
+            if arg in args:
+                if self._is_enabled(args[arg][0]):
+                    self.mock_cmd_args = "%s --enable-plugin=%s" % \
+                        (self.mock_cmd_args, plugin)
+                else:
+                    self.mock_cmd_args = "%s --disable-plugin=%s" % \
+                        (self.mock_cmd_args, plugin)
+        if 'mock_bootstrap_image' in args:
+            image = args['mock_bootstrap_image'][0]
+            if not self._is_enabled(image):
+                self.mock_cmd_args = "%s --no-bootstrap-image" % \
+                    self.mock_cmd_args
+            elif image in ['1', 'true', 'yes', 'on']:
+                self.mock_cmd_args = "%s --use-bootstrap-image" % \
+                    self.mock_cmd_args
+            else:
+                self.mock_cmd_args = "%s --use-bootstrap-image " \
+                    "--bootstrap-image=%s" % (self.mock_cmd_args, image)
+
         if 'mock_args' in args:
             self.mock_cmd_args = "%s %s" % (self.mock_cmd_args, args['mock_args'][0])
 
+        # Optional argument to build with a single mock --rebuild, writing
+        # results straight to a --resultdir, rather than separate --init,
+        # dependency install, --rebuild and --copyout runs:
+        self.single_run = 'mock_single_run' in args and \
+            self._is_enabled(args['mock_single_run'][0])
+
         # TODO: error out if mock package is not installed
 
         # TODO: error out if user does not have mock group
@@ -1118,6 +1758,8 @@ def srpm(self, dist=None):
         internally just so we can generate a SRPM correctly before we pass it
         into mock.
         """
+        # Count any cache hits building the srpm towards our timings:
+        self.normal_builder.timer = self.timer
         self.normal_builder.srpm(dist)
         self.srpm_location = self.normal_builder.srpm_location
         self.artifacts.append(self.srpm_location)
@@ -1129,44 +1771,140 @@ def rpm(self):
         """
 
         print("Creating rpms for %s-%s in mock: %s" % (
-            self.project_name, self.display_version, self.mock_tag))
+            self.project_name, self.display_version, " ".join(self.mock_tags)))
         if not self.srpm_location:
             self.srpm()
         print("Using srpm: %s" % self.srpm_location)
-        self._build_in_mock()
+
+        if len(self.mock_tags) == 1:
+            with self.timer.stage("mock:%s" % self.mock_tag):
+                self._build_in_mock(self.mock_tag, self.rpmbuild_basedir)
+            return
+
+        # Each chroot gets its own output directory, and unless we're reusing
+        # existing roots (speedup) a unique root so concurrent builds with
+        # the same config never collide:
+        uniqueext = None
+        if not self.speedup:
+            uniqueext = "tito%s" % os.getpid()
+
+        def build(mock_tag):
+            with self.timer.stage("mock:%s" % mock_tag):
+                return self._build_in_mock(mock_tag,
+                    os.path.join(self.rpmbuild_basedir,
+                    self._mock_dir_name(mock_tag)), uniqueext)
+
+        for mock_tag, files in run_parallel(build, self.mock_tags,
+                self.mock_jobs):
+            info_out("Finished building in mock: %s" % mock_tag)
 
     def cleanup(self):
         if self.normal_builder:
             self.normal_builder.cleanup()
 
-    def _build_in_mock(self):
+    def _check_build_deps(self):
+        """ Override parent behavior, mock installs them in the chroot. """
+        pass
+
+    def _is_enabled(self, value):
+        return value.lower() not in ['0', 'false', 'no', 'off']
+
+    def _mock_dir_name(self, mock_tag):
+        """
+        Name for directories of a mock config, which may be given as a path
+        to a .cfg file rather than a config name.
+        """
+        name = os.path.basename(mock_tag)
+        if name.endswith(".cfg"):
+            name = name[:-len(".cfg")]
+        return name
+
+    def _build_in_mock(self, mock_tag, output_dir, uniqueext=None):
+        """
+        Build our srpm in the given mock config, copying the resulting rpms
+        to output_dir. Returns the paths to the rpms.
+        """
+        mock_cmd_args = self.mock_cmd_args
+        if uniqueext:
+            mock_cmd_args = "%s --uniqueext=%s" % (mock_cmd_args, uniqueext)
+
+        # Workers only ever see the srpm, so build with a single mock run:
+        if self.single_run or self.workers:
+            return self._rebuild_in_mock(mock_cmd_args, mock_tag, output_dir)
+
         if not self.speedup:
-            print("Initializing mock...")
-            run_command("mock %s -r %s --init" % (self.mock_cmd_args, self.mock_tag))
+            print("Initializing mock: %s" % mock_tag)
+            run_command("mock %s -r %s --init" % (mock_cmd_args, mock_tag))
         else:
             print("Skipping mock --init due to speedup option.")
 
-        print("Installing deps in mock...")
+        print("Installing deps in mock: %s" % mock_tag)
         run_command("mock %s -r %s %s" % (
-            self.mock_cmd_args, self.mock_tag, self.srpm_location))
-        print("Building RPMs in mock...")
+            mock_cmd_args, mock_tag, self.srpm_location))
+        print("Building RPMs in mock: %s" % mock_tag)
         run_command('mock %s -r %s --rebuild %s' %
-                (self.mock_cmd_args, self.mock_tag, self.srpm_location))
-        mock_output_dir = os.path.join(self.rpmbuild_dir, "mockoutput")
+                (mock_cmd_args, mock_tag, self.srpm_location))
+        mock_output_dir = os.path.join(self.rpmbuild_dir,
+            "mockoutput-%s" % self._mock_dir_name(mock_tag))
         run_command("mock %s -r %s --copyout /builddir/build/RPMS/ %s" %
-                (self.mock_cmd_args, self.mock_tag, mock_output_dir))
+                (mock_cmd_args, mock_tag, mock_output_dir))
+        if uniqueext:
+            run_command("mock %s -r %s --clean" % (mock_cmd_args, mock_tag))
 
         # Copy everything mock wrote out to /tmp/tito:
-        files = os.listdir(mock_output_dir)
-        run_command("cp -v %s/*.rpm %s" %
-                (mock_output_dir, self.rpmbuild_basedir))
+        mkdir_p(output_dir)
+        rpm_paths = []
+        for rpm in sorted(os.listdir(mock_output_dir)):
+            if rpm.endswith(".rpm"):
+                rpm_paths.append(place_file(
+                    os.path.join(mock_output_dir, rpm), output_dir))
         print
         info_out("Wrote:")
-        for rpm in files:
-            rpm_path = os.path.join(self.rpmbuild_basedir, rpm)
+        for rpm_path in rpm_paths:
             print("  %s" % rpm_path)
             self.artifacts.append(rpm_path)
         print
+        return rpm_paths
+
+    def _rebuild_in_mock(self, mock_cmd_args, mock_tag, output_dir):
+        """
+        Build our srpm with a single mock invocation, which initializes the
+        chroot and installs dependencies itself, then link the resulting
+        rpms into output_dir.
+        """
+        result_name = "mockresult-%s" % self._mock_dir_name(mock_tag)
+        result_dir = os.path.join(self.rpmbuild_dir, result_name)
+        print("Building RPMs in mock: %s" % mock_tag)
+        if self.workers:
+            try:
+                self.workers.run("mock %s -r %s --rebuild %s --resultdir=%s" % (
+                    mock_cmd_args, mock_tag,
+                    os.path.basename(self.srpm_location),
+                    os.path.join("$PWD", result_name)), [self.srpm_location],
+                    [os.path.join(result_name, "*")], self.rpmbuild_dir,
+                    log=debug)
+            except (RunCommandException, TitoException):
+                err = sys.exc_info()[1]
+                error_out("Build worker failed: %s" % err)
+        else:
+            run_command("mock %s -r %s --rebuild %s --resultdir=%s" % (
+                mock_cmd_args, mock_tag, self.srpm_location, result_dir))
+
+        mkdir_p(output_dir)
+        rpm_paths = []
+        for rpm in sorted(os.listdir(result_dir)):
+            if not rpm.endswith(".rpm") or rpm.endswith(".src.rpm"):
+                continue
+            rpm_paths.append(place_file(os.path.join(result_dir, rpm),
+                output_dir))
+
+        print
+        info_out("Wrote:")
+        for rpm_path in rpm_paths:
+            print("  %s" % rpm_path)
+            self.artifacts.append(rpm_path)
+        print
+        return rpm_paths
 
 
 class BrewDownloadBuilder(Builder):
@@ -1176,6 +1914,7 @@ class BrewDownloadBuilder(Builder):
     generating yum repositories during a release.
     """
     REQUIRED_ARGS = ['disttag']
+    BUILD_IN_PLACE_SUPPORTED = False
 
     def __init__(self, name=None, tag=None, build_dir=None,
             config=None, user_config=None,
@@ -1188,6 +1927,10 @@ def __init__(self, name=None, tag=None, build_dir=None,
 
         self.dist_tag = args['disttag'][0]
 
+    def _check_build_deps(self):
+        """ Override parent behavior, nothing is built here. """
+        pass
+
     def rpm(self):
         """
         Uses the SRPM
@@ -1209,15 +1952,14 @@ def _fetch_from_brew(self):
 
         # Copy everything brew downloaded out to /tmp/tito:
         files = os.listdir(self.rpmbuild_dir)
-        run_command("cp -v %s/*.rpm %s" %
-                (self.rpmbuild_dir, self.rpmbuild_basedir))
         print
         info_out("Wrote:")
         for rpm in files:
             # Just incase anything slips into the build dir:
             if not rpm.endswith(".rpm"):
                 continue
-            rpm_path = os.path.join(self.rpmbuild_basedir, rpm)
+            rpm_path = place_file(os.path.join(self.rpmbuild_dir, rpm),
+                self.rpmbuild_basedir)
             print("  %s" % rpm_path)
             self.artifacts.append(rpm_path)
         print
@@ -1227,10 +1969,24 @@ class GitAnnexBuilder(NoTgzBuilder):
     """
     Builder for packages with existing tarballs checked in using git-annex,
     e.g. referencing an external source (web remote).  This builder will
-    "unlock" the source files to get the real contents, include them in the
-    SRPM, then restore the automatic git-annex symlinks on completion.
+    "get" the annexed files the spec file uses as sources, and link their
+    content from the annex into the SRPM without touching the working tree.
     """
 
+    def __init__(self, name=None, tag=None, build_dir=None,
+            config=None, user_config=None,
+            args=None, **kwargs):
+
+        NoTgzBuilder.__init__(self, name=name, tag=tag,
+                build_dir=build_dir, config=config,
+                user_config=user_config,
+                args=args, **kwargs)
+
+        # Number of files git-annex fetches at once, default is one per CPU:
+        self.annex_jobs = None
+        if args and 'annex_jobs' in args:
+            self.annex_jobs = int(args['annex_jobs'][0])
+
     def _setup_sources(self):
         super(GitAnnexBuilder, self)._setup_sources()
 
@@ -1243,50 +1999,164 @@ def _setup_sources(self):
             msg = "Please run '%s' as root." % self.package_manager.install(["git-annex"])
             error_out('%s' % msg)
 
-        run_command("git-annex lock")
-        annexed_files = run_command("git-annex find --include='*'").splitlines()
-        run_command("git-annex get")
-        run_command("git-annex unlock")
+        # Only the annexed files rpmbuild will actually read are needed. The
+        # spec names its sources, which may be annexed in a subdirectory:
+        sources = set(self._list_spec_sources())
+        annexed_files = [annex for annex in
+            run_command("git-annex find --include='*'").splitlines()
+            if os.path.basename(annex) in sources]
         debug("  Annex files: %s" % annexed_files)
 
+        if annexed_files:
+            run_command("git-annex get %s-- %s" % (self._get_jobs_option(),
+                " ".join(["'%s'" % annex for annex in annexed_files])))
+
         for annex in annexed_files:
-            debug("Copying unlocked file %s" % annex)
-            os.remove(os.path.join(self.rpmbuild_gitcopy, annex))
-            shutil.copy(annex, self.rpmbuild_gitcopy)
+            # A locked file is a symlink to its content in the annex, which
+            # can be linked in directly rather than unlocking the file. The
+            # gitcopy is rpmbuild's _sourcedir, so it goes at the top:
+            debug("Linking annexed file %s" % annex)
+            place_file(os.path.realpath(annex),
+                os.path.join(self.rpmbuild_gitcopy, os.path.basename(annex)))
+            stale_link = os.path.join(self.rpmbuild_gitcopy, annex)
+            if os.path.dirname(annex) and os.path.lexists(stale_link):
+                os.remove(stale_link)
 
-        self._lock()
         os.chdir(self.old_cwd)
 
     def cleanup(self):
         if hasattr(self, 'old_cwd'):
             os.chdir(self.old_cwd)
-        self._lock()
         super(GitAnnexBuilder, self).cleanup()
 
-    def _lock(self):
-        if self._lock_force_supported(self._get_annex_version()):
-            run_command("git-annex lock --force")
-        else:
-            run_command("git-annex lock")
+    def _get_jobs_option(self):
+        if not self._jobs_supported(self._get_annex_version()):
+            return ""
+        return "-J%s " % (self.annex_jobs or cpu_count())
 
     def _get_annex_version(self):
-        # git-annex needs to support --force when locking files.
         ga_version = run_command('git-annex version').split('\n')
         if ga_version[0].startswith('git-annex version'):
             return ga_version[0].split()[-1]
         else:
             return 0
 
-    def _lock_force_supported(self, version):
-        return compare_version(version, '5.20131213') >= 0
+    def _jobs_supported(self, version):
+        # git-annex needs to support --jobs when getting files.
+        return compare_version(version, '5.20151208') >= 0
+
+
+class InstallQueue(object):
+    """
+    Collects the binary rpms built by each builder in a run, to install them
+    all at the end with a single query of which are already installed and
+    a single package manager transaction.
+    """
+
+    def __init__(self, user_config=None, escalate=True):
+        self.escalate = escalate
+        self.dont_install = (user_config or {}).get('NO_AUTO_INSTALL',
+            '').split()
+        if self.dont_install:
+            debug("Will not auto-install any packages matching: %s" %
+                self.dont_install)
+
+        # (package name, version-release, rpm paths) of each build:
+        self.builds = []
+        # Called with how long install took, once it's done:
+        self.callbacks = []
+
+    def add(self, package, version, artifacts, on_install=None):
+        """
+        Queue the binary rpms among the artifacts of a build of the given
+        package version, returning whether there were any. on_install, if
+        given, is called with the seconds the install took.
+        """
+        rpms = []
+        for path in artifacts:
+            if not path.endswith(".rpm") or path.endswith(".src.rpm"):
+                continue
+            skip = [s for s in self.dont_install if s in path]
+            if skip:
+                print("Skipping: %s" % path)
+                continue
+            rpms.append(path)
+        if not rpms:
+            return False
+        self.builds.append((package, version, rpms))
+        if on_install:
+            self.callbacks.append(on_install)
+        return True
+
+    def install(self):
+        """
+        Install everything queued so far. Packages already installed at the
+        version built are reinstalled, which dnf and yum need a separate
+        transaction for.
+        """
+        if not self.builds:
+            return
+        builds, self.builds = self.builds, []
+        callbacks, self.callbacks = self.callbacks, []
+        start = time.time()
+        try:
+            self._install(builds)
+        finally:
+            for callback in callbacks:
+                callback(time.time() - start)
+
+    def _install(self, builds):
+        manager = package_manager()
+        installed = manager.installed_versions([b[0] for b in builds])
+
+        install = []
+        reinstall = []
+        for package, version, rpms in builds:
+            if same_version(installed.get(package), version):
+                reinstall.extend(rpms)
+            else:
+                install.extend(rpms)
+
+        print
+        print("Auto-installing packages:")
+        print
+        for rpms, is_reinstall in [(install, False), (reinstall, True)]:
+            if not rpms:
+                continue
+            cmd = manager.install(rpms, reinstall=is_reinstall, auto=True,
+                offline=True, escalate=self.escalate)
+            print("%s" % cmd)
+            try:
+                run_command_print(cmd)
+                print
+            except KeyboardInterrupt:
+                pass
+
+
+def same_version(installed, version):
+    """
+    Check whether the installed version-release, including its dist tag,
+    is the version-release we built.
+    """
+    if not installed:
+        return False
+    return version == ".".join(installed.split(".")[:-1])
+
+
+# The package manager to use, looked for just once:
+_package_manager = None
 
 
 def package_manager():
-    if os.path.isfile("/usr/bin/dnf"):
-        return Dnf()
-    if os.path.isfile("/usr/bin/yum"):
-        return Yum()
-    return Rpm()
+    global _package_manager
+    if _package_manager is None:
+        if os.path.isfile("/usr/bin/dnf"):
+            _package_manager = Dnf()
+        elif os.path.isfile("/usr/bin/yum"):
+            _package_manager = Yum()
+        else:
+            _package_manager = Rpm()
+    return _package_manager
 
 
 class Rpm(object):
@@ -1298,15 +2168,50 @@ def builddep(self, spec):
         raise NotImplementedError
 
     def is_installed(self, package, version):
-        q = self.query(package)
-        if not q:
-            return False
+        return same_version(self.installed_versions([package]).get(package),
+            version)
 
-        iv = "%s-%s" % (q.version.decode("utf-8"), q.release.decode("utf-8"))
-        iv_short = ".".join(iv.split(".")[:-1])
-        return version == iv_short
+    def installed_versions(self, packages):
+        """
+        Return a dict of the installed version-release of each of the given
+        packages which is installed.
+        """
+        try:
+            import rpm
+        except ImportError:
+            return self._query_installed_versions(packages)
+
+        def text(value):
+            if isinstance(value, bytes):
+                return value.decode("utf-8")
+            return value
+
+        versions = {}
+        ts = rpm.TransactionSet()
+        for package in packages:
+            for header in ts.dbMatch("name", package):
+                versions[package] = "%s-%s" % (text(header['version']),
+                    text(header['release']))
+        return versions
+
+    def _query_installed_versions(self, packages):
+        """
+        installed_versions without the rpm Python bindings, using a single
+        rpm -q for every package.
+        """
+        (status, output) = getstatusoutput(
+            "rpm -q --queryformat '%%{NAME} %%{VERSION}-%%{RELEASE}\\n' %s" %
+            " ".join(packages))
+        versions = {}
+        for line in output.splitlines():
+            tokens = line.split()
+            # Packages which aren't installed are reported, and skipped:
+            if len(tokens) == 2 and tokens[0] in packages:
+                versions[tokens[0]] = tokens[1]
+        return versions
 
     def query(self, package):
+        import rpm
         ts = rpm.TransactionSet()
         results = list(ts.dbMatch("name", package))
         return results[0] if results else None
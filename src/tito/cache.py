@@ -0,0 +1,270 @@
+# Copyright (c) 2008-2011 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+"""
+Helpers for the caches tito keeps between runs, all of which live in a
+.cache directory inside the build dir.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+from tito.common import debug, mkdir_p, place_file
+from tito.compat import RawConfigParser
+
+CACHE_DIRNAME = ".cache"
+
+
+def get_cache_dir(build_dir, *names):
+    """
+    Return (creating if necessary) the path to the named cache inside the
+    given build dir.
+    """
+    path = os.path.join(build_dir, CACHE_DIRNAME, *names)
+    mkdir_p(path)
+    return path
+
+
+def digest(*parts):
+    """
+    Return a hex digest identifying the given parts, which are converted to
+    strings.
+    """
+    hasher = hashlib.sha256()
+    for part in parts:
+        hasher.update(str(part).encode('utf-8'))
+        hasher.update(b'\0')
+    return hasher.hexdigest()
+
+
+def file_digest(path, algorithm='sha256'):
+    """
+    Return the hex digest of the contents of the given file.
+    """
+    hasher = hashlib.new(algorithm)
+    f = open(path, 'rb')
+    try:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            hasher.update(chunk)
+    finally:
+        f.close()
+    return hasher.hexdigest()
+
+
+def read_json(path):
+    """
+    Return the data stored in a json file written by write_json, or None if
+    it does not exist or can't be read.
+    """
+    try:
+        f = open(path)
+        try:
+            return json.load(f)
+        finally:
+            f.close()
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def write_json(path, data):
+    """
+    Atomically replace the given file with the json representation of data,
+    so concurrent tito runs never see a partially written file.
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path),
+        prefix=".%s." % os.path.basename(path))
+    try:
+        f = os.fdopen(fd, 'w')
+        try:
+            json.dump(data, f)
+        finally:
+            f.close()
+        os.rename(tmp, path)
+    except (IOError, OSError):
+        debug("Unable to write cache file: %s" % path)
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def snapshot_config(config):
+    """
+    Return the contents of a RawConfigParser as plain data suitable for
+    write_json.
+    """
+    defaults = config.defaults()
+    sections = []
+    for section in config.sections():
+        items = [(k, v) for (k, v) in config.items(section)
+            if k not in defaults or defaults[k] != v]
+        sections.append([section, items])
+    return {'defaults': list(defaults.items()), 'sections': sections}
+
+
+def restore_config(snapshot):
+    """
+    Rebuild a RawConfigParser from data returned by snapshot_config.
+    """
+    config = RawConfigParser()
+    for k, v in snapshot['defaults']:
+        config.set('DEFAULT', k, v)
+    for section, items in snapshot['sections']:
+        config.add_section(section)
+        for k, v in items:
+            config.set(section, k, v)
+    return config
+
+
+def file_stamp(path):
+    """
+    Return the (mtime, size) of a file for use in cache keys, or None if it
+    does not exist.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime, st.st_size)
+
+
+def cached_file(cache_dir, key):
+    """
+    Return the path to the file stored under key by store_file, or None on a
+    cache miss. Hits are marked as recently used for prune_cache.
+    """
+    entry = os.path.join(cache_dir, key)
+    try:
+        names = os.listdir(entry)
+    except OSError:
+        return None
+    if len(names) != 1:
+        return None
+    try:
+        os.utime(entry, None)
+    except OSError:
+        pass
+    return os.path.join(entry, names[0])
+
+
+def store_file(cache_dir, key, path):
+    """
+    Copy the given file into the cache under key, keeping its basename, and
+    return the path to the cached copy.
+    """
+    entry = os.path.join(cache_dir, key)
+    tmp = tempfile.mkdtemp(dir=cache_dir, prefix=".%s." % key)
+    try:
+        place_file(path, tmp, link=False)
+        os.rename(tmp, entry)
+    except (IOError, OSError):
+        # Most likely a concurrent tito run stored the same entry first:
+        debug("Unable to store %s in cache: %s" % (path, entry))
+        shutil.rmtree(tmp, ignore_errors=True)
+    return os.path.join(entry, os.path.basename(path))
+
+
+# Lists the files of an entry stored by store_files, in order:
+FILES_INDEX = ".files"
+
+
+def cached_files(cache_dir, key):
+    """
+    Return the paths to the files stored under key by store_files, in the
+    order they were given, or None on a cache miss. Hits are marked as
+    recently used for prune_cache.
+    """
+    entry = os.path.join(cache_dir, key)
+    names = read_json(os.path.join(entry, FILES_INDEX))
+    if not isinstance(names, list):
+        return None
+    try:
+        os.utime(entry, None)
+    except OSError:
+        pass
+    return [os.path.join(entry, name) for name in names]
+
+
+def store_files(cache_dir, key, paths):
+    """
+    Copy the given files into the cache under key, keeping their basenames,
+    and return the paths to the cached copies.
+    """
+    entry = os.path.join(cache_dir, key)
+    tmp = tempfile.mkdtemp(dir=cache_dir, prefix=".%s." % key)
+    names = [os.path.basename(path) for path in paths]
+    try:
+        for path in paths:
+            place_file(path, tmp, link=False)
+        write_json(os.path.join(tmp, FILES_INDEX), names)
+        os.rename(tmp, entry)
+    except (IOError, OSError):
+        debug("Unable to store %s in cache: %s" % (paths, entry))
+        shutil.rmtree(tmp, ignore_errors=True)
+    return [os.path.join(entry, name) for name in names]
+
+
+def prune_cache(cache_dir, max_size):
+    """
+    Remove the least recently used entries from a cache populated by
+    store_file until it holds at most max_size bytes.
+    """
+    entries = []
+    total = 0
+    for key in os.listdir(cache_dir):
+        if key.startswith("."):
+            continue
+        entry = os.path.join(cache_dir, key)
+        size = 0
+        for root, dirs, files in os.walk(entry):
+            for name in files:
+                size += os.path.getsize(os.path.join(root, name))
+        entries.append((os.path.getmtime(entry), size, entry))
+        total += size
+
+    entries.sort()
+    while entries and total > max_size:
+        mtime, size, entry = entries.pop(0)
+        debug("Pruning cache entry: %s" % entry)
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
+
+
+def prune_tree(root, max_size):
+    """
+    Remove the least recently written directories of files below root (i.e.
+    artifact versions in a Maven repository) until the tree holds at most
+    max_size bytes.
+    """
+    leaves = []
+    total = 0
+    for directory, dirs, files in os.walk(root):
+        if not files:
+            continue
+        size = 0
+        newest = 0
+        for name in files:
+            st = os.lstat(os.path.join(directory, name))
+            size += st.st_size
+            newest = max(newest, st.st_mtime)
+        leaves.append((newest, size, directory))
+        total += size
+
+    leaves.sort()
+    while leaves and total > max_size:
+        newest, size, directory = leaves.pop(0)
+        debug("Pruning cache directory: %s" % directory)
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if not os.path.isdir(path) or os.path.islink(path):
+                os.remove(path)
+        total -= size
@@ -23,14 +23,14 @@
     DEFAULT_BUILDER, BUILDCONFIG_SECTION, DEFAULT_TAGGER, \
     create_builder, get_project_name, get_relative_project_dir, \
     DEFAULT_BUILD_DIR, run_command, tito_config_dir, warn_out, info_out, \
-    read_user_config
-from tito.compat import RawConfigParser, getstatusoutput, getoutput
+    read_user_config, get_package_metadata_index, empty_trash, \
+    TRASH_DIRNAME, clear_commit_metadata, mkdir_p
+from tito.cache import get_cache_dir, digest, file_stamp, read_json, \
+    write_json, snapshot_config, restore_config
+from tito.compat import RawConfigParser, getstatusoutput, getoutput, \
+    read_config_string
 from tito.exception import TitoException
 
-# Hack for Python 2.4, seems to require we import these so they get compiled
-# before we try to dynamically import them based on a string name.
-import tito.tagger  # NOQA
-
 TITO_PROPS = "tito.props"
 RELEASERS_CONF_FILENAME = "releasers.conf"
 ASSUMED_NO_TAR_GZ_PROPS = """
@@ -40,23 +40,6 @@
 """
 
 
-class FauxConfigFile(object):
-    """ Allows us to read config from a string. """
-    def __init__(self, config_str):
-        # We'll re-add the newline when returned:
-        self.lines = config_str.split("\n")
-
-    def readline(self):
-        if len(self.lines) > 0:
-            # Pop a line off the front of the list:
-            line = self.lines[0]
-            self.lines = self.lines[1:]
-            return line + "\n"
-        else:
-            # Indicates end of file:
-            return ''
-
-
 class ConfigLoader(object):
     """
     Responsible for the sometimes complicated process of loading the repo's
@@ -69,12 +52,67 @@ def __init__(self, package_name, output_dir, tag):
         self.output_dir = output_dir
         self.tag = tag
 
+        # Messages printed while loading, replayed when we load the same
+        # config from a snapshot:
+        self.messages = []
+
+        # Set to False if something about this config should be reported
+        # every time, in which case we never snapshot it:
+        self.cacheable = True
+
     def load(self):
+        snapshot_file, key = self._get_snapshot_file_and_key()
+        snapshot = snapshot_file and read_json(snapshot_file)
+        if snapshot and snapshot['key'] == key:
+            debug("Loaded config snapshot: %s" % snapshot_file)
+            self.config = restore_config(snapshot['config'])
+            for msg in snapshot['messages']:
+                print(msg)
+            return self.config
+
         self.config = self._read_config()
         self._read_project_config()
         self._check_required_config(self.config)
+
+        if snapshot_file and self.cacheable:
+            write_json(snapshot_file, {
+                'key': key,
+                'config': snapshot_config(self.config),
+                'messages': self.messages,
+            })
         return self.config
 
+    def _get_snapshot_file_and_key(self):
+        """
+        Return the file the merged config snapshot for this package is kept
+        in, and the key it must match to be used. The key covers every file
+        that goes into the merged config, and the tree of the tag we'd read
+        the package's tito.props from.
+        """
+        try:
+            cache_dir = get_cache_dir(self.output_dir, "config")
+        except OSError:
+            return (None, None)
+        git_root = find_git_root()
+        global_props = os.path.join(git_root, tito_config_dir(), TITO_PROPS)
+        current_props = os.path.join(os.getcwd(), TITO_PROPS)
+        tag_tree = None
+        if self.tag:
+            (status, output) = getstatusoutput("git rev-parse %s^{tree}" %
+                self.tag)
+            if status == 0:
+                tag_tree = output
+        snapshot_file = os.path.join(cache_dir, "tito.props-%s.json" %
+            digest(git_root, os.getcwd(), self.package_name))
+        key = digest(self.tag, tag_tree,
+            global_props, file_stamp(global_props),
+            current_props, file_stamp(current_props))
+        return (snapshot_file, key)
+
+    def _message(self, msg):
+        print(msg)
+        self.messages.append(msg)
+
     def _read_config(self):
         """
         Read global build.py configuration from the .tito dir of the git
@@ -104,6 +142,8 @@ def _check_legacy_globalconfig(self, config):
         # tito.props. If we see globalconfig, automatically rename it after
         # loading and warn the user.
         if config.has_section('globalconfig'):
+            # Keep nagging until this gets fixed:
+            self.cacheable = False
             if not config.has_section('buildconfig'):
                 config.add_section('buildconfig')
             warn_out("Please rename [globalconfig] to [buildconfig] in "
@@ -148,7 +188,7 @@ def _read_project_config(self):
         current_props_file = os.path.join(os.getcwd(), TITO_PROPS)
         if (os.path.exists(current_props_file)):
             self.config.read(current_props_file)
-            print("Loaded package specific tito.props overrides")
+            self._message("Loaded package specific tito.props overrides")
 
         # Check for a tito.props back when this tag was created and use it
         # instead. (if it exists)
@@ -162,10 +202,9 @@ def _read_project_config(self):
             (status, output) = getstatusoutput(cmd)
 
             if status == 0:
-                faux_config_file = FauxConfigFile(output)
-                self.config.read_fp(faux_config_file)
-                print("Loaded package specific tito.props overrides from %s" %
-                    self.tag)
+                read_config_string(self.config, output)
+                self._message("Loaded package specific tito.props "
+                    "overrides from %s" % self.tag)
                 return
 
         debug("Unable to locate package specific config for this package.")
@@ -239,7 +278,7 @@ def _add_common_options(self):
         default_output_dir = lookup_build_dir(self.user_config)
         if not os.path.exists(default_output_dir):
             print("Creating output directory: %s" % default_output_dir)
-            run_command("mkdir %s" % default_output_dir)
+            mkdir_p(default_output_dir)
 
         self.parser.add_option("-o", "--output", dest="output_dir",
                 metavar="OUTPUTDIR", default=default_output_dir,
@@ -252,6 +291,13 @@ def main(self, argv):
 
         self._validate_options()
 
+        # Commits looked up by a previous command run in this process (i.e.
+        # the test suite) may have been superseded since:
+        clear_commit_metadata()
+
+        # Finish any background cleanup an interrupted run left behind:
+        empty_trash(os.path.join(self.options.output_dir, TRASH_DIRNAME))
+
         if len(argv) < 1:
             print(self.parser.error("Must supply an argument. "
                 "Try -h for help."))
@@ -319,6 +365,10 @@ def __init__(self):
         self.parser.add_option("--no-cleanup", dest="no_cleanup",
                 action="store_true",
                 help="do not clean up temporary tito build directories/files, and disable rpmbuild %clean")
+        self.parser.add_option("--watch", dest="watch", action="store_true",
+                default=False,
+                help="keep running and rebuild whenever files in the package "
+                    "directory change (requires --test)")
         self.parser.add_option("--tag", dest="tag", metavar="PKGTAG",
                 help="build a specific tag instead of the latest version " +
                     "(i.e. spacewalk-java-0.4.0-1)")
@@ -364,13 +414,28 @@ def main(self, argv):
             'scl': self.options.scl,
             'quiet': self.options.quiet,
             'verbose': self.options.verbose,
+            'escalate': self.options.escalate,
         }
 
+        # Everything built is installed together once the build is done:
+        install_queue = None
+        if self.options.auto_install:
+            from tito.builder.main import InstallQueue
+            install_queue = InstallQueue(self.user_config,
+                escalate=self.options.escalate)
+            kwargs['install_queue'] = install_queue
+
         builder = create_builder(package_name, build_tag,
                 self.config,
                 build_dir, self.user_config, args,
                 builder_class=self.options.builder, **kwargs)
-        return builder.run(self.options)
+        if self.options.watch:
+            from tito.watch import BuildWatcher
+            return BuildWatcher(builder, self.options).run()
+        artifacts = builder.run(self.options)
+        if install_queue:
+            install_queue.install()
+        return artifacts
 
     def _validate_options(self):
         if not any([self.options.rpm, self.options.srpm, self.options.tgz]):
@@ -381,6 +446,8 @@ def _validate_options(self):
             error_out("Cannot build test version of specific tag.")
         if self.options.quiet and self.options.verbose:
             error_out("Cannot set --quiet and --verbose at the same time.")
+        if self.options.watch and not self.options.test:
+            error_out("--watch can only be used with --test builds.")
 
     def _parse_builder_args(self):
         """
@@ -474,8 +541,26 @@ def _read_releaser_config(self):
         """
         rel_eng_dir = os.path.join(find_git_root(), tito_config_dir())
         filename = os.path.join(rel_eng_dir, RELEASERS_CONF_FILENAME)
+
+        build_dir = os.path.normpath(os.path.abspath(self.options.output_dir))
+        try:
+            snapshot_file = os.path.join(get_cache_dir(build_dir, "config"),
+                "%s-%s.json" % (RELEASERS_CONF_FILENAME, digest(filename)))
+        except OSError:
+            snapshot_file = None
+        key = digest(filename, file_stamp(filename))
+        snapshot = snapshot_file and read_json(snapshot_file)
+        if snapshot and snapshot['key'] == key:
+            debug("Loaded config snapshot: %s" % snapshot_file)
+            return restore_config(snapshot['config'])
+
         config = RawConfigParser()
         config.read(filename)
+        if snapshot_file:
+            write_json(snapshot_file, {
+                'key': key,
+                'config': snapshot_config(config),
+            })
         return config
 
     def _legacy_builder_hack(self, releaser_config):
@@ -586,15 +671,18 @@ def main(self, argv):
                 auto_accept=self.options.auto_accept,
                 **kwargs)
 
+            ok = False
             try:
                 try:
                     releaser.release(dry_run=self.options.dry_run,
                             no_build=self.options.no_build,
                             scratch=self.options.scratch)
+                    ok = True
                 except KeyboardInterrupt:
                     print("Interrupted, cleaning up...")
             finally:
                 releaser.cleanup()
+                releaser.record_build_times(ok)
 
             # Make sure we go back to where we started, otherwise multiple
             # builders gets very confused:
@@ -641,10 +729,18 @@ def __init__(self):
         self.parser.add_option("--undo", "-u", dest="undo", action="store_true",
                 help="Undo the most recent (un-pushed) tag.")
 
+        self.parser.add_option("--changed", dest="changed",
+                action="store_true", default=False,
+                help=("Tag every package with changes since its last tag, "
+                    "in a single commit."))
+
     def main(self, argv):
         BaseCliModule.main(self, argv)
 
         build_dir = os.path.normpath(os.path.abspath(self.options.output_dir))
+        if self.options.changed:
+            return self._tag_changed_packages(build_dir)
+
         package_name = get_project_name(tag=None)
 
         self.load_config(package_name, build_dir, None)
@@ -668,9 +764,86 @@ def main(self, argv):
             e = sys.exc_info()[1]
             error_out(e.message)
 
+    def _tag_changed_packages(self, build_dir):
+        """
+        Tag a new version of every package with commits since it was last
+        tagged, all in one commit with a tag per package.
+        """
+        from tito.tagger.main import PackageHistory, VersionTagger
+
+        git_root = find_git_root()
+        os.chdir(git_root)
+
+        tag_commits = {}
+        for line in getoutput("git for-each-ref --format='%(refname:short) "
+                "%(objectname) %(*objectname)' refs/tags").split("\n"):
+            fields = line.split()
+            if fields:
+                tag_commits[fields[0]] = fields[-1]
+
+        packages = {}
+        configs = {}
+        taggers = {}
+        index = get_package_metadata_index(git_root)
+        for package_name in index.names():
+            (version, relative_dir) = index.get(package_name)
+            package_dir = os.path.join(git_root, relative_dir)
+            if not os.path.isdir(package_dir):
+                warn_out("Skipping %s, %s does not exist" % (package_name,
+                    relative_dir))
+                continue
+            os.chdir(package_dir)
+            config = ConfigLoader(package_name, build_dir, None).load()
+            tagger_class = get_class_by_name(config.get(
+                BUILDCONFIG_SECTION, DEFAULT_TAGGER))
+            tagger = tagger_class(config=config,
+                    user_config=self.user_config,
+                    keep_version=self.options.keep_version,
+                    offline=self.options.offline)
+            # The package's own tagger knows what its tags look like:
+            tag = tagger._get_new_tag(version)
+            if tag not in tag_commits:
+                warn_out("Skipping %s, unable to find tag: %s" %
+                    (package_name, tag))
+                continue
+            packages[package_name] = (tag_commits[tag], relative_dir)
+            configs[package_name] = config
+            taggers[package_name] = tagger
+        os.chdir(git_root)
+
+        history = PackageHistory(packages)
+        changed = history.changed_packages()
+        if not changed:
+            info_out("No packages have changed since they were last tagged.")
+            return
+        info_out("Tagging changed packages: %s" % ", ".join(changed))
+
+        for package_name in changed:
+            if configs[package_name].has_option(BUILDCONFIG_SECTION,
+                    "block_tagging"):
+                error_out("Tagging has been disabled for %s in this git "
+                    "branch." % package_name)
+            if taggers[package_name].project_name != package_name:
+                error_out("Spec file in %s is for %s, not %s" % (
+                    packages[package_name][1],
+                    taggers[package_name].project_name, package_name))
+        taggers = [taggers[package_name] for package_name in changed]
+
+        os.chdir(git_root)
+        try:
+            return VersionTagger.run_bulk(taggers, self.options, history)
+        except TitoException:
+            e = sys.exc_info()[1]
+            error_out([e.message, "Changes made so far have been left "
+                "staged, please check 'git status'."])
+
     def _validate_options(self):
         if self.options.keep_version and self.options.use_version:
             error_out("Cannot combine --keep-version and --use-version")
+        if self.options.changed and (self.options.undo or
+                self.options.use_version or self.options.use_release):
+            error_out("Cannot combine --changed with --undo, --use-version "
+                "or --use-release")
 
 
 class InitModule(BaseCliModule):
@@ -742,7 +915,7 @@ class ReportModule(BaseCliModule):
     """ CLI Module For Various Reports. """
 
     def __init__(self):
-        BaseCliModule.__init__(self, "usage: %prog report [options]")
+        BaseCliModule.__init__(self, "usage: %prog report [options] [package]")
 
         self.parser.add_option("--untagged-diffs", dest="untagged_report",
                 action="store_true",
@@ -758,10 +931,23 @@ def __init__(self):
                     "their most recent tag and HEAD. Useful for determining",
                     "which packages are in need of a re-tag.",
                 ))
+        self.parser.add_option("--build-times", dest="build_times",
+                action="store_true",
+                help="%s %s" % (
+                    "Print percentiles and trends of the time taken by each",
+                    "stage of past builds in the output directory.",
+                ))
 
     def main(self, argv):
         BaseCliModule.main(self, argv)
 
+        if self.options.build_times:
+            package = None
+            if len(self.args) > 1:
+                package = self.args[1]
+            self._run_build_times_report(package)
+            return []
+
         if self.options.untagged_report:
             self._run_untagged_report(self.config)
             sys.exit(1)
@@ -771,6 +957,19 @@ def main(self, argv):
             sys.exit(1)
         return []
 
+    def _run_build_times_report(self, package=None):
+        """
+        Display the timings recorded for past builds in the output directory.
+        """
+        from tito.timing import HISTORY_FILENAME, read_history, format_report
+        entries = read_history(os.path.join(self.options.output_dir,
+            HISTORY_FILENAME), package)
+        if not entries:
+            print("No build times recorded in %s" % self.options.output_dir)
+            return
+        for line in format_report(entries):
+            print(line)
+
     def _run_untagged_commits(self, config):
         """
         Display a report of all packages with differences between HEAD and
@@ -780,22 +979,17 @@ def _run_untagged_commits(self, config):
         print("Scanning for packages that may need to be tagged...")
         print("")
         git_root = find_git_root()
-        rel_eng_dir = os.path.join(git_root, tito_config_dir())
         os.chdir(git_root)
-        package_metadata_dir = os.path.join(rel_eng_dir, "packages")
-        for root, dirs, files in os.walk(package_metadata_dir):
-            for md_file in files:
-                if md_file[0] == '.':
-                    continue
-                f = open(os.path.join(package_metadata_dir, md_file))
-                (version, relative_dir) = f.readline().strip().split(" ")
+        index = get_package_metadata_index(git_root)
+        for md_file in index.names():
+            (version, relative_dir) = index.get(md_file)
 
-                # Hack for single project git repos:
-                if relative_dir == '/':
-                    relative_dir = ""
+            # Hack for single project git repos:
+            if relative_dir == '/':
+                relative_dir = ""
 
-                project_dir = os.path.join(git_root, relative_dir)
-                self._print_log(config, md_file, version, project_dir)
+            project_dir = os.path.join(git_root, relative_dir)
+            self._print_log(config, md_file, version, project_dir)
 
     def _run_untagged_report(self, config):
         """
@@ -806,23 +1000,18 @@ def _run_untagged_report(self, config):
         print("Scanning for packages that may need to be tagged...")
         print("")
         git_root = find_git_root()
-        rel_eng_dir = os.path.join(git_root, tito_config_dir())
         os.chdir(git_root)
-        package_metadata_dir = os.path.join(rel_eng_dir, "packages")
-        for root, dirs, files in os.walk(package_metadata_dir):
-            for md_file in files:
-                if md_file[0] == '.':
-                    continue
-                f = open(os.path.join(package_metadata_dir, md_file))
-                (version, relative_dir) = f.readline().strip().split(" ")
-
-                # Hack for single project git repos:
-                if relative_dir == '/':
-                    relative_dir = ""
-
-                project_dir = os.path.join(git_root, relative_dir)
-                self._print_diff(config, md_file, version, project_dir,
-                        relative_dir)
+        index = get_package_metadata_index(git_root)
+        for md_file in index.names():
+            (version, relative_dir) = index.get(md_file)
+
+            # Hack for single project git repos:
+            if relative_dir == '/':
+                relative_dir = ""
+
+            project_dir = os.path.join(git_root, relative_dir)
+            self._print_diff(config, md_file, version, project_dir,
+                    relative_dir)
 
     def _print_log(self, config, package_name, version, project_dir):
         """
@@ -19,6 +19,8 @@
 import errno
 import fileinput
 import glob
+import hashlib
+import json
 import os
 import pickle
 import re
@@ -26,13 +28,13 @@
 import subprocess
 import shlex
 import shutil
+import tarfile
 import tempfile
+import threading
 
 from blessings import Terminal
 
-from bugzilla.rhbugzilla import RHBugzilla
-
-from tito.compat import xmlrpclib, getstatusoutput
+from tito.compat import xmlrpclib, getstatusoutput, queue
 from tito.exception import TitoException
 from tito.exception import RunCommandException
 from tito.tar import TarFixer
@@ -52,15 +54,27 @@
 }
 
 
+# ~/.titorc contents we've already read, and the (mtime, size) it had:
+_user_config_cache = (None, None)
+
+
 def read_user_config():
+    global _user_config_cache
     config = {}
     file_loc = os.path.expanduser("~/.titorc")
     try:
+        st = os.stat(file_loc)
         f = open(file_loc)
     except:
         # File doesn't exist but that's ok because it's optional.
         return config
 
+    # This gets called for every message we print, only parse it once:
+    stamp = (file_loc, st.st_mtime, st.st_size)
+    if _user_config_cache[0] == stamp:
+        f.close()
+        return dict(_user_config_cache[1])
+
     for line in f.readlines():
         if line.strip() == "":
             continue
@@ -69,6 +83,8 @@ def read_user_config():
             raise Exception("Error parsing ~/.titorc: %s" % line)
         # Remove whitespace from the values
         config[tokens[0].strip()] = tokens[1].strip()
+    f.close()
+    _user_config_cache = (stamp, dict(config))
     return config
 
 
@@ -203,6 +219,7 @@ def _filter_bzs_with_flags(self):
         return filtered_bzs
 
     def _load_bug(self, bug_id):
+        from bugzilla.rhbugzilla import RHBugzilla
         bugzilla = RHBugzilla(url='https://bugzilla.redhat.com/xmlrpc.cgi')
         return bugzilla.getbug(bug_id, include_fields=['id', 'flags'])
 
@@ -263,6 +280,74 @@ def chdir(path):
         os.chdir(previous_dir)
 
 
+def cpu_count():
+    """
+    Return the number of CPUs available, or 1 if it can't be determined.
+    """
+    import multiprocessing
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+
+def run_parallel(func, items, jobs=None):
+    """
+    Call func for each of the given items using up to jobs threads (default
+    is one per CPU) and yield (item, result) tuples as each call completes.
+
+    If a call raises (including the SystemExit from error_out) no further
+    items are started, and the exception is re-raised here once the calls
+    already running have finished.
+
+    func must not rely on the current working directory, which is shared by
+    all threads.
+    """
+    items = list(items)
+    if jobs is None:
+        jobs = cpu_count()
+    jobs = max(1, min(jobs, len(items)))
+    if jobs == 1:
+        for item in items:
+            yield (item, func(item))
+        return
+
+    todo = queue.Queue()
+    for item in items:
+        todo.put(item)
+    done = queue.Queue()
+    failed = []
+
+    def worker():
+        while not failed:
+            try:
+                item = todo.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                done.put((item, func(item), None))
+            except BaseException:
+                failed.append(item)
+                done.put((item, None, sys.exc_info()))
+
+    threads = [threading.Thread(target=worker) for i in range(jobs)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    try:
+        for i in range(len(items)):
+            item, result, exc_info = done.get()
+            if exc_info:
+                for thread in threads:
+                    thread.join()
+                raise exc_info[1]
+            yield (item, result)
+    finally:
+        # Stop handing out work if our caller gave up early:
+        failed.append(None)
+
+
 def create_builder(package_name, build_tag,
         config, build_dir, user_config, args,
         builder_class=None, **kwargs):
@@ -466,30 +551,99 @@ def run_subprocess(p):
             break
 
 
-def render_cheetah(template_file, destination_directory, cheetah_input):
-    """Cheetah doesn't exist for Python 3, but it's the templating engine
+# Compiled Cheetah template classes by template digest, and rendered output by
+# (template digest, input digest):
+_cheetah_templates = {}
+_cheetah_rendered = {}
+
+
+def _compile_cheetah(template_digest, source):
+    """
+    Return the compiled Cheetah template class for the given template
+    source, or None if the Cheetah library is not available.
+    """
+    if template_digest not in _cheetah_templates:
+        try:
+            from Cheetah.Template import Template
+        except ImportError:
+            debug("Cheetah library not available, using the cheetah command")
+            _cheetah_templates[template_digest] = None
+        else:
+            _cheetah_templates[template_digest] = Template.compile(
+                source=source)
+    return _cheetah_templates[template_digest]
+
+
+def _fill_cheetah(template_file, destination_directory, cheetah_input):
+    """Cheetah doesn't exist for every Python 3, but it's the templating engine
     that Mead uses.  Instead of importing the potentially incompatible code,
     we use a command-line utility that Cheetah provides.  Yes, this is a total
     hack."""
-    pickle_file = tempfile.NamedTemporaryFile(dir=destination_directory, prefix="tito-cheetah-pickle", delete=False)
+    work_dir = tempfile.mkdtemp(dir=destination_directory,
+        prefix="tito-cheetah")
     try:
-        pickle.dump(cheetah_input, pickle_file, protocol=2)
-        pickle_file.close()
+        pickle_file = os.path.join(work_dir, "input.pickle")
+        f = open(pickle_file, 'wb')
+        try:
+            pickle.dump(cheetah_input, f, protocol=2)
+        finally:
+            f.close()
         run_command("cheetah fill --flat --pickle=%s --odir=%s --oext=cheetah %s" %
-            (pickle_file.name, destination_directory, template_file))
-
-        # Annoyingly Cheetah won't let you specify an empty string for a file extension
-        # and most Mead templates end with ".spec.tmpl"
-        rendered_files = glob.glob(os.path.join(destination_directory, "*.cheetah"))
+            (pickle_file, work_dir, template_file))
 
         # Cheetah returns zero even if it doesn't find the template to render.  Thanks Cheetah.
+        rendered_files = glob.glob(os.path.join(work_dir, "*.cheetah"))
         if not rendered_files:
             error_out("Could not find rendered file in %s for %s" % (destination_directory, template_file))
 
-        for rendered in rendered_files:
-            shutil.move(rendered, os.path.splitext(rendered)[0])
+        f = open(rendered_files[0])
+        try:
+            return f.read()
+        finally:
+            f.close()
+    finally:
+        shutil.rmtree(work_dir)
+
+
+def render_cheetah(template_file, destination_directory, cheetah_input):
+    """
+    Render a Cheetah template into destination_directory, dropping its last
+    extension (most Mead templates end with ".spec.tmpl").
+
+    The template is rendered in-process when the Cheetah library can be
+    imported, falling back to the cheetah command otherwise. Compiled
+    templates and their output are cached for the life of the process.
+    """
+    f = open(template_file, 'rb')
+    try:
+        source = f.read()
+    finally:
+        f.close()
+    template_digest = hashlib.sha256(source).hexdigest()
+    input_digest = hashlib.sha256(json.dumps(cheetah_input, sort_keys=True,
+        default=str).encode('utf-8')).hexdigest()
+
+    key = (template_digest, input_digest)
+    if key not in _cheetah_rendered:
+        template_class = _compile_cheetah(template_digest,
+            source.decode('utf-8'))
+        if template_class is None:
+            rendered = _fill_cheetah(template_file, destination_directory,
+                cheetah_input)
+        else:
+            rendered = str(template_class(searchList=[cheetah_input]))
+        _cheetah_rendered[key] = rendered
+    else:
+        debug("Using cached render of %s" % template_file)
+
+    destination = os.path.join(destination_directory,
+        os.path.splitext(os.path.basename(template_file))[0])
+    f = open(destination, 'w')
+    try:
+        f.write(_cheetah_rendered[key])
     finally:
-        os.unlink(pickle_file.name)
+        f.close()
+    return destination
 
 
 def tag_exists_locally(tag):
@@ -869,6 +1023,56 @@ def get_relative_project_dir_cwd(git_root):
     return relative
 
 
+# Commit metadata and counts already looked up by this process, see
+# get_commit_metadata:
+_commit_metadata = {}
+_commit_counts = {}
+
+
+def _commit_key(ref, path=None):
+    # A full SHA1 names the same commit wherever we are in the checkout,
+    # anything else may depend on the current directory:
+    if path is None and re.match(r'^[0-9a-f]{40}$', ref):
+        return (ref,)
+    return (os.getcwd(), ref, path)
+
+
+def get_commit_metadata(ref="HEAD", path=None):
+    """
+    Return a dict of the 'commit' SHA1, 'tree' SHA1 and committer
+    'timestamp' of the latest commit reachable from ref (that touched path,
+    if given), or None if there is no such commit.
+
+    All three come from a single git log, and are remembered for the rest
+    of the run so the builder, releasers and create_tgz can all ask again
+    without running git.
+    """
+    key = _commit_key(ref, path)
+    if key not in _commit_metadata:
+        cmd = "git log --max-count=1 --pretty=format:'%%H %%T %%ct' %s" % ref
+        if path is not None:
+            cmd = "%s -- %s" % (cmd, path)
+        output = run_command(cmd).split()
+        metadata = None
+        if len(output) == 3:
+            metadata = {
+                'commit': output[0],
+                'tree': output[1],
+                'timestamp': output[2],
+            }
+            _commit_metadata[_commit_key(metadata['commit'])] = metadata
+        _commit_metadata[key] = metadata
+    return _commit_metadata[key]
+
+
+def clear_commit_metadata():
+    """
+    Forget the commit metadata looked up so far, i.e. after committing.
+    """
+    _commit_metadata.clear()
+    _commit_counts.clear()
+
+
 def get_build_commit(tag, test=False):
     """ Return the git commit we should build. """
     if test:
@@ -878,8 +1082,9 @@ def get_build_commit(tag, test=False):
             "git ls-remote ./. --tag %s | awk '{ print $1 ; exit }'"
             % tag)
         tag_sha1 = extract_sha1(tag_sha1)
-        commit_id = run_command('git rev-list --max-count=1 %s' % tag_sha1)
-        return commit_id
+        if not tag_sha1:
+            error_out("Unable to look up tag: %s" % tag)
+        return get_commit_metadata(tag_sha1)['commit']
 
 
 def get_commit_count(tag, commit_id):
@@ -893,6 +1098,13 @@ def get_commit_count(tag, commit_id):
     #     return 0
     # else:
     #     parse the count from the output
+    key = _commit_key(commit_id) + (tag,)
+    if key not in _commit_counts:
+        _commit_counts[key] = _get_commit_count(tag, commit_id)
+    return _commit_counts[key]
+
+
+def _get_commit_count(tag, commit_id):
     (status, output) = getstatusoutput(
         "git describe --match=%s %s" % (tag, commit_id))
 
@@ -902,14 +1114,11 @@ def get_commit_count(tag, commit_id):
     if status != 0:
         debug("git describe of tag %s failed (%d)" % (tag, status))
         debug("going to use number of commits from initial commit")
+        # Every commit reachable from commit_id except the initial one:
         (status, output) = getstatusoutput(
-            "git rev-list --max-parents=0 HEAD")
+            "git rev-list --count %s" % commit_id)
         if status == 0:
-            # output is now inital commit
-            (status, output) = getstatusoutput(
-                "git rev-list %s..%s --count" % (output, commit_id))
-            if status == 0:
-                return output
+            return str(max(int(output) - 1, 0))
         return 0
 
     if tag != output:
@@ -922,8 +1131,10 @@ def get_commit_count(tag, commit_id):
 
 def get_latest_commit(path="."):
     """ Return the latest git commit for the given path. """
-    commit_id = run_command("git log --pretty=format:%%H --max-count=1 %s" % path)
-    return commit_id
+    metadata = get_commit_metadata("HEAD", path)
+    if metadata is None:
+        return ""
+    return metadata['commit']
 
 
 def get_commit_timestamp(sha1_or_tag):
@@ -932,10 +1143,7 @@ def get_commit_timestamp(sha1_or_tag):
     keep the hash the same on all .tar.gz's we generate for a particular
     version regardless of when they are generated.
     """
-    output = run_command(
-        "git rev-list --timestamp --max-count=1 %s | awk '{print $1}'"
-        % sha1_or_tag)
-    return output
+    return get_commit_metadata(sha1_or_tag)['timestamp']
 
 
 def create_tgz(git_root, prefix, commit, relative_dir,
@@ -977,6 +1185,55 @@ def create_tgz(git_root, prefix, commit, relative_dir,
     return run_command("gzip -n -c < %s > %s" % (fixed_tar, dest_tgz))
 
 
+def update_tgz(source_dir, prefix, changed_files, dest_tgz):
+    """
+    Regenerate a .tar.gz previously written by create_tgz, replacing only
+    the given files (relative to source_dir) with their current contents.
+
+    The uncompressed tarball create_tgz leaves next to dest_tgz is used as
+    the starting point, so unchanged members are copied over as-is rather
+    than being re-exported from git. Files which no longer exist in
+    source_dir are dropped from the archive.
+    """
+    basename = os.path.splitext(dest_tgz)[0]
+    fixed_tar = "%s.tar" % basename
+    updated_tar = "%s.updated" % basename
+
+    changed = set(os.path.normpath(f) for f in changed_files)
+    old = tarfile.open(fixed_tar, 'r')
+    new = tarfile.open(updated_tar, 'w', format=tarfile.PAX_FORMAT,
+        pax_headers=old.pax_headers)
+    try:
+        for member in old.getmembers():
+            relative = os.path.normpath(member.name[len(prefix) + 1:])
+            if member.isfile() and relative in changed:
+                continue
+            if member.isfile():
+                new.addfile(member, old.extractfile(member))
+            else:
+                new.addfile(member)
+        for relative in sorted(changed):
+            path = os.path.join(source_dir, relative)
+            if not os.path.isfile(path):
+                continue
+            info = new.gettarinfo(path, "%s/%s" % (prefix, relative))
+            info.uid = info.gid = 0
+            info.uname = info.gname = "root"
+            with open(path, 'rb') as fileobj:
+                new.addfile(info, fileobj)
+    finally:
+        new.close()
+        old.close()
+
+    os.rename(updated_tar, fixed_tar)
+
+    # Replace rather than rewrite the tarball, copies of it placed elsewhere
+    # may be hard links:
+    output = run_command("gzip -n -c < %s > %s.updated" % (fixed_tar, dest_tgz))
+    os.rename("%s.updated" % dest_tgz, dest_tgz)
+    return output
+
+
 def get_git_repo_url():
     """
     Return the url of this git repo.
@@ -986,6 +1243,125 @@ def get_git_repo_url():
     return run_command("git config remote.origin.url")
 
 
+class PackageMetadataIndex(object):
+    """
+    Index of the .tito/packages/ metadata files in a git checkout.
+
+    Each file there is named after a package and contains a single line with
+    the latest tagged version of the package and its directory relative to
+    the git root. This maps each package to that (version, relative dir) and
+    each relative dir back to the packages which reference it.
+
+    Use get_package_metadata_index() rather than creating these directly, so
+    the files are only read once per process.
+    """
+
+    def __init__(self, metadata_dir):
+        self.metadata_dir = metadata_dir
+        # Maps package name to (version, relative dir):
+        self.packages = {}
+        # Maps relative dir to a set of package names:
+        self.dirs = {}
+        self.stamp = None
+        self.load()
+
+    def _get_stamp(self):
+        try:
+            st = os.stat(self.metadata_dir)
+        except OSError:
+            return None
+        return (st.st_mtime, st.st_ino)
+
+    def load(self):
+        """ (Re-)read all metadata files. """
+        self.packages = {}
+        self.dirs = {}
+        self.stamp = self._get_stamp()
+        if self.stamp is None:
+            return
+        for name in os.listdir(self.metadata_dir):
+            metadata_file = os.path.join(self.metadata_dir, name)
+            if name.startswith(".") or os.path.isdir(metadata_file):
+                continue
+            f = open(metadata_file, 'r')
+            try:
+                fields = f.readline().split()
+            finally:
+                f.close()
+            fields.extend(['', ''])
+            self._add(name, fields[0], fields[1])
+
+    def is_stale(self):
+        """
+        True if metadata files have been added or replaced (i.e. by git)
+        since we were loaded. Changes made through update() and remove()
+        are already reflected.
+        """
+        return self._get_stamp() != self.stamp
+
+    def _add(self, name, version, relative_dir):
+        self.packages[name] = (version, relative_dir)
+        self.dirs.setdefault(relative_dir, set()).add(name)
+
+    def get(self, name):
+        """ Return (version, relative dir) for a package, or None. """
+        return self.packages.get(name)
+
+    def get_version(self, name):
+        """ Return the latest tagged version of a package, or None. """
+        entry = self.packages.get(name)
+        if entry is None:
+            return None
+        return entry[0]
+
+    def packages_in_dir(self, relative_dir):
+        """ Return the names of all packages in the given relative dir. """
+        return sorted(self.dirs.get(relative_dir, []))
+
+    def names(self):
+        """ Return the names of all packages. """
+        return sorted(self.packages.keys())
+
+    def update(self, name, version, relative_dir):
+        """ Record a metadata file we've just written. """
+        self.remove(name)
+        self._add(name, version, relative_dir)
+        self.stamp = self._get_stamp()
+
+    def remove(self, name):
+        """ Forget about a metadata file we've just removed. """
+        if name in self.packages:
+            relative_dir = self.packages.pop(name)[1]
+            self.dirs[relative_dir].discard(name)
+        self.stamp = self._get_stamp()
+
+
+# Metadata indexes already loaded by this process, keyed by directory:
+_package_metadata_indexes = {}
+
+
+def get_package_metadata_index(git_root=None):
+    """
+    Return the PackageMetadataIndex for the given (or current) git checkout,
+    reading the metadata files only if we haven't already or they've
+    been changed behind our back.
+    """
+    if git_root is None:
+        git_root = find_git_root()
+    metadata_dir = os.path.join(git_root, ".tito", "packages")
+    if not os.path.isdir(os.path.join(git_root, ".tito")):
+        metadata_dir = os.path.join(git_root, "rel-eng", "packages")
+    index = _package_metadata_indexes.get(metadata_dir)
+    if index is None:
+        debug("Loading package metadata from: %s" % metadata_dir)
+        index = PackageMetadataIndex(metadata_dir)
+        _package_metadata_indexes[metadata_dir] = index
+    elif index.is_stale():
+        debug("Reloading package metadata from: %s" % metadata_dir)
+        index.load()
+    return index
+
+
 def get_latest_tagged_version(package_name):
     """
     Return the latest git tag for this package in the current branch.
@@ -993,16 +1369,15 @@ def get_latest_tagged_version(package_name):
 
     Returns None if file does not exist.
     """
-    git_root = find_git_root()
-    rel_eng_dir = os.path.join(git_root, tito_config_dir())
-    file_path = "%s/packages/%s" % (rel_eng_dir, package_name)
-    debug("Getting latest package info from: %s" % file_path)
-    if not os.path.exists(file_path):
+    index = get_package_metadata_index()
+    debug("Getting latest package info for: %s" % package_name)
+    if index.get(package_name) is None:
         return None
 
-    output = run_command("awk '{ print $1 ; exit }' %s" % file_path)
-    if output is None or output.strip() == "":
-        error_out("Error looking up latest tagged version in: %s" % file_path)
+    output = index.get_version(package_name)
+    if not output:
+        error_out("Error looking up latest tagged version in: %s" %
+            os.path.join(index.metadata_dir, package_name))
 
     return output
 
@@ -1034,6 +1409,142 @@ def get_script_path(scriptname):
     return scriptpath
 
 
+# ioctl to clone a file's extents on copy on write filesystems, see
+# ioctl_ficlone(2):
+FICLONE = 0x40049409
+
+
+def _reflink(src_file, dest_file):
+    try:
+        import fcntl
+        fcntl.ioctl(dest_file.fileno(), FICLONE, src_file.fileno())
+        return True
+    except (ImportError, IOError, OSError):
+        return False
+
+
+def _copy_file_range(src_file, dest_file):
+    if not hasattr(os, 'copy_file_range'):
+        return False
+    try:
+        while os.copy_file_range(src_file.fileno(), dest_file.fileno(),
+                1024 * 1024 * 1024):
+            pass
+        return True
+    except OSError:
+        # i.e. not supported across these filesystems, start over:
+        src_file.seek(0)
+        dest_file.seek(0)
+        dest_file.truncate()
+        return False
+
+
+def place_file(src, dest, link=True):
+    """
+    Put a copy of src at dest (a file, or a directory to put it in) as
+    cheaply as the filesystem allows: a reflink (copy on write clone), a
+    hard link, an in-kernel copy_file_range, and finally a regular copy.
+
+    A hard link shares its contents with src, so only allow one if neither
+    file will be modified in place later. Returns the path to the copy.
+    """
+    if os.path.isdir(dest):
+        dest = os.path.join(dest, os.path.basename(src))
+    if os.path.lexists(dest):
+        os.remove(dest)
+
+    src_file = open(src, 'rb')
+    try:
+        dest_file = open(dest, 'wb')
+        try:
+            if _reflink(src_file, dest_file):
+                debug("Reflinked %s to %s" % (src, dest))
+            else:
+                if link:
+                    try:
+                        # Shares src's permissions along with its contents:
+                        os.link(src, dest + ".link")
+                        os.rename(dest + ".link", dest)
+                        debug("Linked %s to %s" % (src, dest))
+                        return dest
+                    except OSError:
+                        pass
+                if not _copy_file_range(src_file, dest_file):
+                    shutil.copyfileobj(src_file, dest_file)
+                debug("Copied %s to %s" % (src, dest))
+        finally:
+            dest_file.close()
+    finally:
+        src_file.close()
+    shutil.copymode(src, dest)
+    return dest
+
+
+# Directory inside the build dir that cleanup moves trees into when they are
+# to be deleted in the background, see ASYNC_CLEANUP in titorc(5):
+TRASH_DIRNAME = ".trash"
+
+
+def get_trash_dir(build_dir, user_config):
+    """
+    Return the trash directory to clean up into if the user enabled
+    asynchronous cleanup, otherwise None.
+    """
+    if (user_config or {}).get('ASYNC_CLEANUP', '0') in ['0', '', 'False', 'false']:
+        return None
+    return os.path.join(build_dir, TRASH_DIRNAME)
+
+
+def _remove_detached(paths):
+    """
+    Delete the given paths in a new process which outlives this one.
+    """
+    devnull = open(os.devnull, 'w')
+    try:
+        subprocess.Popen(["rm", "-rf"] + paths, stdin=devnull, stdout=devnull,
+            stderr=devnull, close_fds=True, preexec_fn=os.setsid)
+    finally:
+        devnull.close()
+
+
+def remove_tree(path, trash_dir=None):
+    """
+    Remove a directory tree.
+
+    Given a trash_dir (which must be on the same filesystem), the tree is
+    just renamed into it and deleted by a detached process, so we don't
+    wait for large trees to be removed. Like rm -rf, a tree which is
+    already gone is fine.
+    """
+    if not os.path.lexists(path):
+        return
+    if trash_dir:
+        try:
+            mkdir_p(trash_dir)
+            holder = tempfile.mkdtemp(dir=trash_dir)
+            os.rename(path, os.path.join(holder, os.path.basename(path)))
+            debug("Removing %s in the background" % path)
+            _remove_detached([holder])
+            return
+        except OSError:
+            debug("Unable to move %s to %s" % (path, trash_dir))
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def empty_trash(trash_dir):
+    """
+    Delete anything left in the trash dir, i.e. by runs which were
+    interrupted before their background cleanup finished.
+    """
+    try:
+        entries = os.listdir(trash_dir)
+    except OSError:
+        return
+    if entries:
+        debug("Removing stale trash in %s" % trash_dir)
+        _remove_detached([os.path.join(trash_dir, e) for e in entries])
+
+
 # 511 is 777 in octal.  Python 2 and Python 3 disagree about the right
 # way to represent octal numbers.
 def mkdir_p(path, mode=511):
@@ -1046,6 +1557,19 @@ def mkdir_p(path, mode=511):
             raise
 
 
+def get_tito_version():
+    """
+    Return the version of tito which is installed, avoiding the (slow)
+    pkg_resources where we can.
+    """
+    try:
+        from importlib.metadata import version
+    except ImportError:
+        from pkg_resources import require
+        return require('tito')[0].version
+    return version('tito')
+
+
 def get_class_by_name(name):
     """
     Get a Python class specified by it's fully qualified name.
@@ -1111,9 +1635,32 @@ def compare_version(version1, version2):
     """
     Compare two version strings, returning negative if version1 is < version2,
     zero when equal and positive when version1 > version2.
+
+    Versions are compared segment by segment the way rpm does, so they may
+    contain letters ("0.6.27.dev0", "1.0rc1") and tildes: a numeric segment
+    is newer than an alphabetic one, and a tilde sorts before anything.
+    Trailing zero segments are ignored, so "1" and "1.0" are equal.
     """
-    def normalize(v):
-        return [int(x) for x in re.sub(r'(\.0+)*$', '', v).split(".")]
-    a = normalize(version1)
-    b = normalize(version2)
-    return (a > b) - (a < b)
+    a = re.findall(r'~|\d+|[a-zA-Z]+', str(version1))
+    b = re.findall(r'~|\d+|[a-zA-Z]+', str(version2))
+    for x, y in zip(a, b):
+        if x == y:
+            continue
+        if "~" in (x, y):
+            return x == "~" and -1 or 1
+        if x.isdigit() != y.isdigit():
+            return x.isdigit() and 1 or -1
+        if x.isdigit():
+            x, y = int(x), int(y)
+        if x != y:
+            return (x > y) - (x < y)
+
+    # Whichever has more segments left is newer, unless they're all zero or
+    # the next one is a tilde:
+    sign = len(a) > len(b) and 1 or -1
+    for x in (a[len(b):] or b[len(a):]):
+        if x == "~":
+            return -sign
+        if not x.isdigit() or int(x):
+            return sign
+    return 0
@@ -25,12 +25,14 @@
     from ConfigParser import NoOptionError
     from ConfigParser import RawConfigParser
     from StringIO import StringIO
+    import Queue as queue
     import xmlrpclib
 else:
     import subprocess
     from configparser import NoOptionError
     from configparser import RawConfigParser
     from io import StringIO
+    import queue
     import xmlrpc.client as xmlrpclib
 
 
@@ -88,3 +90,13 @@ def write(fd, str):
         os.write(fd, str)
     else:
         os.write(fd, bytes(str, ENCODING))
+
+
+def read_config_string(config, config_str):
+    """
+    Load config from a string into the given RawConfigParser.
+    """
+    if PY2:
+        config.readfp(StringIO(config_str))
+    else:
+        config.read_string(config_str)
@@ -1,8 +1,9 @@
 import os
 
 from tito.builder import UpstreamBuilder
-from tito.common import debug, run_command, error_out
-from tito.compat import getstatusoutput
+from tito.builder.main import DEFAULT_PATCH_CACHE_SIZE
+from tito.cache import get_cache_dir, cached_files, store_files, prune_cache
+from tito.common import debug, run_command, error_out, place_file
 
 
 class DistributionBuilder(UpstreamBuilder):
@@ -26,18 +27,34 @@ def patch_upstream(self):
             ch_dir = os.path.join(self.git_root,
                     self.relative_project_dir)
         os.chdir(ch_dir)
-        debug("Running /usr/bin/generate-patches.pl -d %s %s %s-1 %s %s"
-               % (self.rpmbuild_gitcopy, self.project_name, self.upstream_version, self.build_version, self.git_commit_id))
-        output = run_command("/usr/bin/generate-patches.pl -d %s %s %s-1 %s %s"
-               % (self.rpmbuild_gitcopy, self.project_name, self.upstream_version, self.build_version, self.git_commit_id))
-        self.patch_files = output.split("\n")
-        for p_file in self.patch_files:
-            (status, output) = getstatusoutput(
-                "grep 'Binary files .* differ' %s/%s " % (self.rpmbuild_gitcopy, p_file))
-            if status == 0 and output != "":
-                error_out("You are doomed. Diff contains binary files. You can not use this builder")
 
-            run_command("cp %s/%s %s" % (self.rpmbuild_gitcopy, p_file, self.rpmbuild_sourcedir))
+        cache_dir = get_cache_dir(self.rpmbuild_basedir, "patches")
+        cache_key = self._get_patch_cache_key(self.build_version)
+        cached = cached_files(cache_dir, cache_key)
+        if cached is not None:
+            debug("Using cached patches: %s" % cached)
+            self.timer.cache_hit("patches")
+            for p_file in cached:
+                place_file(p_file, self.rpmbuild_gitcopy)
+            self.patch_files = [os.path.basename(p_file) for p_file in cached]
+        else:
+            command = "/usr/bin/generate-patches.pl -d %s %s %s-1 %s %s" % (
+                self.rpmbuild_gitcopy, self.project_name,
+                self.upstream_version, self.build_version, self.git_commit_id)
+            debug("Running %s" % command)
+            output = run_command(command)
+            self.patch_files = [p_file for p_file in output.split("\n")
+                if p_file]
+            for p_file in self.patch_files:
+                if self._has_binary_diff(os.path.join(self.rpmbuild_gitcopy,
+                        p_file)):
+                    error_out("You are doomed. Diff contains binary files. You can not use this builder")
+            store_files(cache_dir, cache_key, [os.path.join(
+                self.rpmbuild_gitcopy, p_file) for p_file in self.patch_files])
+            prune_cache(cache_dir, DEFAULT_PATCH_CACHE_SIZE * 1024 * 1024)
+
+        for p_file in self.patch_files:
+            place_file(os.path.join(self.rpmbuild_gitcopy, p_file), self.rpmbuild_sourcedir)
 
         (patch_number, patch_insert_index, patch_apply_index, lines) = self._patch_upstream()
 
@@ -48,3 +65,15 @@ def patch_upstream(self):
             patch_insert_index += 1
             patch_apply_index += 2
         self._write_spec(lines)
+
+    def _has_binary_diff(self, patch_file):
+        """ Return True if the patch contains any binary diffs. """
+        f = open(patch_file, 'rb')
+        try:
+            for line in f:
+                if line.startswith(b"Binary files ") or \
+                        line.startswith(b"GIT binary patch"):
+                    return True
+        finally:
+            f.close()
+        return False
@@ -0,0 +1,253 @@
+# Copyright (c) 2008-2011 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+"""
+Runs the rpmbuild and mock stages of builds on other processes or hosts, see
+BUILD_WORKERS in titorc(5).
+
+A worker is any command which runs "python -m tito.executor" (i.e. "ssh
+buildbox python3 -m tito.executor"), and talks to it over its stdin and
+stdout. For each job the worker is sent a json header line:
+
+    {"command": ..., "files": [[name, size], ...], "collect": [glob, ...]}
+
+followed by the contents of each file. It runs the command in a temporary
+directory holding those files, sending back {"log": line} for each line of
+output, then a json line:
+
+    {"status": exit status, "files": [[relative path, size], ...]}
+
+followed by the contents of the files in the directory matching the collect
+globs.
+"""
+import glob
+import json
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from tito.compat import queue
+from tito.exception import RunCommandException, TitoException
+
+# BUILD_WORKERS entry for a worker process on this host:
+LOCAL_WORKER = "local"
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def get_worker_pool(user_config):
+    """
+    Return a WorkerPool of the workers set in BUILD_WORKERS in ~/.titorc, or
+    None if builds should run here as usual.
+    """
+    value = (user_config or {}).get('BUILD_WORKERS', '')
+    workers = [worker.strip() for worker in value.split(",") if worker.strip()]
+    if not workers:
+        return None
+    return WorkerPool(workers)
+
+
+class WorkerPool(object):
+    """
+    Hands out jobs to workers, running at most one job on each at a time.
+    Safe to use from several threads (i.e. concurrent mock chroots).
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.idle = queue.Queue()
+        for worker in workers:
+            self.idle.put(worker)
+
+    def run(self, command, files, collect, dest_dir, log=None):
+        """
+        Run command on the next idle worker with copies of the given files,
+        and download the files it leaves matching the collect globs into
+        dest_dir, returning their paths.
+
+        log, if given, is called with each line of output as it arrives.
+        Raises a RunCommandException if the command fails.
+        """
+        worker = self.idle.get()
+        try:
+            return run_on_worker(worker, command, files, collect, dest_dir,
+                log)
+        finally:
+            self.idle.put(worker)
+
+
+def _start_worker(worker):
+    env = os.environ.copy()
+    if worker == LOCAL_WORKER:
+        # Make sure the worker runs this same tito:
+        import tito
+        paths = [os.path.dirname(os.path.dirname(os.path.abspath(
+            tito.__file__)))]
+        if env.get('PYTHONPATH'):
+            paths.append(env['PYTHONPATH'])
+        env['PYTHONPATH'] = os.pathsep.join(paths)
+        args = [sys.executable, "-m", "tito.executor"]
+    else:
+        args = shlex.split(worker)
+    try:
+        return subprocess.Popen(args, stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE, env=env)
+    except OSError:
+        raise TitoException("Unable to start worker %s: %s" % (worker,
+            sys.exc_info()[1]))
+
+
+def run_on_worker(worker, command, files, collect, dest_dir, log=None):
+    """
+    Run a single job on the given worker, see WorkerPool.run.
+    """
+    p = _start_worker(worker)
+    output = []
+    try:
+        try:
+            _send_job(p.stdin, command, files, collect)
+        except (IOError, OSError):
+            raise TitoException("Unable to send job to worker %s: %s" % (
+                worker, sys.exc_info()[1]))
+
+        while True:
+            message = _receive(p.stdout)
+            if message is None:
+                raise TitoException("Worker %s exited during: %s" % (worker,
+                    command))
+            if 'log' not in message:
+                break
+            output.append(message['log'])
+            if log:
+                log(message['log'])
+
+        paths = []
+        for name, size in message['files']:
+            path = _safe_join(dest_dir, name)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            _receive_file(p.stdout, path, size)
+            paths.append(path)
+    finally:
+        for stream in (p.stdin, p.stdout):
+            try:
+                stream.close()
+            except (IOError, OSError):
+                pass
+        p.wait()
+
+    if message['status'] != 0:
+        raise RunCommandException(command, message['status'],
+            "\n".join(output))
+    return paths
+
+
+def _send_job(stream, command, files, collect):
+    _send(stream, {
+        'command': command,
+        'files': [[os.path.basename(path), os.path.getsize(path)]
+            for path in files],
+        'collect': collect,
+    })
+    for path in files:
+        f = open(path, 'rb')
+        try:
+            shutil.copyfileobj(f, stream, CHUNK_SIZE)
+        finally:
+            f.close()
+    stream.close()
+
+
+def _send(stream, message):
+    stream.write(json.dumps(message).encode('utf-8') + b"\n")
+    stream.flush()
+
+
+def _receive(stream):
+    line = stream.readline()
+    if not line:
+        return None
+    return json.loads(line.decode('utf-8'))
+
+
+def _receive_file(stream, path, size):
+    """
+    Write the next size bytes of stream to path.
+    """
+    f = open(path, 'wb')
+    try:
+        while size > 0:
+            chunk = stream.read(min(size, CHUNK_SIZE))
+            if not chunk:
+                raise TitoException("Connection to worker lost receiving %s" %
+                    path)
+            f.write(chunk)
+            size -= len(chunk)
+    finally:
+        f.close()
+
+
+def _safe_join(root, name):
+    """
+    Join a path sent by the other side to root, refusing any outside it.
+    """
+    path = os.path.normpath(os.path.join(root, name))
+    if not path.startswith(os.path.normpath(root) + os.sep):
+        raise TitoException("Refusing to write outside %s: %s" % (root, name))
+    return path
+
+
+def serve(instream, outstream):
+    """
+    Run one job sent by run_on_worker, in a temporary directory which is
+    removed afterwards.
+    """
+    header = _receive(instream)
+    work_dir = tempfile.mkdtemp(prefix="tito-worker-")
+    try:
+        for name, size in header['files']:
+            _receive_file(instream, _safe_join(work_dir, name), size)
+
+        env = os.environ.copy()
+        env['LC_ALL'] = 'C'
+        p = subprocess.Popen(header['command'], shell=True, cwd=work_dir,
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env)
+        for line in iter(p.stdout.readline, b''):
+            _send(outstream, {'log': line.decode('utf-8', 'replace').rstrip(
+                '\n')})
+        p.stdout.close()
+        status = p.wait()
+
+        results = []
+        for pattern in header['collect']:
+            for path in sorted(glob.glob(os.path.join(work_dir, pattern))):
+                if os.path.isfile(path) and path not in results:
+                    results.append(path)
+        _send(outstream, {'status': status, 'files': [[os.path.relpath(path,
+            work_dir), os.path.getsize(path)] for path in results]})
+        for path in results:
+            f = open(path, 'rb')
+            try:
+                shutil.copyfileobj(f, outstream, CHUNK_SIZE)
+            finally:
+                f.close()
+        outstream.flush()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    serve(getattr(sys.stdin, 'buffer', sys.stdin),
+        getattr(sys.stdout, 'buffer', sys.stdout))
@@ -87,7 +87,8 @@ def _git_release(self):
 
         # Mead builds need to be in the git_root.  Other builders are agnostic.
         with chdir(self.git_root):
-            self.builder.tgz()
+            with self.builder.timer.stage("tgz"):
+                self.builder.tgz()
 
         if self.test:
             self.builder._setup_test_specfile()
@@ -0,0 +1,207 @@
+# Copyright (c) 2008-2011 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+"""
+A minimal client for the Koji hub's XML-RPC API, used by KojiReleaser when
+koji_backend = api instead of running the koji command for every tag.
+"""
+import base64
+import hashlib
+import os
+import random
+import sys
+import time
+
+from tito.common import debug
+from tito.compat import xmlrpclib
+from tito.exception import TitoException
+
+# Koji task states, see koji.TASK_STATES:
+TASK_STATES = {
+    0: 'FREE',
+    1: 'OPEN',
+    2: 'CLOSED',
+    3: 'CANCELED',
+    4: 'ASSIGNED',
+    5: 'FAILED',
+}
+FINISHED_TASK_STATES = ['CLOSED', 'CANCELED', 'FAILED']
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class KojiSession(object):
+    """
+    A session with a Koji hub.
+
+    All calls share one transport, so the HTTP connection to the hub is
+    reused rather than re-established (and re-authenticated) for every call.
+    """
+
+    def __init__(self, server, cert=None, serverca=None):
+        self.server = server
+        self.session_id = None
+        self.session_key = None
+        self.callnum = 0
+
+        # Files already uploaded during this session, by content hash:
+        self.uploads = {}
+
+        if server.startswith("https"):
+            context = None
+            if cert or serverca:
+                import ssl
+                context = ssl.create_default_context(cafile=serverca)
+                if cert:
+                    context.load_cert_chain(cert)
+            self.transport = xmlrpclib.SafeTransport(context=context)
+        else:
+            self.transport = xmlrpclib.Transport()
+
+    def _proxy(self):
+        url = self.server
+        if self.session_id:
+            self.callnum += 1
+            url = "%s?session-id=%s&session-key=%s&callnum=%s" % (url,
+                self.session_id, self.session_key, self.callnum)
+        return xmlrpclib.ServerProxy(url, transport=self.transport,
+            allow_none=True)
+
+    def call(self, method, *args):
+        """
+        Call a hub method, raising a TitoException if it fails.
+        """
+        debug("Koji call: %s" % method)
+        try:
+            return getattr(self._proxy(), method)(*args)
+        except xmlrpclib.Fault:
+            fault = sys.exc_info()[1]
+            raise TitoException("Koji %s failed: %s" % (method,
+                fault.faultString))
+
+    def multicall(self, calls):
+        """
+        Make several (method, args) hub calls in a single request, returning
+        their results in order. Raises a TitoException if any failed.
+        """
+        results = self.call('multiCall', [{'methodName': method,
+            'params': list(args)} for (method, args) in calls])
+        values = []
+        errors = []
+        for (method, args), result in zip(calls, results):
+            if isinstance(result, dict):
+                errors.append("%s%s: %s" % (method, tuple(args),
+                    result.get('faultString')))
+            else:
+                values.append(result[0])
+        if errors:
+            raise TitoException("Koji calls failed:\n%s" % "\n".join(errors))
+        return values
+
+    def login(self, user=None, password=None):
+        """
+        Log in with a password if one is given, otherwise with the client
+        certificate the session was created with.
+        """
+        if user and password:
+            session = self.call('login', user, password, {})
+        else:
+            session = self.call('sslLogin')
+        self.session_id = session['session-id']
+        self.session_key = session['session-key']
+        self.callnum = 0
+
+    def logout(self):
+        if self.session_id:
+            self.call('logout')
+            self.session_id = None
+
+    def upload(self, path):
+        """
+        Upload a file to the hub's work area and return its path there for
+        use as a build source. Identical files are only uploaded once.
+        """
+        md5 = hashlib.md5()
+        f = open(path, 'rb')
+        try:
+            for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b''):
+                md5.update(chunk)
+        finally:
+            f.close()
+        if md5.hexdigest() in self.uploads:
+            return self.uploads[md5.hexdigest()]
+
+        # Same layout the koji command uses, so the hub cleans it up:
+        server_dir = "cli-build/%r.%s" % (time.time(),
+            ''.join([random.choice('abcdefghijklmnopqrstuvwxyz')
+                for i in range(8)]))
+        name = os.path.basename(path)
+        size = os.path.getsize(path)
+        offset = 0
+        f = open(path, 'rb')
+        try:
+            for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b''):
+                self.call('uploadFile', server_dir, name, size,
+                    ('md5', hashlib.md5(chunk).hexdigest()), offset,
+                    base64.b64encode(chunk).decode('ascii'))
+                offset += len(chunk)
+        finally:
+            f.close()
+
+        # An offset of -1 asks the hub to verify the whole file:
+        if not self.call('uploadFile', server_dir, name, size,
+                ('md5', md5.hexdigest()), -1, ''):
+            raise TitoException("Koji upload of %s failed verification" %
+                path)
+        self.uploads[md5.hexdigest()] = "%s/%s" % (server_dir, name)
+        return self.uploads[md5.hexdigest()]
+
+    def build(self, builds, opts=None):
+        """
+        Submit builds of (source, target) in a single request, returning
+        their task IDs in order.
+        """
+        return self.multicall([('build', (source, target, opts or {}))
+            for (source, target) in builds])
+
+    def wait_for_tasks(self, task_ids, interval=1, max_interval=60,
+            callback=None):
+        """
+        Poll the hub until all the given tasks finish, doubling the time
+        between polls (up to max_interval seconds) while nothing changes.
+
+        callback, if given, is called with (task_id, state) whenever a task
+        changes state. Returns a dict of the final state of each task.
+        """
+        states = {}
+        delay = interval
+        while True:
+            pending = [task_id for task_id in task_ids
+                if states.get(task_id) not in FINISHED_TASK_STATES]
+            if not pending:
+                return states
+            infos = self.multicall([('getTaskInfo', (task_id,))
+                for task_id in pending])
+            changed = False
+            for task_id, info in zip(pending, infos):
+                state = TASK_STATES.get(info['state'], str(info['state']))
+                if states.get(task_id) != state:
+                    states[task_id] = state
+                    changed = True
+                    if callback:
+                        callback(task_id, state)
+            if [t for t in pending if states[t] not in FINISHED_TASK_STATES]:
+                if changed:
+                    delay = interval
+                else:
+                    delay = min(delay * 2, max_interval)
+                time.sleep(delay)
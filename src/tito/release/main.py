@@ -15,16 +15,16 @@
 """
 
 import copy
+import glob
 import os
 import sys
-import rpm
 
 from tempfile import mkdtemp
-import shutil
 
 from tito.common import create_builder, debug, \
-    run_command, get_project_name, warn_out, error_out
-from tito.compat import PY2, dictionary_override
+    run_command, get_project_name, warn_out, error_out, run_parallel, \
+    place_file, get_trash_dir, remove_tree
+from tito.compat import PY2, dictionary_override, RawConfigParser
 from tito.exception import TitoException
 from tito.config_object import ConfigObject
 
@@ -91,6 +91,8 @@ def __init__(self, name=None, tag=None, build_dir=None,
         self.working_dir = mkdtemp(dir=self.builder.rpmbuild_basedir,
                 prefix="release-%s" % self.builder.project_name)
         print("Working in: %s" % self.working_dir)
+        self.trash_dir = get_trash_dir(self.builder.rpmbuild_basedir,
+            user_config)
 
         self.dry_run = False
         self.test = test  # releaser must know to use builder designation rather than tag
@@ -154,10 +156,18 @@ def _parse_builder_args(self, releaser_config, target):
     def release(self, dry_run=False, no_build=False, scratch=False):
         pass
 
+    def record_build_times(self, ok):
+        """
+        Add the timings of the builder stages run by this release to the
+        history in the build dir, as tito build does.
+        """
+        if self.builder:
+            self.builder._record_build_times(ok)
+
     def cleanup(self):
         if not self.no_cleanup:
             debug("Cleaning up [%s]" % self.working_dir)
-            run_command("rm -rf %s" % self.working_dir)
+            remove_tree(self.working_dir, self.trash_dir)
 
             if self.builder:
                 self.builder.cleanup()
@@ -200,8 +210,8 @@ def _sync_files(self, files_to_copy, dest_dir):
                 print("   copying: %s" % base_filename)
                 copied_files.append(base_filename)
 
-            cmd = "cp %s %s" % (copy_me, dest_path)
-            run_command(cmd)
+            # Never hard link into the checkout, files there get edited:
+            place_file(copy_me, dest_path, link=False)
 
         # Track filenames that will need to be deleted by the caller.
         for filename in os.listdir(dest_dir):
@@ -253,15 +263,18 @@ def release(self, dry_run=False, no_build=False, scratch=False):
 
         # Should this run?
         self.builder.no_cleanup = self.no_cleanup
-        self.builder.tgz()
+        with self.builder.timer.stage("tgz"):
+            self.builder.tgz()
 
         # Check if the releaser specifies a srpm disttag:
         srpm_disttag = None
         if self.releaser_config.has_option(self.target, "srpm_disttag"):
             srpm_disttag = self.releaser_config.get(self.target, "srpm_disttag")
-        self.builder.srpm(dist=srpm_disttag)
+        with self.builder.timer.stage("srpm"):
+            self.builder.srpm(dist=srpm_disttag)
 
-        self.builder.rpm()
+        with self.builder.timer.stage("rpm"):
+            self.builder.rpm()
         self.builder.cleanup()
 
         if self.releaser_config.has_option(self.target, 'rsync_args'):
@@ -301,7 +314,7 @@ def rsync_to_remote(self, rsync_args, temp_dir, rsync_location):
         if not self.no_cleanup:
             debug("Cleaning up [%s]" % temp_dir)
             os.chdir("/")
-            shutil.rmtree(temp_dir)
+            remove_tree(temp_dir, self.trash_dir)
         else:
             warn_out("leaving %s (--no-cleanup)" % temp_dir)
 
@@ -324,7 +337,7 @@ def _copy_files_to_temp_dir(self, temp_dir):
 
             if artifact_type in self.filetypes:
                 print("copy: %s > %s" % (artifact, temp_dir))
-                shutil.copy(artifact, temp_dir)
+                place_file(artifact, temp_dir, link=False)
 
     def process_packages(self, temp_dir):
         """ no-op. This will be overloaded by a subclass if needed. """
@@ -386,6 +399,7 @@ def prune_other_versions(self, temp_dir):
         Both older and newer packages will be removed (can be used
         to downgrade the contents of a yum repo).
         """
+        import rpm
         os.chdir(temp_dir)
         rpm_ts = rpm.TransactionSet()
         self.new_rpm_dep_sets = {}
@@ -450,6 +464,20 @@ def __init__(self, name=None, tag=None, build_dir=None,
 
         self.executable = "koji"
 
+        # Submit builds by running the koji command, or by talking to the hub
+        # directly:
+        self.koji_backend = "cli"
+        if self.releaser_config.has_option(self.target, "koji_backend"):
+            self.koji_backend = self.releaser_config.get(self.target, "koji_backend")
+        if self.koji_backend not in ["cli", "api"]:
+            error_out("Unknown koji_backend for release target '%s': %s" %
+                (self.target, self.koji_backend))
+
+        self.koji_watch = False
+        if self.releaser_config.has_option(self.target, "koji_watch"):
+            self.koji_watch = self.releaser_config.getboolean(self.target,
+                "koji_watch")
+
         self.only_tags = []
         if 'ONLY_TAGS' in os.environ:
             self.only_tags = os.environ['ONLY_TAGS'].split(' ')
@@ -480,7 +508,7 @@ def _koji_release(self):
         if 'KOJI_OPTIONS' in self.builder.user_config:
             koji_opts = self.builder.user_config['KOJI_OPTIONS']
 
-        if self.scratch or ('SCRATCH' in os.environ and os.environ['SCRATCH'] == '1'):
+        if self._is_scratch():
             koji_opts = ' '.join([koji_opts, '--scratch'])
 
         if self.profile:
@@ -490,6 +518,7 @@ def _koji_release(self):
             koji_opts = ' '.join(['--config', self.conf_file, koji_opts])
 
         # TODO: need to re-do this metaphor to use release targets instead:
+        builds = []
         for koji_tag in koji_tags:
             if self.only_tags and koji_tag not in self.only_tags:
                 continue
@@ -516,18 +545,172 @@ def _koji_release(self):
                     "   Package *NOT* submitted to %s." % self.NAME,
                 ])
                 continue
+            builds.append((koji_tag, disttag, scl))
+
+        if self.koji_backend == "api":
+            self._api_release(builds)
+            return
 
-            # Getting tricky here, normally Builder's are only used to
-            # create one rpm and then exit. Here we're going to try
-            # to run multiple srpm builds:
-            builder = self.builder
-            if not self.skip_srpm:
-                if scl:
-                    builder = copy.copy(self.builder)
-                    builder.scl = scl
+        if self.skip_srpm:
+            for koji_tag, disttag, scl in builds:
+                self._submit_build(self.executable, koji_opts, koji_tag,
+                    self.builder.srpm_location)
+            return
+
+        for srpm_location, srpm_koji_tags in self._create_srpms(builds):
+            for koji_tag in srpm_koji_tags:
+                self._submit_build(self.executable, koji_opts, koji_tag,
+                    srpm_location)
+
+    def _create_srpms(self, builds):
+        """
+        Create one srpm for each distinct disttag and scl among the given
+        (koji tag, disttag, scl) builds, yielding (srpm location, koji tags)
+        as each srpm becomes ready.
+
+        The first srpm is created with our builder, which also sets up the
+        sources and spec file. The rest only read those, and are created
+        concurrently using copies of the builder with their own rpmbuild
+        topdir. Up to srpm_jobs (default is one per CPU) run at once.
+        """
+        srpm_tags = {}
+        srpms = []
+        for koji_tag, disttag, scl in builds:
+            if (disttag, scl) not in srpm_tags:
+                srpm_tags[(disttag, scl)] = []
+                srpms.append((disttag, scl))
+            srpm_tags[(disttag, scl)].append(koji_tag)
+        if not srpms:
+            return
+
+        # Getting tricky here, normally Builder's are only used to
+        # create one rpm and then exit. Here we're going to try
+        # to run multiple srpm builds:
+        disttag, scl = srpms[0]
+        builder_scl = self.builder.scl
+        if scl:
+            self.builder.scl = scl
+        try:
+            with self.builder.timer.stage("srpm"):
+                self.builder.srpm(dist=disttag)
+        finally:
+            self.builder.scl = builder_scl
+        yield (self.builder.srpm_location, srpm_tags[srpms[0]])
+
+        jobs = None
+        if self.releaser_config.has_option(self.target, "srpm_jobs"):
+            jobs = self.releaser_config.getint(self.target, "srpm_jobs")
+
+        def create_srpm(srpm):
+            disttag, scl = srpm
+            builder = copy.copy(self.builder)
+            if scl:
+                builder.scl = scl
+            builder.rpmbuild_dir = mkdtemp(dir=self.builder.rpmbuild_dir,
+                prefix="srpm-")
+            builder.rpmbuild_builddir = os.path.join(builder.rpmbuild_dir,
+                "BUILD")
+            with builder.timer.stage("srpm"):
                 builder.srpm(dist=disttag)
+            return builder.srpm_location
+
+        for srpm, srpm_location in run_parallel(create_srpm, srpms[1:], jobs):
+            yield (srpm_location, srpm_tags[srpm])
 
-            self._submit_build(self.executable, koji_opts, koji_tag, builder.srpm_location)
+    def _is_scratch(self):
+        return self.scratch or ('SCRATCH' in os.environ and os.environ['SCRATCH'] == '1')
+
+    def _api_release(self, builds):
+        """
+        Submit builds for the given (koji tag, disttag, scl) using the Koji
+        hub's API: each srpm is uploaded once (as soon as it's ready) and all
+        builds are then submitted in a single call.
+        """
+        if self.dry_run:
+            session = None
+        else:
+            session = self._koji_session()
+
+        try:
+            sources = []
+            if self.skip_srpm:
+                for koji_tag, disttag, scl in builds:
+                    sources.append((self._get_build_source(session, None),
+                        koji_tag))
+            else:
+                for srpm_location, koji_tags in self._create_srpms(builds):
+                    source = self._get_build_source(session, srpm_location)
+                    sources.extend([(source, koji_tag) for koji_tag in koji_tags])
+            if not sources:
+                return
+
+            opts = {}
+            if self._is_scratch():
+                opts['scratch'] = True
+            for source, koji_tag in sources:
+                print("\nSubmitting build of %s to %s" % (source, koji_tag))
+            if self.dry_run:
+                self.print_dry_run_warning("koji API build %s" % opts)
+                return
+
+            task_ids = session.build(sources, opts)
+            for (source, koji_tag), task_id in zip(sources, task_ids):
+                print("Created task %s for %s" % (task_id, koji_tag))
+            if self.koji_watch:
+                self._watch_tasks(session, task_ids)
+        finally:
+            if session:
+                session.logout()
+
+    def _watch_tasks(self, session, task_ids):
+        def report(task_id, state):
+            print("Task %s: %s" % (task_id, state))
+        states = session.wait_for_tasks(task_ids, callback=report)
+        failed = [str(task_id) for task_id in task_ids
+            if states[task_id] != "CLOSED"]
+        if failed:
+            error_out("Koji tasks did not complete: %s" % ", ".join(failed))
+
+    def _get_build_source(self, session, srpm_location):
+        """
+        Return the source to pass to the Koji hub when building, uploading
+        the srpm if necessary.
+        """
+        if session is None:
+            return os.path.basename(srpm_location)
+        return session.upload(srpm_location)
+
+    def _koji_session(self):
+        """
+        Return a logged in KojiSession, configured from the same koji
+        configuration files (and profile) as the koji command would use.
+        """
+        from tito.release.kojiapi import KojiSession
+
+        koji_config = RawConfigParser()
+        koji_config.read(sorted(glob.glob("/etc/koji.conf.d/*.conf")) +
+            ["/etc/koji.conf", os.path.expanduser("~/.koji/config")] +
+            [f for f in [self.conf_file] if f])
+        section = self.profile or "koji"
+
+        def lookup(option):
+            if koji_config.has_option(section, option):
+                return os.path.expanduser(koji_config.get(section, option))
+            return None
+
+        server = lookup("server")
+        if self.releaser_config.has_option(self.target, "koji_server"):
+            server = self.releaser_config.get(self.target, "koji_server")
+        if not server:
+            error_out("No Koji hub configured for release target '%s', "
+                "set koji_server or koji_profile." % self.target)
+
+        user_config = self.builder.user_config or {}
+        session = KojiSession(server, cert=lookup("cert"),
+            serverca=lookup("serverca"))
+        session.login(user_config.get('KOJI_USER'),
+            user_config.get('KOJI_PASSWORD'))
+        return session
 
     def __is_whitelisted(self, koji_tag, scl):
         """ Return true if package is whitelisted in tito.props"""
@@ -566,6 +749,15 @@ def _koji_release(self):
         self.skip_srpm = True
         KojiReleaser._koji_release(self)
 
+    def _get_build_source(self, session, srpm_location):
+        """
+        Build from the git URL from config, rather than uploading a srpm.
+
+        NOTE: overrides KojiReleaser._get_build_source.
+        """
+        return "%s/#%s" % (self.releaser_config.get(self.target, 'git_url'),
+            self.builder.build_tag)
+
     def _submit_build(self, executable, koji_opts, tag, srpm_location):
         """
         Submit build to koji using the git URL from config. We will ignore
@@ -55,7 +55,8 @@ def release(self, dry_run=False, no_build=False, scratch=False):
 
         os.chdir(self.package_workdir)
 
-        self.builder.tgz()
+        with self.builder.timer.stage("tgz"):
+            self.builder.tgz()
         if self.test:
             self.builder._setup_test_specfile()
 
@@ -0,0 +1,197 @@
+# Copyright (c) 2008-2011 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+"""
+Scratch space for rpmbuild's BUILD directory on a tmpfs or fast local disk,
+shared by concurrent tito runs within a size budget.
+"""
+import errno
+import os
+import shutil
+import sys
+import tempfile
+
+from contextlib import contextmanager
+
+from tito.cache import read_json, write_json
+from tito.common import debug, mkdir_p, warn_out
+
+# Size budget of the scratch space in megabytes, see SCRATCH_SIZE:
+DEFAULT_SCRATCH_SIZE = 2048
+
+# How much larger than its sources a build tree is assumed to grow, when
+# there's no earlier build of the package to go by:
+SOURCE_EXPANSION = 5
+
+# Headroom on the size of an earlier build of the package:
+HISTORY_MARGIN = 1.25
+
+RESERVATIONS_DIRNAME = ".reservations"
+LOCK_FILENAME = ".lock"
+
+
+def get_scratch_space(user_config):
+    """
+    Return the ScratchSpace set with SCRATCH_DIR in ~/.titorc, or None if
+    builds should use the build dir as usual.
+    """
+    user_config = user_config or {}
+    path = user_config.get('SCRATCH_DIR', '').strip()
+    if not path:
+        return None
+    try:
+        size = int(user_config.get('SCRATCH_SIZE', DEFAULT_SCRATCH_SIZE))
+    except ValueError:
+        warn_out("Invalid SCRATCH_SIZE in ~/.titorc: %s" %
+            user_config['SCRATCH_SIZE'])
+        size = DEFAULT_SCRATCH_SIZE
+    return ScratchSpace(os.path.expanduser(path), size * 1024 * 1024)
+
+
+def tree_size(path):
+    """
+    Return the total size in bytes of the files below path.
+    """
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def estimate_size(history_file, sources):
+    """
+    Return how many bytes a build is expected to need, from the size its
+    last build reached (recorded by record_size), or failing that its
+    sources.
+    """
+    history = history_file and read_json(history_file)
+    if history and history.get('size'):
+        return int(history['size'] * HISTORY_MARGIN)
+    total = 0
+    for source in sources:
+        if os.path.isfile(source):
+            total += os.path.getsize(source)
+    return total * SOURCE_EXPANSION
+
+
+def record_size(history_file, size):
+    """
+    Remember the size a build reached, for estimate_size.
+    """
+    write_json(history_file, {'size': size})
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        # Running as someone else:
+        return sys.exc_info()[1].errno == errno.EPERM
+    return True
+
+
+class ScratchSpace(object):
+    """
+    A directory on a tmpfs or fast local disk to build in, with a budget of
+    size bytes.
+
+    Each build reserves what it expects to need before it starts, in a
+    file under .reservations, so concurrent builds (which all see the same
+    free space) can't oversubscribe it between them. Reservations are
+    made under a lock, and those of processes which have gone away are
+    reclaimed along with whatever they left behind.
+    """
+
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self.reservations_dir = os.path.join(path, RESERVATIONS_DIRNAME)
+
+    @contextmanager
+    def _lock(self):
+        import fcntl
+        f = open(os.path.join(self.path, LOCK_FILENAME), 'a')
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            yield
+        finally:
+            f.close()
+
+    def _free(self):
+        st = os.statvfs(self.path)
+        return st.f_bavail * st.f_frsize
+
+    def _reserved(self):
+        """
+        Return the bytes reserved by running builds, reclaiming the space
+        of any which didn't release theirs.
+        """
+        total = 0
+        for name in os.listdir(self.reservations_dir):
+            if name.startswith("."):
+                # Being written by write_json:
+                continue
+            reservation = os.path.join(self.reservations_dir, name)
+            data = read_json(reservation)
+            if data and data.get('pid') and _pid_alive(data['pid']):
+                total += data.get('size', 0)
+                continue
+            debug("Reclaiming stale scratch space: %s" % name)
+            shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+            try:
+                os.remove(reservation)
+            except OSError:
+                pass
+        return total
+
+    def reserve(self, name, size):
+        """
+        Return a new directory to build in which is expected to need size
+        bytes, or None if the scratch space doesn't have room for it.
+        """
+        try:
+            mkdir_p(self.reservations_dir)
+            with self._lock():
+                reserved = self._reserved()
+                free = self._free()
+                if reserved + size > self.size or size > free:
+                    debug("No room in scratch space for %s bytes: %s of %s "
+                        "reserved, %s free" % (size, reserved, self.size,
+                        free))
+                    return None
+                work_dir = tempfile.mkdtemp(dir=self.path, prefix=name)
+                write_json(os.path.join(self.reservations_dir,
+                    os.path.basename(work_dir)),
+                    {'pid': os.getpid(), 'size': size})
+        except (IOError, OSError, ImportError):
+            warn_out("Unable to use scratch space %s: %s" % (self.path,
+                sys.exc_info()[1]))
+            return None
+        debug("Reserved %s bytes of scratch space: %s" % (size, work_dir))
+        return work_dir
+
+    def release(self, work_dir, remove=True):
+        """
+        Give back a directory returned by reserve, deleting it unless told
+        otherwise.
+        """
+        try:
+            os.remove(os.path.join(self.reservations_dir,
+                os.path.basename(work_dir)))
+        except OSError:
+            pass
+        if remove:
+            shutil.rmtree(work_dir, ignore_errors=True)
@@ -16,7 +16,6 @@
 
 import os
 import re
-import rpm
 import shutil
 import subprocess
 import sys
@@ -37,13 +36,126 @@
         get_spec_version_and_release, replace_version,
         tag_exists_locally, tag_exists_remotely, head_points_to_tag, undo_tag,
         increase_version, reset_release, increase_zstream, warn_out,
-        BUILDCONFIG_SECTION, get_relative_project_dir_cwd, info_out)
+        BUILDCONFIG_SECTION, get_relative_project_dir_cwd, info_out, chdir,
+        get_package_metadata_index)
 from tito.compat import write, StringIO, getstatusoutput
 from tito.exception import TitoException
 from tito.config_object import ConfigObject
 from tito.tagger.cargobump import CargoBump
 
 
+class PackageHistory(object):
+    """
+    Commits made to many packages since each was last tagged, gathered with
+    a single walk of the git history.
+
+    packages is a dict mapping package name to a tuple of the commit the
+    package was last tagged at and its directory relative to the git root.
+    """
+
+    def __init__(self, packages):
+        self.packages = packages
+        # Maps package name to commits touching it since it was last tagged,
+        # newest first:
+        self.commits = {}
+        # Those of the commits which are merges:
+        self.merges = set()
+        # Formatted commit lines, keyed by pretty format then commit:
+        self._formatted = {}
+        self._walk()
+
+    def _git(self, args, stdin=None):
+        p = subprocess.Popen(["git"] + args, stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE, universal_newlines=True)
+        output = p.communicate(stdin)[0]
+        if p.returncode != 0:
+            raise TitoException("Error running: git %s" % " ".join(args))
+        return output
+
+    def _walk(self):
+        tag_commits = [commit for (commit, relative_dir) in
+            self.packages.values()]
+        if not tag_commits:
+            return
+        # Everything since the oldest of the tags:
+        base = self._git(["merge-base", "--octopus"] + tag_commits).strip()
+        # With -m, merges are listed once per parent with the files which
+        # differ from it:
+        output = self._git(["log", "--topo-order", "-m", "--format=%x00%H %P",
+            "--name-only", "HEAD", "--not", base])
+
+        order = []
+        parents = {}
+        diffs = {}
+        for entry in output.split("\0")[1:]:
+            lines = entry.strip("\n").split("\n")
+            ids = lines[0].split()
+            if ids[0] not in diffs:
+                order.append(ids[0])
+                parents[ids[0]] = ids[1:]
+                diffs[ids[0]] = []
+                if len(ids) > 2:
+                    self.merges.add(ids[0])
+            diffs[ids[0]].append([line for line in lines[1:] if line])
+
+        for name, (tag_commit, relative_dir) in self.packages.items():
+            prefix = relative_dir.strip("/")
+            if prefix == ".":
+                prefix = ""
+            # Anything the tag already includes doesn't count:
+            tagged = set()
+            todo = [tag_commit]
+            while todo:
+                commit = todo.pop()
+                if commit in tagged or commit not in parents:
+                    continue
+                tagged.add(commit)
+                todo.extend(parents[commit])
+
+            # As git log -- <dir> does, a merge only counts if the package
+            # differs from all of its parents:
+            changes = []
+            for commit in order:
+                if commit in tagged:
+                    continue
+                touched = [files for files in diffs[commit] if [path for path
+                    in files if not prefix or path.startswith(prefix + "/")]]
+                if len(touched) == len(diffs[commit]):
+                    changes.append(commit)
+            if changes:
+                self.commits[name] = changes
+
+    def changed_packages(self):
+        """ Return the names of all packages changed since last tagged. """
+        return sorted(self.commits.keys())
+
+    def log(self, name, pretty_format, no_merges=True):
+        """
+        Return git log style output for the given package, one line per
+        commit in the given pretty format, leaving out merge commits as
+        git log --no-merges would unless no_merges is False.
+
+        The first request for a format formats the commits for every package
+        in one go.
+        """
+        if pretty_format not in self._formatted:
+            wanted = set()
+            for commits in self.commits.values():
+                wanted.update(commits)
+            formatted = {}
+            if wanted:
+                output = self._git(["log", "--no-walk=unsorted", "--stdin",
+                    "--format=%x00%H%x00" + pretty_format], "\n".join(wanted))
+                entries = output.split("\0")[1:]
+                for i in range(0, len(entries) - 1, 2):
+                    formatted[entries[i]] = entries[i + 1].strip("\n")
+            self._formatted[pretty_format] = formatted
+        formatted = self._formatted[pretty_format]
+        return "\n".join([formatted.get(commit, "")
+            for commit in self.commits.get(name, [])
+            if not (no_merges and commit in self.merges)])
+
+
 class VersionTagger(ConfigObject):
     """
     Standard Tagger class, used for tagging packages built from source in
@@ -82,13 +194,22 @@ def __init__(self, config=None, keep_version=False, offline=False, user_config=N
         self._changelog = None
         self.offline = offline
 
+        # Set when tagging many packages at once, see run_bulk():
+        self._shared_history = None
+        self._defer_commit = False
+        self._new_version = None
+
     def run(self, options):
         """
         Perform the actions requested of the tagger.
 
         NOTE: this method may do nothing if the user requested no build actions
         be performed. (i.e. only release tagging, etc)
+
+        When tagging in bulk, returns the new version which was staged for
+        run_bulk() to commit and tag.
         """
+        self._new_version = None
         if options.tag_release:
             warn_out("--tag-release option no longer necessary,"
                 " 'tito tag' will accomplish the same thing.")
@@ -112,9 +233,56 @@ def run(self, options):
             self._undo()
         else:
             self._tag_release()
+        return self._new_version
+
+    @staticmethod
+    def run_bulk(taggers, options, history):
+        """
+        Tag new versions of many packages at once, recording all of them in
+        a single commit with one tag per package.
+
+        Each tagger must be a VersionTagger created from within its
+        package's directory. history is the PackageHistory used to generate
+        their changelogs.
+        """
+        for tagger in taggers:
+            if not isinstance(tagger, VersionTagger):
+                raise TitoException("%s does not support tagging many "
+                    "packages at once, please tag %s on its own." %
+                    (tagger.__class__.__name__, tagger.project_name))
+
+        new_versions = []
+        for tagger in taggers:
+            tagger._shared_history = history
+            tagger._defer_commit = True
+            with chdir(tagger.full_project_dir):
+                new_version = tagger.run(options)
+            if not new_version:
+                raise TitoException("%s did not stage a new version of %s "
+                    "to commit, please tag it on its own." %
+                    (tagger.__class__.__name__, tagger.project_name))
+            new_versions.append(new_version)
+
+        msgs = [tagger._get_commit_message(new_version)
+            for tagger, new_version in zip(taggers, new_versions)]
+        if len(msgs) > 1:
+            msgs = ["Automatic commit of %s packages." % len(msgs),
+                "\n".join(msgs)]
+        msgs.extend(["Created by command:", " ".join(sys.argv[:])])
+        run_command("git commit %s" % " ".join(["-m %s" % quote(msg)
+            for msg in msgs]))
+
+        new_tags = []
+        for tagger, new_version in zip(taggers, new_versions):
+            tagger._create_tag(new_version)
+            new_tags.append(tagger._get_new_tag(new_version))
+        print("   View: git show HEAD")
+        print("   Push: git push origin && git push origin %s" %
+            " ".join(new_tags))
 
     def check_tag_precondition(self):
         if self.config.has_option("tagconfig", "require_package"):
+            import rpm
             packages = self.config.get("tagconfig", "require_package").split(',')
             ts = rpm.TransactionSet()
             missing_packages = []
@@ -201,22 +369,38 @@ def _generate_default_changelog(self, last_tag):
         Run git-log and will generate changelog, which still can be edited by user
         in _make_changelog.
         """
-        patch_command = "git log"
+        no_merges = True
         if self.config.has_option(BUILDCONFIG_SECTION, "keep_merge_commits"):
             keep = self.config.get(BUILDCONFIG_SECTION, "keep_merge_commits")
-            if not keep or keep.strip().lower() not in ['1', 'true']:
-                patch_command += " --no-merges"
-        else:
-            patch_command += " --no-merges"
-        patch_command += " --pretty='format:%s' --relative %s..%s -- %s" % (
-            self._changelog_format(), last_tag, "HEAD", ".")
-        output = run_command(patch_command)
+            if keep and keep.strip().lower() in ['1', 'true']:
+                no_merges = False
+        output = self._changelog_git_log(self._changelog_format(), last_tag,
+            no_merges=no_merges)
         result = []
         for line in output.split('\n'):
             line = line.replace('%', '%%')
             result.extend([self._changelog_remove_cherrypick(line)])
         return '\n'.join(result)
 
+    def _changelog_git_log(self, pretty_format, last_tag, no_merges=True):
+        """
+        Return git log output for commits to this package since last_tag,
+        one line per commit in the given pretty format.
+
+        When tagging many packages at once these come from a history walk
+        shared by all of them rather than a git log per package.
+        """
+        if self._shared_history is not None:
+            return self._shared_history.log(self.project_name, pretty_format,
+                no_merges=no_merges)
+
+        patch_command = "git log"
+        if no_merges:
+            patch_command += " --no-merges"
+        patch_command += " --pretty='format:%s' --relative %s..%s -- %s" % (
+            pretty_format, last_tag, "HEAD", ".")
+        return run_command(patch_command)
+
     def _make_changelog(self):
         """
         Create a new changelog entry in the spec, with line items from git
@@ -458,12 +642,30 @@ def _update_package_metadata(self, new_version):
 
         with open(metadata_file, 'w') as f:
             f.write("%s %s\n" % (new_version_w_suffix, self.relative_project_dir))
+        get_package_metadata_index(self.git_root).update(self.project_name,
+            new_version_w_suffix, self.relative_project_dir)
 
         # Git add it (in case it's a new file):
         run_command("git add %s" % metadata_file)
         run_command("git add %s" % os.path.join(self.full_project_dir,
             self.spec_file_name))
 
+        if self._defer_commit:
+            # run_bulk() will commit and tag once all packages are staged:
+            self._new_version = new_version
+            return
+
+        msg = self._get_commit_message(new_version)
+        run_command('git commit -m {0} -m {1} -m {2}'.format(
+            quote(msg), quote("Created by command:"), quote(" ".join(sys.argv[:]))))
+        self._create_tag(new_version)
+        print("   View: git show HEAD")
+        print("   Undo: tito tag -u")
+        print("   Push: git push origin && git push origin %s" %
+            self._get_new_tag(new_version))
+
+    def _get_commit_message(self, new_version):
+        """ Return the commit message for tagging the given version. """
         fmt = ('Automatic commit of package '
                '[%(name)s] %(release_type)s [%(version)s].')
         if self.config.has_option(BUILDCONFIG_SECTION, "tag_commit_message_format"):
@@ -479,10 +681,10 @@ def _update_package_metadata(self, new_version):
             exc = sys.exc_info()[1]
             raise TitoException('Unknown placeholder %s in tag_commit_message_format'
                                 % exc)
+        return msg
 
-        run_command('git commit -m {0} -m {1} -m {2}'.format(
-            quote(msg), quote("Created by command:"), quote(" ".join(sys.argv[:]))))
-
+    def _create_tag(self, new_version):
+        """ Tag HEAD as the given version of this package. """
         new_tag = self._get_new_tag(new_version)
         tag_msg = "Tagging package [%s] version [%s] in directory [%s]." % \
                 (self.project_name, new_tag,
@@ -491,9 +693,6 @@ def _update_package_metadata(self, new_version):
         run_command('git tag -m "%s" %s' % (tag_msg, new_tag))
         print
         info_out("Created tag: %s" % new_tag)
-        print("   View: git show HEAD")
-        print("   Undo: tito tag -u")
-        print("   Push: git push origin && git push origin %s" % new_tag)
 
     def _check_tag_does_not_exist(self, new_tag):
         status, output = getstatusoutput(
@@ -510,29 +709,18 @@ def _clear_package_metadata(self):
         .tito/packages/oldpackage and add
         .tito/packages/spacewalk-newpackage.
         """
-        metadata_dir = os.path.join(self.rel_eng_dir, "packages")
-        for filename in os.listdir(metadata_dir):
-            metadata_file = os.path.join(metadata_dir, filename)  # full path
-
-            if os.path.isdir(metadata_file) or filename.startswith("."):
-                continue
-
-            temp_file = open(metadata_file, 'r')
-            (version, relative_dir) = temp_file.readline().split(" ")
-            relative_dir = relative_dir.strip()  # sometimes has a newline
-
-            if relative_dir == self.relative_project_dir:
-                debug("Found metadata for our prefix: %s" %
-                        metadata_file)
-                debug("   version: %s" % version)
-                debug("   dir: %s" % relative_dir)
-                if filename == self.project_name:
-                    debug("Updating %s with new version." %
-                            metadata_file)
-                else:
-                    warn_out("%s also references %s" % (filename, self.relative_project_dir))
-                    print("Assuming package has been renamed and removing it.")
-                    run_command("git rm %s" % metadata_file)
+        index = get_package_metadata_index(self.git_root)
+        for filename in index.packages_in_dir(self.relative_project_dir):
+            metadata_file = os.path.join(index.metadata_dir, filename)
+            debug("Found metadata for our prefix: %s" % metadata_file)
+            debug("   version: %s" % index.get_version(filename))
+            if filename == self.project_name:
+                debug("Updating %s with new version." % metadata_file)
+            else:
+                warn_out("%s also references %s" % (filename, self.relative_project_dir))
+                print("Assuming package has been renamed and removing it.")
+                run_command("git rm %s" % metadata_file)
+                index.remove(filename)
 
     def _get_git_user_info(self):
         """ Return the user.name and user.email git config values. """
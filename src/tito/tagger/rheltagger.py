@@ -1,5 +1,4 @@
 import re
-from tito.common import run_command
 from tito.tagger import ReleaseTagger
 
 
@@ -27,9 +26,8 @@ def _generate_default_changelog(self, last_tag):
         use format:
         - Resolves: #1111 - description
         """
-        patch_command = "git log --pretty='format:%%s%s'" \
-                         " --relative %s..%s -- %s" % (self._changelog_format(), last_tag, "HEAD", ".")
-        output = run_command(patch_command)
+        output = self._changelog_git_log("%%s%s" % self._changelog_format(),
+            last_tag, no_merges=False)
         BZ = {}
         result = None
         for line in reversed(output.split('\n')):
@@ -0,0 +1,196 @@
+# Copyright (c) 2008-2011 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+"""
+Timing of build stages, kept as a history in the build dir so build time
+regressions can be spotted with tito report --build-times.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from tito.common import debug
+
+# Append-only history of builds in the build dir, one json object per line:
+HISTORY_FILENAME = ".build-times.jsonl"
+
+# Number of builds in each of the windows compared to show a trend:
+TREND_WINDOW = 5
+
+
+class BuildTimer(object):
+    """
+    Collects how long each stage of a build took, and which caches it hit.
+
+    Stages may be timed from several threads at once (i.e. concurrent mock
+    chroots), time spent in a stage more than once is added up.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started = time.time()
+            self.stages = {}
+            self.cache_hits = []
+
+    @contextmanager
+    def stage(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add(name, time.time() - start)
+
+    def add(self, name, seconds):
+        with self.lock:
+            self.stages[name] = self.stages.get(name, 0) + seconds
+
+    def cache_hit(self, name):
+        with self.lock:
+            self.cache_hits.append(name)
+
+    def record(self, history_file, package, build_tag, builder, artifacts,
+            ok=True):
+        """
+        Append this build's timings and the sizes of its artifacts to the
+        history file.
+        """
+        sizes = {}
+        for path in artifacts:
+            if os.path.isfile(path):
+                sizes[os.path.basename(path)] = os.path.getsize(path)
+        with self.lock:
+            entry = {
+                'package': package,
+                'build_tag': build_tag,
+                'builder': builder,
+                'time': self.started,
+                'total': time.time() - self.started,
+                'stages': dict(self.stages),
+                'cache_hits': list(self.cache_hits),
+                'artifacts': sizes,
+                'ok': ok,
+            }
+
+        # A single write to a file opened for appending keeps lines from
+        # concurrent tito runs from interleaving:
+        line = json.dumps(entry, sort_keys=True) + "\n"
+        try:
+            fd = os.open(history_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                0o644)
+            try:
+                os.write(fd, line.encode('utf-8'))
+            finally:
+                os.close(fd)
+        except OSError:
+            debug("Unable to record build times in: %s" % history_file)
+
+
+def read_history(history_file, package=None):
+    """
+    Return the builds recorded in the history file, oldest first, optionally
+    only those of the given package.
+    """
+    entries = []
+    try:
+        f = open(history_file, 'r')
+    except IOError:
+        return entries
+    try:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if package is None or entry.get('package') == package:
+                entries.append(entry)
+    finally:
+        f.close()
+    return entries
+
+
+def percentile(values, pct):
+    """
+    Return the pct'th percentile of the given values, interpolating between
+    the closest two.
+    """
+    values = sorted(values)
+    if not values:
+        return None
+    position = (len(values) - 1) * pct / 100.0
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def trend(values, window=TREND_WINDOW):
+    """
+    Return the relative change in the mean of the last window values over
+    the window before it, or None if there aren't enough values.
+    """
+    if len(values) < window * 2:
+        return None
+    recent = sum(values[-window:]) / float(window)
+    previous = sum(values[-window * 2:-window]) / float(window)
+    if not previous:
+        return None
+    return (recent - previous) / previous
+
+
+def format_report(entries):
+    """
+    Return the lines of a report of the percentiles and trend of each
+    package's build stages, and how often it hit each cache.
+    """
+    packages = {}
+    for entry in entries:
+        if entry.get('ok', True):
+            packages.setdefault(entry['package'], []).append(entry)
+
+    lines = []
+    for package in sorted(packages):
+        builds = packages[package]
+        lines.append("%s (%s builds, last %s)" % (package, len(builds),
+            time.strftime("%Y-%m-%d %H:%M", time.localtime(builds[-1]['time']))))
+        lines.append("  %-32s %5s %8s %8s %8s %7s" % ("stage", "runs", "p50",
+            "p90", "max", "trend"))
+
+        stages = [('total', [b['total'] for b in builds])]
+        for name in sorted(set([s for b in builds for s in b['stages']])):
+            stages.append((name, [b['stages'][name] for b in builds
+                if name in b['stages']]))
+        for name, values in stages:
+            change = trend(values)
+            lines.append("  %-32s %5s %7.1fs %7.1fs %7.1fs %7s" % (name,
+                len(values), percentile(values, 50), percentile(values, 90),
+                max(values), change is not None and "%+.0f%%" % (change * 100)
+                or "-"))
+
+        hits = {}
+        for build in builds:
+            for name in set(build['cache_hits']):
+                hits[name] = hits.get(name, 0) + 1
+        if hits:
+            lines.append("  cache hits: %s" % ", ".join(["%s %s/%s" % (name,
+                hits[name], len(builds)) for name in sorted(hits)]))
+
+        sizes = builds[-1]['artifacts']
+        if sizes:
+            lines.append("  artifacts: %.1f MB" % (sum(sizes.values()) /
+                1024.0 / 1024.0))
+        lines.append("")
+    return lines
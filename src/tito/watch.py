@@ -0,0 +1,306 @@
+# Copyright (c) 2008-2011 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+"""
+Support for 'tito build --test --watch', rebuilding a package whenever files
+in its directory change.
+"""
+from __future__ import print_function
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import subprocess
+import time
+
+from tito.common import debug, info_out, warn_out, run_command, chdir, \
+    place_file
+
+# Directories we never look inside of:
+IGNORED_DIRS = ['.git']
+
+# inotify(7) constants:
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | \
+    IN_MOVED_TO | IN_CREATE | IN_DELETE
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def _walk(root):
+    """ os.walk() over root, skipping directories we never watch. """
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d not in IGNORED_DIRS]
+        yield dirpath, dirnames, filenames
+
+
+class PollingWatcher(object):
+    """
+    Detects changes by periodically comparing the mtime and size of every
+    file under a directory. Works everywhere, used when inotify isn't
+    available.
+    """
+    def __init__(self, root, interval=1.0):
+        self.root = root
+        self.interval = interval
+        self.snapshot = self._scan()
+
+    def _scan(self):
+        snapshot = {}
+        for dirpath, dirnames, filenames in _walk(self.root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                snapshot[os.path.relpath(path, self.root)] = (st.st_mtime,
+                    st.st_size)
+        return snapshot
+
+    def poll(self, timeout):
+        """
+        Wait up to timeout seconds for something to change, returning the set
+        of changed file paths relative to the watched directory.
+        """
+        deadline = time.time() + timeout
+        while True:
+            current = self._scan()
+            changed = set()
+            for path in set(current) | set(self.snapshot):
+                if current.get(path) != self.snapshot.get(path):
+                    changed.add(path)
+            self.snapshot = current
+            if changed or time.time() >= deadline:
+                return changed
+            time.sleep(min(self.interval, max(deadline - time.time(), 0)))
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher(object):
+    """
+    Detects changes using the Linux inotify API. Raises OSError on creation
+    if inotify is not available.
+    """
+    def __init__(self, root):
+        self.root = root
+        libc_name = ctypes.util.find_library("c")
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p,
+            ctypes.c_uint32]
+        self.fd = libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        # Maps watch descriptors to the directory they watch:
+        self.watches = {}
+        for dirpath, dirnames, filenames in _walk(root):
+            self._watch(dirpath)
+
+    def _watch(self, path):
+        wd = self._add_watch(self.fd, path.encode('utf-8'), WATCH_MASK)
+        if wd < 0:
+            debug("Unable to watch %s" % path)
+            return
+        self.watches[wd] = path
+
+    def poll(self, timeout):
+        """
+        Wait up to timeout seconds for something to change, returning the set
+        of changed file paths relative to the watched directory.
+        """
+        changed = set()
+        readable = select.select([self.fd], [], [], timeout)[0]
+        if not readable:
+            return changed
+        data = os.read(self.fd, 65536)
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0').decode('utf-8')
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                warn_out("Too many file changes at once, rescanning %s" %
+                    self.root)
+                for dirpath, dirnames, filenames in _walk(self.root):
+                    for filename in filenames:
+                        changed.add(os.path.relpath(
+                            os.path.join(dirpath, filename), self.root))
+                continue
+            if wd not in self.watches or not name:
+                continue
+            path = os.path.join(self.watches[wd], name)
+            if name in IGNORED_DIRS:
+                continue
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # New directories need watching too, and anything
+                    # which landed inside them before we did so:
+                    for dirpath, dirnames, filenames in _walk(path):
+                        self._watch(dirpath)
+                        for filename in filenames:
+                            changed.add(os.path.relpath(
+                                os.path.join(dirpath, filename), self.root))
+                continue
+            changed.add(os.path.relpath(path, self.root))
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+def create_watcher(root, interval=1.0):
+    """
+    Return an inotify based watcher for the given directory if possible,
+    otherwise fall back to polling.
+    """
+    try:
+        watcher = InotifyWatcher(root)
+        debug("Watching %s with inotify" % root)
+        return watcher
+    except (OSError, AttributeError):
+        debug("inotify unavailable, polling %s every %ss" % (root, interval))
+        return PollingWatcher(root, interval)
+
+
+def wait_for_changes(watcher, settle=0.5):
+    """
+    Block until something changes, then keep collecting changes until things
+    have been quiet for settle seconds, so a burst of writes (i.e. an editor
+    saving several files) triggers a single rebuild.
+    """
+    changed = set()
+    while not changed:
+        changed = watcher.poll(3600)
+    while True:
+        more = watcher.poll(settle)
+        if not more:
+            return changed
+        changed.update(more)
+
+
+class BuildWatcher(object):
+    """
+    Runs the requested build stage for a test build, then keeps the builder's
+    rpmbuild_gitcopy around and re-runs only that stage each time files in
+    the package directory change.
+    """
+    def __init__(self, builder, options, watcher=None):
+        self.builder = builder
+        self.options = options
+        self.watcher = watcher
+
+    def run(self):
+        builder = self.builder
+        if not hasattr(builder, 'refresh_sources'):
+            warn_out("%s does not support --watch" % builder.__class__.__name__)
+            return builder.run(self.options)
+
+        info_out("Building package [%s]" % builder.build_tag)
+        builder.no_cleanup = self.options.no_cleanup
+        if self.watcher is None:
+            self.watcher = create_watcher(builder.start_dir)
+        try:
+            try:
+                builder.tgz()
+                # Pick up anything not yet committed before the first build:
+                pending = self._uncommitted_files()
+                if pending:
+                    builder.refresh_sources(pending)
+                self._build()
+
+                while True:
+                    info_out("Watching %s for changes, Ctrl+C to stop." %
+                        builder.start_dir)
+                    changed = self._filter_ignored(
+                        wait_for_changes(self.watcher))
+                    if not changed:
+                        continue
+                    info_out("Rebuilding, changed: %s" %
+                        ", ".join(sorted(changed)))
+                    builder.refresh_sources(changed)
+                    self._build()
+            except KeyboardInterrupt:
+                print("Interrupted, cleaning up...")
+        finally:
+            if self.watcher is not None:
+                self.watcher.close()
+            builder.cleanup()
+        return builder.artifacts
+
+    def _build(self):
+        """
+        Re-run whichever stage the user asked for. A failed build reports
+        its error and leaves us watching for the fix.
+        """
+        builder = self.builder
+        builder.artifacts = []
+        try:
+            tgz = os.path.join(builder.rpmbuild_sourcedir,
+                builder.tgz_filename)
+            if self.options.tgz and os.path.exists(tgz):
+                place_file(tgz, builder.rpmbuild_basedir)
+                info_out("Wrote: %s" % os.path.join(builder.rpmbuild_basedir,
+                    builder.tgz_filename))
+            if self.options.srpm:
+                builder.srpm()
+            if self.options.rpm:
+                builder.rpm()
+                builder._auto_install()
+                if builder.install_queue:
+                    builder.install_queue.install()
+        except SystemExit:
+            warn_out("Build failed.")
+
+    def _uncommitted_files(self):
+        """
+        Files in the project directory which differ from the commit being
+        built, relative to the project directory.
+        """
+        with chdir(self.builder.start_dir):
+            modified = run_command("git diff --relative --name-only %s -- ." %
+                self.builder.git_commit_id)
+            untracked = run_command("git ls-files --others --exclude-standard .")
+        return set(f for f in (modified + "\n" + untracked).split("\n") if f)
+
+    def _filter_ignored(self, changed):
+        """
+        Drop any paths git would ignore, they never end up in a tarball, as
+        well as our own output if the build dir is inside the project.
+        """
+        output_dir = os.path.relpath(self.builder.rpmbuild_basedir,
+            self.builder.start_dir)
+        changed = [f for f in changed
+            if not (f + os.sep).startswith(output_dir + os.sep)]
+        if not changed:
+            return set()
+        p = subprocess.Popen(['git', 'check-ignore', '--stdin'],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            universal_newlines=True, cwd=self.builder.start_dir)
+        ignored = p.communicate("\n".join(changed) + "\n")[0].split("\n")
+        return set(changed) - set(ignored)
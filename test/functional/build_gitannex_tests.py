@@ -89,12 +89,12 @@ def test_simple_build(self):
             "extsrc-0.0.2-1.*.noarch.rpm"))))
         builder.cleanup()
 
-    def test_lock_force_supported(self):
+    def test_jobs_supported(self):
         tito('tag --debug --accept-auto-changelog')
         builder = GitAnnexBuilder(PKG_NAME, None, self.output_dir,
             self.config, {}, {}, **{'offline': True})
 
-        self.assertTrue(builder._lock_force_supported('5.20140107'))
-        self.assertTrue(builder._lock_force_supported('5.20131213'))
-        self.assertFalse(builder._lock_force_supported('5.20131127.1'))
-        self.assertFalse(builder._lock_force_supported('3.20120522'))
+        self.assertTrue(builder._jobs_supported('6.20160126'))
+        self.assertTrue(builder._jobs_supported('5.20151208'))
+        self.assertFalse(builder._jobs_supported('5.20150731'))
+        self.assertFalse(builder._jobs_supported('3.20120522'))
@@ -11,6 +11,7 @@
 # granted to use or replicate Red Hat trademarks that are incorporated
 # in this software or its documentation.
 
+import os
 import sys
 
 from contextlib import contextmanager
@@ -96,3 +97,54 @@ def open_mock(content, **kwargs):
         rv.__iter__.return_value = iter(stream.readlines())
         rv.read.return_value = stream.read()
         yield rv
+
+
+def make_builder(builder_class, build_dir, **attrs):
+    """
+    Return a builder_class instance for a project "foo" built in build_dir,
+    without running its constructor (which needs a git checkout set up for
+    tito). It's left in the state BuilderBase.__init__ would leave it in,
+    with no user config, then given the attributes passed in.
+    """
+    from tito.builder.main import Dnf
+    from tito.timing import BuildTimer
+
+    rpmbuild_dir = os.path.join(build_dir, "rpmbuild-foo")
+    state = {
+        'start_dir': os.getcwd(),
+        'project_name': "foo",
+        'user_config': {},
+        'args': {},
+        'kwargs': {},
+        'config': None,
+        'dist': None,
+        'offline': False,
+        'auto_install': False,
+        'escalate_privileges': True,
+        'scl': '',
+        'quiet': False,
+        'verbose': False,
+        'timer': BuildTimer(),
+        'workers': None,
+        'scratch': None,
+        'scratch_dir': None,
+        'rpmbuild_options': '',
+        'test': False,
+        'rpmbuild_basedir': build_dir,
+        'rpmbuild_dir': rpmbuild_dir,
+        'trash_dir': None,
+        'rpmbuild_sourcedir': os.path.join(rpmbuild_dir, "SOURCES"),
+        'rpmbuild_builddir': os.path.join(rpmbuild_dir, "BUILD"),
+        'ran_tgz': False,
+        'no_cleanup': False,
+        'sources': [],
+        'artifacts': [],
+        'package_manager': Dnf(),
+        'install_queue': None,
+        'install_pending': False,
+    }
+    state.update(attrs)
+    builder = builder_class.__new__(builder_class)
+    for name, value in state.items():
+        setattr(builder, name, value)
+    return builder
@@ -17,14 +17,17 @@
     search_for, compare_version, run_command_print, find_wrote_in_rpmbuild_output,
     render_cheetah, increase_zstream, reset_release, find_file_with_extension,
     normalize_class_name, extract_sha1, BugzillaExtractor, DEFAULT_BUILD_DIR, munge_specfile,
-    munge_setup_macro,
-    _out)
+    munge_setup_macro, run_parallel, place_file, remove_tree, empty_trash,
+    get_trash_dir, _out)
 
 from tito.compat import StringIO
 from tito.tagger import CargoBump
 
 import os
 import re
+import shutil
+import tempfile
+import time
 import unittest
 
 from mock import Mock, patch, call
@@ -117,6 +120,13 @@ def test_compare_version(self):
         self.assertEquals(0, compare_version("1", "1.0"))
         self.assertEquals(0, compare_version("1.0", "1"))
         self.assertEquals(0, compare_version("1.0.2.0", "1.0.2"))
+        self.assertTrue(compare_version("0.6.27.dev0", "0.6.26") > 0)
+        self.assertTrue(compare_version("0.6.24rc1", "0.6.24rc2") < 0)
+        self.assertTrue(compare_version("0.6.24rc1", "0.6.23") > 0)
+        self.assertTrue(compare_version("1.0a", "1.0.1") < 0)
+        self.assertTrue(compare_version("1.0~rc1", "1.0") < 0)
+        self.assertTrue(compare_version("1.0", "1.0~rc1") > 0)
+        self.assertTrue(compare_version("1.0-2", "1.0-10") < 0)
 
     def test_run_command_print(self):
         self.assertEquals('', run_command_print("sleep 0.1"))
@@ -224,42 +234,110 @@ def test_colors(self, mock_user_conf):
 
 
 class CheetahRenderTest(unittest.TestCase):
-    @patch("os.unlink")
-    @patch("glob.glob")
-    @patch("shutil.move")
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.template = os.path.join(self.work_dir, "foo.spec.tmpl")
+        f = open(self.template, 'w')
+        f.write("Name: $name\n")
+        f.close()
+        self.output_dir = os.path.join(self.work_dir, "output")
+        os.mkdir(self.output_dir)
+
+        self.rendered = []
+        test = self
+
+        class FakeTemplate(object):
+            def __init__(self, searchList):
+                self.values = searchList[0]
+
+            def __str__(self):
+                test.rendered.append(self.values)
+                return "Name: %s\n" % self.values['name']
+        self.template_class = FakeTemplate
+
+        # Start each test with empty template and output caches:
+        for cache in ["tito.common._cheetah_templates",
+                "tito.common._cheetah_rendered"]:
+            patcher = patch.dict(cache, clear=True)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def _read(self, path):
+        f = open(path)
+        try:
+            return f.read()
+        finally:
+            f.close()
+
+    def _fake_cheetah(self, cmd):
+        odir = cmd.split("--odir=")[1].split()[0]
+        f = open(os.path.join(odir, "foo.spec.cheetah"), 'w')
+        f.write("Name: from-cli\n")
+        f.close()
+
+    @patch("tito.common._compile_cheetah")
     @patch("tito.common.run_command")
-    @patch("tempfile.NamedTemporaryFile")
-    def test_renders_cheetah(self, mock_tempfile, mock_run_command, mock_move, mock_glob, mock_unlink):
-        mock_run_command.return_value = True
-        mock_tempfile.return_value.name = "temp_pickle"
-        mock_unlink.return_value = True
-        mock_glob.return_value = ["/tmp/foo.spec.cheetah"]
-        mock_move.return_value = True
-
-        render_cheetah("foo.spec.tmpl", "/tmp", {})
-        expected = "cheetah fill --flat --pickle=temp_pickle --odir=/tmp --oext=cheetah foo.spec.tmpl"
-        self.assertEquals(call(expected), mock_run_command.mock_calls[0])
-        self.assertEquals(call("/tmp/*.cheetah"), mock_glob.mock_calls[0])
-        self.assertEquals(call("/tmp/foo.spec.cheetah", "/tmp/foo.spec"), mock_move.mock_calls[0])
-        self.assertEquals(call("temp_pickle"), mock_unlink.mock_calls[0])
-
-    @patch("os.unlink")
-    @patch("glob.glob")
+    def test_renders_cheetah(self, mock_run_command, mock_compile):
+        mock_compile.return_value = None
+        mock_run_command.side_effect = self._fake_cheetah
+
+        path = render_cheetah(self.template, self.output_dir, {'name': 'foo'})
+        self.assertEqual(os.path.join(self.output_dir, "foo.spec"), path)
+        self.assertEqual("Name: from-cli\n", self._read(path))
+        self.assertEqual(1, len(mock_run_command.mock_calls))
+        cmd = mock_run_command.mock_calls[0][1][0]
+        self.assertTrue(cmd.startswith("cheetah fill --flat --pickle="))
+        self.assertTrue(cmd.endswith(" --oext=cheetah %s" % self.template))
+        # Nothing but the rendered file is left behind:
+        self.assertEqual(["foo.spec"], os.listdir(self.output_dir))
+
+    @patch("tito.common._compile_cheetah")
     @patch("tito.common.run_command")
-    @patch("tempfile.NamedTemporaryFile")
-    def test_renders_cheetah_missing_result(self, mock_tempfile, mock_run_command, mock_glob, mock_unlink):
+    def test_renders_cheetah_missing_result(self, mock_run_command,
+            mock_compile):
+        mock_compile.return_value = None
         mock_run_command.return_value = True
-        mock_tempfile.return_value.name = "temp_pickle"
-        mock_unlink.return_value = True
-        mock_glob.return_value = []
 
         with Capture(silent=True):
-            self.assertRaises(SystemExit, render_cheetah, "foo.spec.tmpl", "/tmp", {})
-            expected = "cheetah fill --flat --pickle=temp_pickle --odir=/tmp --oext=cheetah foo.spec.tmpl"
-            self.assertEquals(call(expected), mock_run_command.mock_calls[0])
+            self.assertRaises(SystemExit, render_cheetah, self.template,
+                self.output_dir, {'name': 'missing'})
+        self.assertEqual([], os.listdir(self.output_dir))
 
-            self.assertEquals(call("/tmp/*.cheetah"), mock_glob.mock_calls[0])
-            self.assertEquals(call("temp_pickle"), mock_unlink.mock_calls[0])
+    @patch("tito.common._compile_cheetah")
+    @patch("tito.common.run_command")
+    def test_renders_in_process(self, mock_run_command, mock_compile):
+        mock_compile.return_value = self.template_class
+
+        path = render_cheetah(self.template, self.output_dir,
+            {'name': 'in-process', 'artifacts': {'.jar': ['a.jar']}})
+        self.assertEqual("Name: in-process\n", self._read(path))
+        self.assertEqual([], mock_run_command.mock_calls)
+
+        # The same input is only rendered once, however it is ordered:
+        os.unlink(path)
+        render_cheetah(self.template, self.output_dir,
+            dict([('artifacts', {'.jar': ['a.jar']}), ('name', 'in-process')]))
+        self.assertEqual("Name: in-process\n", self._read(path))
+        self.assertEqual(1, len(self.rendered))
+
+        render_cheetah(self.template, self.output_dir, {'name': 'other'})
+        self.assertEqual("Name: other\n", self._read(path))
+        self.assertEqual(2, len(self.rendered))
+
+    def test_compiled_once(self):
+        template_module = Mock()
+        template_module.Template.compile.return_value = self.template_class
+        modules = {'Cheetah': Mock(Template=template_module),
+            'Cheetah.Template': template_module}
+        with patch.dict("sys.modules", modules):
+            render_cheetah(self.template, self.output_dir, {'name': 'a'})
+            render_cheetah(self.template, self.output_dir, {'name': 'b'})
+        self.assertEqual([call(source="Name: $name\n")],
+            template_module.Template.compile.mock_calls)
+        self.assertEqual(2, len(self.rendered))
 
 
 class CargoTransformTest(unittest.TestCase):
@@ -687,3 +765,125 @@ def test_autosetup(self):
         line = "%autosetup -n tito-%{version}"
         self.assertEqual("%autosetup -n " + self.SOURCE + " -p1",
                          munge_setup_macro(self.SOURCE, line))
+
+
+class RunParallelTests(unittest.TestCase):
+
+    def test_results(self):
+        results = dict(run_parallel(lambda x: x * 2, [1, 2, 3], 2))
+        self.assertEqual({1: 2, 2: 4, 3: 6}, results)
+
+    def test_serial(self):
+        self.assertEqual([(1, 1), (2, 4)],
+            list(run_parallel(lambda x: x * x, [1, 2], 1)))
+
+    def test_error_reraised(self):
+        def fail(x):
+            if x == 2:
+                raise SystemExit(1)
+            return x
+        self.assertRaises(SystemExit, list, run_parallel(fail, [1, 2, 3], 2))
+
+
+class PlaceFileTests(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.src = os.path.join(self.work_dir, "foo-1.0.tar.gz")
+        f = open(self.src, 'w')
+        f.write("tarball")
+        f.close()
+        os.chmod(self.src, 0o640)
+        self.dest_dir = os.path.join(self.work_dir, "dest")
+        os.mkdir(self.dest_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def _read(self, path):
+        f = open(path)
+        try:
+            return f.read()
+        finally:
+            f.close()
+
+    def test_place_in_directory(self):
+        dest = place_file(self.src, self.dest_dir)
+        self.assertEqual(os.path.join(self.dest_dir, "foo-1.0.tar.gz"), dest)
+        self.assertEqual("tarball", self._read(dest))
+        self.assertEqual(0o640, os.stat(dest).st_mode & 0o777)
+
+    def test_replaces_existing(self):
+        dest = os.path.join(self.dest_dir, "other.tar.gz")
+        f = open(dest, 'w')
+        f.write("old contents which are longer")
+        f.close()
+        self.assertEqual(dest, place_file(self.src, dest))
+        self.assertEqual("tarball", self._read(dest))
+
+    def test_no_link(self):
+        dest = place_file(self.src, self.dest_dir, link=False)
+        self.assertFalse(os.path.samefile(self.src, dest))
+
+        # Modifying the copy leaves the original alone:
+        f = open(dest, 'w')
+        f.write("changed")
+        f.close()
+        self.assertEqual("tarball", self._read(self.src))
+
+    def test_reflink_keeps_mode(self):
+        os.chmod(self.src, 0o755)
+
+        def reflink(src_file, dest_file):
+            dest_file.write(src_file.read())
+            return True
+        with patch("tito.common._reflink", reflink):
+            dest = place_file(self.src, self.dest_dir, link=False)
+        self.assertEqual("tarball", self._read(dest))
+        self.assertEqual(0o755, os.stat(dest).st_mode & 0o777)
+
+
+class RemoveTreeTests(unittest.TestCase):
+
+    def setUp(self):
+        self.build_dir = tempfile.mkdtemp()
+        self.trash_dir = os.path.join(self.build_dir, ".trash")
+        self.tree = os.path.join(self.build_dir, "rpmbuild-foo")
+        os.makedirs(os.path.join(self.tree, "BUILD"))
+
+    def tearDown(self):
+        shutil.rmtree(self.build_dir)
+
+    def _wait_for_empty(self, path):
+        for i in range(100):
+            if not os.listdir(path):
+                return
+            time.sleep(0.05)
+        self.fail("%s was not emptied" % path)
+
+    def test_trash_dir_opt_in(self):
+        self.assertEqual(None, get_trash_dir(self.build_dir, {}))
+        self.assertEqual(None, get_trash_dir(self.build_dir, None))
+        self.assertEqual(self.trash_dir,
+            get_trash_dir(self.build_dir, {'ASYNC_CLEANUP': '1'}))
+
+    def test_remove_tree(self):
+        remove_tree(self.tree)
+        self.assertFalse(os.path.exists(self.tree))
+
+        # Nothing to do if it's already gone:
+        remove_tree(self.tree)
+        remove_tree(self.tree, self.trash_dir)
+
+    def test_remove_tree_in_background(self):
+        remove_tree(self.tree, self.trash_dir)
+        self.assertFalse(os.path.exists(self.tree))
+        self._wait_for_empty(self.trash_dir)
+
+    def test_empty_trash(self):
+        os.makedirs(os.path.join(self.trash_dir, "stale", "rpmbuild-bar"))
+        empty_trash(self.trash_dir)
+        self._wait_for_empty(self.trash_dir)
+
+        # Nothing to do if there's no trash:
+        empty_trash(os.path.join(self.build_dir, "missing"))
@@ -0,0 +1,140 @@
+# Copyright (c) 2008-2014 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+
+from mock import patch
+
+from tito.builder import Builder, NoTgzBuilder
+from tito.common import run_command
+from unit import Capture, make_builder
+
+SPEC = """Name: foo
+Version: 1.0
+Release: 1%{?dist}
+Summary: Foo
+License: GPLv2
+Source0: foo-1.0.tar.gz
+
+%description
+Foo.
+
+%prep
+%setup -q
+
+%files
+"""
+
+
+class BuildInPlaceTests(unittest.TestCase):
+
+    def setUp(self):
+        self.start_dir = os.getcwd()
+        self.git_root = tempfile.mkdtemp()
+        self.build_dir = tempfile.mkdtemp()
+        os.chdir(self.git_root)
+        self._write("foo.spec", SPEC)
+        self._write("foo.c", "int main() { return 0; }\n")
+        run_command("git init -q && git add . && git -c user.name=Tito "
+            "-c user.email=tito@example.com commit -q -m initial")
+
+        builder = make_builder(Builder, self.build_dir, test=True,
+            quiet=True, display_version="git-1.abcdef0",
+            build_version="1.0-1", commit_count=1, git_root=self.git_root,
+            git_commit_id=run_command("git rev-parse HEAD"),
+            relative_project_dir="", tgz_dir="foo-git-1.abcdef0",
+            ran_setup_test_specfile=False, spec_file=None,
+            srpm_location=None, build_in_place=True)
+        builder.tgz_filename = builder.tgz_dir + ".tar.gz"
+        builder.rpmbuild_gitcopy = os.path.join(builder.rpmbuild_sourcedir,
+            builder.tgz_dir)
+        self.builder = builder
+
+    def tearDown(self):
+        os.chdir(self.start_dir)
+        shutil.rmtree(self.git_root)
+        shutil.rmtree(self.build_dir)
+
+    def _write(self, name, content):
+        f = open(os.path.join(self.git_root, name), 'w')
+        f.write(content)
+        f.close()
+
+    def test_get_build_in_place(self):
+        builder = self.builder
+        help_output = (0, "  --build-in-place   run build in current directory")
+        with Capture(silent=True):
+            with patch("tito.builder.main.getstatusoutput") as rpmbuild_help:
+                rpmbuild_help.return_value = help_output
+                self.assertTrue(builder._get_build_in_place(
+                    {'build_in_place': ['1']}))
+                self.assertFalse(builder._get_build_in_place({}))
+
+                builder.test = False
+                self.assertFalse(builder._get_build_in_place(
+                    {'build_in_place': ['1']}))
+                builder.test = True
+
+                # Older rpmbuild, fall back to building from a tarball:
+                rpmbuild_help.return_value = (0, "  --nodeps")
+                self.assertFalse(builder._get_build_in_place(
+                    {'build_in_place': ['1']}))
+
+            # Builders with a tarball checked in can't:
+            builder = make_builder(NoTgzBuilder, self.build_dir, test=True)
+            self.assertFalse(builder._get_build_in_place(
+                {'build_in_place': ['1']}))
+
+    def test_rpm(self):
+        rpm = os.path.join(self.build_dir, "x86_64",
+            "foo-1.0-1.git.1.abcdef0.x86_64.rpm")
+        with patch("tito.builder.main.run_command") as run:
+            run.return_value = "Wrote: %s" % rpm
+            with patch("tito.builder.main.scl_to_rpm_option", lambda s: ""):
+                with Capture(silent=True):
+                    self.builder.rpm()
+
+        cmd = run.call_args[0][0]
+        self.assertTrue(cmd.startswith("cd %s && rpmbuild " %
+            os.path.normpath(self.git_root)))
+        self.assertTrue("--build-in-place -bb %s" % self.builder.spec_file
+            in cmd)
+        self.assertEqual([rpm], self.builder.artifacts)
+
+        # Only the spec was copied, with the test release munged in:
+        self.assertEqual(["foo.spec"], os.listdir(
+            self.builder.rpmbuild_gitcopy))
+        self.assertFalse(os.path.exists(os.path.join(
+            self.builder.rpmbuild_sourcedir, self.builder.tgz_filename)))
+        f = open(self.builder.spec_file)
+        spec = f.read()
+        f.close()
+        self.assertTrue("Release: 1.git.1." in spec)
+        self.assertTrue("%setup -q -n foo-git-1.abcdef0" in spec)
+
+    def test_tgz_has_local_changes(self):
+        self._write("foo.c", "int main() { return 1; }\n")
+        with Capture(silent=True):
+            tgz = self.builder.tgz()
+
+        tar = tarfile.open(tgz)
+        try:
+            member = tar.extractfile("foo-git-1.abcdef0/foo.c")
+            self.assertEqual(b"int main() { return 1; }\n", member.read())
+        finally:
+            tar.close()
+        self.assertEqual("", run_command("git stash list"))
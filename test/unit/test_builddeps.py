@@ -0,0 +1,222 @@
+# Copyright (c) 2008-2014 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from mock import patch
+
+from tito.builddeps import format_dep, get_build_requires, find_missing, \
+    missing_build_deps, rpmbuild_macros
+from tito.builder import Builder
+from unit import Capture, make_builder
+
+
+class FakeRpm(object):
+    """ Just enough of the rpm Python bindings. """
+    RPMTAG_REQUIRENAME = 'requirename'
+    RPMTAG_REQUIREFLAGS = 'requireflags'
+    RPMTAG_REQUIREVERSION = 'requireversion'
+
+    def __init__(self, installed=()):
+        self.installed = installed
+        self.macros = {}
+        self.parsed = []
+        self.lookups = []
+        fake = self
+
+        class Spec(object):
+            def __init__(self, path):
+                fake.parsed.append((path, dict(fake.macros)))
+                self.sourceHeader = {
+                    'requirename': [b'rpmlib(CompressedFileNames)', b'gcc',
+                        b'python3-devel', b'/usr/bin/make'],
+                    'requireflags': [16777224, 0, 12, 0],
+                    'requireversion': [b'3.0.4-1', b'', b'3.6', b''],
+                }
+
+        class TransactionSet(object):
+            def dbMatch(self, tag, name):
+                fake.lookups.append((tag, name))
+                return [name] if name in fake.installed else []
+
+        self.spec = Spec
+        self.TransactionSet = TransactionSet
+
+    def addMacro(self, name, value):
+        self.macros[name] = value
+
+    def expandMacro(self, expr):
+        name = expr[3:-3]
+        return name in self.macros and "1" or ""
+
+    def delMacro(self, name):
+        del self.macros[name]
+
+
+class BuildDepsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.spec = os.path.join(self.work_dir, "foo.spec")
+        f = open(self.spec, 'w')
+        f.write("Name: foo\n")
+        f.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_format_dep(self):
+        self.assertEqual("foo", format_dep("foo", 0, ""))
+        self.assertEqual("foo >= 1.0", format_dep("foo", 12, "1.0"))
+        self.assertEqual("foo < 2", format_dep("foo", 2, "2"))
+        self.assertEqual("foo = 1-1", format_dep("foo", 8, "1-1"))
+
+    def test_build_requires_cached(self):
+        rpm = FakeRpm()
+        with patch.dict(sys.modules, {'rpm': rpm}):
+            for i in range(2):
+                self.assertEqual(["gcc", "python3-devel >= 3.6",
+                    "/usr/bin/make"], get_build_requires(self.spec,
+                    [('dist', '.fc40'), ('scl', None)], self.work_dir))
+            self.assertEqual([(self.spec, {'dist': '.fc40'})], rpm.parsed)
+            self.assertEqual({}, rpm.macros)
+
+            # A different dist or bcond may change what's required:
+            get_build_requires(self.spec, [('dist', '.el9')], self.work_dir)
+            get_build_requires(self.spec, [('dist', '.el9'),
+                ('_with_docs', '--with-docs')], self.work_dir)
+            self.assertEqual(3, len(rpm.parsed))
+
+    @patch("tito.builddeps.run_command")
+    def test_build_requires_undefined(self, run_command):
+        # Undefining a macro which is defined needs rpmspec:
+        run_command.return_value = "gcc\n"
+        rpm = FakeRpm()
+        rpm.macros['scl'] = 'foo'
+        with patch.dict(sys.modules, {'rpm': rpm}):
+            self.assertEqual(["gcc"], get_build_requires(self.spec,
+                [('scl', None)]))
+        self.assertEqual([], rpm.parsed)
+        self.assertEqual("rpmspec -q --buildrequires --undefine scl %s" %
+            self.spec, run_command.call_args[0][0])
+
+    def test_rpmbuild_macros(self):
+        self.assertEqual([
+            ('_with_docs', '--with-docs'),
+            ('_without_tests', '--without-tests'),
+            ('foo', 'bar baz'),
+            ('empty', ''),
+            ('old', None),
+            ('scl', None),
+            ('dist', '.fc40'),
+        ], rpmbuild_macros("--with docs --without=tests --nodeps "
+            "--define 'foo bar baz' -D empty --undefine old "
+            "--eval '%undefine scl' --define=\"dist .fc40\""))
+
+    @patch("tito.builddeps.run_command")
+    def test_build_requires_without_bindings(self, run_command):
+        run_command.return_value = "rpmlib(CompressedFileNames) <= 3.0.4-1\n" \
+            "gcc\npython3-devel >= 3.6\n"
+        with patch.dict(sys.modules, {'rpm': None}):
+            self.assertEqual(["gcc", "python3-devel >= 3.6"],
+                get_build_requires(self.spec, [('dist', '.fc40')]))
+        self.assertEqual("rpmspec -q --buildrequires --define 'dist .fc40' "
+            "%s" % self.spec, run_command.call_args[0][0])
+
+    def test_find_missing(self):
+        rpm = FakeRpm(['gcc', 'gcc(x86-64)', '/usr/bin/make'])
+        with patch.dict(sys.modules, {'rpm': rpm}):
+            self.assertEqual(["python3-devel >= 3.6"], find_missing(["gcc",
+                "python3-devel >= 3.6", "/usr/bin/make", "(foo or bar)"]))
+            self.assertEqual([], find_missing(["(foo or bar)"]))
+            self.assertEqual(["python3-devel >= 3.6"], missing_build_deps(
+                [self.spec, self.spec]))
+
+            # Looked up by name in the rpmdb's indexes:
+            rpm.lookups = []
+            self.assertEqual([], find_missing(["gcc", "/usr/bin/make"]))
+            self.assertEqual([('providename', 'gcc'),
+                ('basenames', '/usr/bin/make')], rpm.lookups)
+
+    @patch("tito.builddeps.getstatusoutput")
+    def test_find_missing_without_bindings(self, getstatusoutput):
+        getstatusoutput.return_value = (1, "gcc-14.1.1-1.fc40.x86_64\n"
+            "no package provides python3-devel")
+        with patch.dict(sys.modules, {'rpm': None}):
+            self.assertEqual(["python3-devel >= 3.6"], find_missing(["gcc",
+                "python3-devel >= 3.6"]))
+        self.assertEqual("rpm -q --whatprovides gcc python3-devel",
+            getstatusoutput.call_args[0][0])
+
+
+class BuilderBuildDepsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.builder = make_builder(Builder, self.work_dir,
+            start_dir=self.work_dir, build_in_place=True,
+            install_build_deps=False)
+        open(os.path.join(self.work_dir, "foo.spec"), 'w').close()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    @patch("tito.builder.main.scl_to_rpm_option",
+        lambda scl, silent: " --eval '%undefine scl'")
+    @patch("tito.builder.main.missing_build_deps")
+    def test_missing(self, missing_build_deps):
+        missing_build_deps.return_value = ["python3-devel >= 3.6"]
+        with Capture(silent=True) as capture:
+            self.assertRaises(SystemExit, self.builder._check_build_deps)
+        self.assertTrue("dnf install 'python3-devel >= 3.6'" in
+            capture.err)
+        self.assertEqual([os.path.join(self.work_dir, "foo.spec")],
+            missing_build_deps.call_args[0][0])
+        self.assertEqual([('scl', None)], missing_build_deps.call_args[0][1])
+
+    @patch("tito.builder.main.scl_to_rpm_option",
+        lambda scl, silent: " --define 'scl foo'")
+    @patch("tito.builder.main.missing_build_deps")
+    def test_rpmbuild_options(self, missing_build_deps):
+        missing_build_deps.return_value = []
+        self.builder.dist = ".fc40"
+        self.builder.rpmbuild_options = "--without docs"
+        self.builder._check_build_deps()
+        self.assertEqual([('_without_docs', '--without-docs'),
+            ('scl', 'foo'), ('dist', '.fc40')],
+            missing_build_deps.call_args[0][1])
+
+        self.builder.rpmbuild_options = "--nodeps --without docs"
+        self.builder._check_build_deps()
+        self.assertEqual(1, missing_build_deps.call_count)
+
+    @patch("tito.builder.main.scl_to_rpm_option", lambda scl, silent: "")
+    @patch("tito.builder.main.run_command_print")
+    @patch("tito.builder.main.missing_build_deps")
+    def test_install(self, missing_build_deps, run_command_print):
+        missing_build_deps.return_value = ["python3-devel >= 3.6", "gcc"]
+        self.builder.install_build_deps = True
+        with Capture(silent=True):
+            self.builder._check_build_deps()
+        run_command_print.assert_called_once_with(
+            "sudo dnf install -y 'python3-devel >= 3.6' gcc")
+
+    @patch("tito.builder.main.missing_build_deps")
+    def test_disabled(self, missing_build_deps):
+        self.builder.user_config = {'BUILD_DEPS_CHECK': '0'}
+        self.builder._check_build_deps()
+        self.assertEqual(0, missing_build_deps.call_count)
@@ -0,0 +1,127 @@
+# Copyright (c) 2008-2014 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from tito.cache import get_cache_dir, read_json, write_json, \
+    snapshot_config, restore_config, digest, cached_file, store_file, \
+    cached_files, store_files, prune_cache, prune_tree
+from tito.compat import RawConfigParser, read_config_string
+
+TITO_PROPS = """
+[DEFAULT]
+offline = true
+
+[buildconfig]
+builder = tito.builder.Builder
+tagger = tito.tagger.VersionTagger
+
+[requirements]
+tito = 0.6.0
+"""
+
+
+class ConfigSnapshotTests(unittest.TestCase):
+
+    def setUp(self):
+        self.build_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.build_dir)
+
+    def test_snapshot_roundtrip(self):
+        config = RawConfigParser()
+        read_config_string(config, TITO_PROPS)
+        path = os.path.join(get_cache_dir(self.build_dir, "config"), "a.json")
+        write_json(path, snapshot_config(config))
+
+        restored = restore_config(read_json(path))
+        self.assertEqual(config.sections(), restored.sections())
+        for section in config.sections():
+            self.assertEqual(sorted(config.items(section)),
+                sorted(restored.items(section)))
+        self.assertEqual("true", restored.get("requirements", "offline"))
+
+    def test_read_missing_json(self):
+        self.assertEqual(None, read_json(os.path.join(self.build_dir, "nope")))
+
+    def test_digest(self):
+        self.assertEqual(digest("a", None), digest("a", None))
+        self.assertNotEqual(digest("ab", "c"), digest("a", "bc"))
+
+
+class FileCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.build_dir = tempfile.mkdtemp()
+        self.cache_dir = get_cache_dir(self.build_dir, "srpm")
+
+    def tearDown(self):
+        shutil.rmtree(self.build_dir)
+
+    def _write(self, name, size):
+        path = os.path.join(self.build_dir, name)
+        f = open(path, 'wb')
+        f.write(b'x' * size)
+        f.close()
+        return path
+
+    def test_store_and_lookup(self):
+        self.assertEqual(None, cached_file(self.cache_dir, "key"))
+        srpm = self._write("foo-1.0-1.src.rpm", 10)
+        cached = store_file(self.cache_dir, "key", srpm)
+        self.assertEqual("foo-1.0-1.src.rpm", os.path.basename(cached))
+        self.assertEqual(cached, cached_file(self.cache_dir, "key"))
+
+        # Storing an existing key again leaves the first copy in place:
+        self.assertEqual(cached, store_file(self.cache_dir, "key", srpm))
+        self.assertEqual(["key"], os.listdir(self.cache_dir))
+
+    def test_store_and_lookup_files(self):
+        self.assertEqual(None, cached_files(self.cache_dir, "key"))
+        paths = [self._write(name, 10) for name in ["b.patch", "a.patch"]]
+        cached = store_files(self.cache_dir, "key", paths)
+        self.assertEqual(["b.patch", "a.patch"],
+            [os.path.basename(path) for path in cached])
+        self.assertEqual(cached, cached_files(self.cache_dir, "key"))
+
+    def test_prune_least_recently_used(self):
+        for key in ["a", "b", "c"]:
+            store_file(self.cache_dir, key, self._write("%s.src.rpm" % key, 100))
+        os.utime(os.path.join(self.cache_dir, "a"), (1, 1))
+        os.utime(os.path.join(self.cache_dir, "b"), (3, 3))
+        os.utime(os.path.join(self.cache_dir, "c"), (2, 2))
+
+        prune_cache(self.cache_dir, 250)
+        self.assertEqual(["b", "c"], sorted(os.listdir(self.cache_dir)))
+        prune_cache(self.cache_dir, 100)
+        self.assertEqual(["b"], os.listdir(self.cache_dir))
+
+    def test_prune_tree(self):
+        repo = os.path.join(self.build_dir, "repository")
+        for version, mtime in [("1.0", 1), ("2.0", 2)]:
+            version_dir = os.path.join(repo, "org", "foo", version)
+            os.makedirs(version_dir)
+            path = os.path.join(version_dir, "foo-%s.jar" % version)
+            f = open(path, 'wb')
+            f.write(b'x' * 100)
+            f.close()
+            os.utime(path, (mtime, mtime))
+
+        prune_tree(repo, 150)
+        self.assertEqual([], os.listdir(os.path.join(repo, "org", "foo", "1.0")))
+        self.assertEqual(["foo-2.0.jar"],
+            os.listdir(os.path.join(repo, "org", "foo", "2.0")))
@@ -0,0 +1,98 @@
+# Copyright (c) 2008-2014 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import patch
+
+from tito import common
+from tito.common import run_command, get_commit_metadata, \
+    clear_commit_metadata, get_latest_commit, get_commit_count, \
+    get_commit_timestamp, get_build_commit
+
+GIT = "git -c user.name=Tito -c user.email=tito@example.com"
+
+
+class CommitMetadataTests(unittest.TestCase):
+
+    def setUp(self):
+        clear_commit_metadata()
+        self.start_dir = os.getcwd()
+        self.git_root = tempfile.mkdtemp()
+        os.chdir(self.git_root)
+        os.mkdir("foo")
+        run_command("git init -q")
+        for i in range(3):
+            f = open(os.path.join("foo", "file%s" % i), 'w')
+            f.write("%s\n" % i)
+            f.close()
+            run_command("git add foo && %s commit -q -m 'commit %s'" % (GIT,
+                i))
+            if i == 0:
+                run_command("%s tag -a -m tag foo-1.0-1" % GIT)
+        # A later commit outside the package:
+        open("README", 'w').close()
+        run_command("git add README && %s commit -q -m readme" % GIT)
+
+    def tearDown(self):
+        os.chdir(self.start_dir)
+        shutil.rmtree(self.git_root)
+        clear_commit_metadata()
+
+    def test_metadata(self):
+        metadata = get_commit_metadata()
+        self.assertEqual(run_command("git rev-parse HEAD"),
+            metadata['commit'])
+        self.assertEqual(run_command("git rev-parse HEAD^{tree}"),
+            metadata['tree'])
+        self.assertEqual(run_command("git log -1 --pretty=format:%ct"),
+            metadata['timestamp'])
+
+        # Only commits touching the path:
+        self.assertEqual(run_command("git rev-parse HEAD~1"),
+            get_commit_metadata("HEAD", "foo")['commit'])
+        os.chdir("foo")
+        self.assertEqual(run_command("git rev-parse HEAD~1"),
+            get_latest_commit("."))
+        self.assertEqual(None, get_commit_metadata("HEAD", "missing"))
+
+    def test_memoized(self):
+        commit = get_latest_commit(".")
+        with patch("tito.common.run_command") as run:
+            self.assertEqual(commit, get_latest_commit("."))
+            # The commit's own metadata came with it:
+            get_commit_timestamp(commit)
+            self.assertEqual(0, run.call_count)
+
+        clear_commit_metadata()
+        self.assertEqual(commit, get_latest_commit("."))
+        self.assertEqual({}, common._commit_counts)
+
+    def test_tag_commit(self):
+        self.assertEqual(run_command("git rev-parse HEAD~3"),
+            get_build_commit("foo-1.0-1"))
+
+    def test_commit_count(self):
+        commit = get_latest_commit(".")
+        self.assertEqual("3", get_commit_count("foo-1.0-1", commit))
+        # Untagged, count from the initial commit:
+        self.assertEqual("3", get_commit_count("bar-1.0-1", commit))
+        self.assertEqual(0, get_commit_count("foo-1.0-1",
+            run_command("git rev-parse HEAD~3")))
+
+        with patch("tito.common.getstatusoutput") as git:
+            self.assertEqual("3", get_commit_count("foo-1.0-1", commit))
+            self.assertEqual(0, git.call_count)
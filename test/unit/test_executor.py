@@ -0,0 +1,80 @@
+# Copyright (c) 2008-2014 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from tito.exception import RunCommandException, TitoException
+from tito.executor import LOCAL_WORKER, WorkerPool, get_worker_pool, \
+    _safe_join
+
+
+class WorkerPoolTests(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.dest_dir = os.path.join(self.work_dir, "dest")
+        self.srpm = os.path.join(self.work_dir, "foo-1.0-1.src.rpm")
+        f = open(self.srpm, 'wb')
+        f.write(b'srpm' * 1000)
+        f.close()
+        self.pool = WorkerPool([LOCAL_WORKER])
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_get_worker_pool(self):
+        self.assertEqual(None, get_worker_pool({}))
+        self.assertEqual(None, get_worker_pool({'BUILD_WORKERS': ' '}))
+        pool = get_worker_pool({'BUILD_WORKERS': 'local, ssh box tito-worker'})
+        self.assertEqual(['local', 'ssh box tito-worker'], pool.workers)
+
+    def test_run(self):
+        lines = []
+        paths = self.pool.run("mkdir -p RPMS/noarch && echo building && "
+            "cp foo-1.0-1.src.rpm RPMS/noarch/foo-1.0-1.noarch.rpm && "
+            "touch build.log", [self.srpm], ["RPMS/*/*.rpm"], self.dest_dir,
+            log=lines.append)
+
+        self.assertEqual(["building"], lines)
+        rpm = os.path.join(self.dest_dir, "RPMS", "noarch",
+            "foo-1.0-1.noarch.rpm")
+        self.assertEqual([rpm], paths)
+        f = open(rpm, 'rb')
+        self.assertEqual(b'srpm' * 1000, f.read())
+        f.close()
+        self.assertFalse(os.path.exists(os.path.join(self.dest_dir,
+            "build.log")))
+
+    def test_failure(self):
+        try:
+            self.pool.run("echo missing deps; exit 3", [self.srpm], ["*"],
+                self.dest_dir)
+            self.fail("Expected RunCommandException")
+        except RunCommandException:
+            e = sys.exc_info()[1]
+            self.assertEqual(3, e.status)
+            self.assertEqual("missing deps", e.output)
+
+    def test_worker_not_found(self):
+        pool = WorkerPool(["/nonexistent/tito-worker"])
+        self.assertRaises(TitoException, pool.run, "true", [], [],
+            self.dest_dir)
+
+    def test_safe_join(self):
+        self.assertEqual("/a/b/c", _safe_join("/a", "b/c"))
+        self.assertRaises(TitoException, _safe_join, "/a", "../b")
+        self.assertRaises(TitoException, _safe_join, "/a", "/b")
@@ -0,0 +1,143 @@
+# Copyright (c) 2008-2014 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+try:
+    from BaseHTTPServer import HTTPServer
+    from SimpleHTTPServer import SimpleHTTPRequestHandler
+except ImportError:
+    from http.server import HTTPServer, SimpleHTTPRequestHandler
+
+from mock import Mock, patch
+
+from tito.builder.fetch import SpecSourceStrategy, read_sources_file
+from unit import Capture
+
+
+class StubHandler(SimpleHTTPRequestHandler):
+    """ Serves the test's upstream directory and counts the downloads. """
+
+    def translate_path(self, path):
+        return os.path.join(self.server.root, path.lstrip("/"))
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        SimpleHTTPRequestHandler.do_GET(self)
+
+    def log_message(self, *args):
+        pass
+
+
+class SpecSourceStrategyTests(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.start_dir = os.path.join(self.work_dir, "foo")
+        self.upstream = os.path.join(self.work_dir, "upstream")
+        for path in [self.start_dir, self.upstream]:
+            os.makedirs(path)
+
+        self.server = HTTPServer(("127.0.0.1", 0), StubHandler)
+        self.server.root = self.upstream
+        self.server.requests = []
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = "http://127.0.0.1:%s" % self.server.server_address[1]
+
+        self._write(os.path.join(self.start_dir, "foo.spec"), "Name: foo\n")
+        self._write(os.path.join(self.start_dir, "foo.conf"), "conf")
+        self._write(os.path.join(self.upstream, "foo-1.0.tar.gz"), "tarball")
+        self._write(os.path.join(self.upstream, "extra.tar.gz"), "extra")
+        self._write(os.path.join(self.upstream, "local.txt"), "local")
+        self.spec_sources = [
+            "Source0: %s/foo-1.0.tar.gz" % self.url,
+            "Source1: %s/extra.tar.gz#/foo-extra.tar.gz" % self.url,
+            "Source2: file://%s/local.txt" % self.upstream,
+            "Source3: foo.conf",
+        ]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.work_dir)
+
+    def _write(self, path, content):
+        f = open(path, 'w')
+        f.write(content)
+        f.close()
+
+    def _sha256(self, content):
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def _fetch(self, build):
+        build_dir = os.path.join(self.work_dir, "build")
+        builder = Mock(project_name="foo", start_dir=self.start_dir,
+            rpmbuild_basedir=build_dir, args={'fetch_jobs': ['4']},
+            build_tag="foo-1.0-1", user_config={})
+        builder.rpmbuild_sourcedir = os.path.join(build_dir, "build-%s" %
+            build)
+        os.makedirs(builder.rpmbuild_sourcedir)
+
+        strategy = SpecSourceStrategy(builder)
+        with patch("tito.builder.fetch.run_command") as run_command:
+            run_command.return_value = "\n".join(self.spec_sources)
+            strategy.fetch()
+        return strategy
+
+    def test_fetch_and_cache(self):
+        self._write(os.path.join(self.start_dir, "sources"),
+            "SHA256 (foo-1.0.tar.gz) = %s\n" % self._sha256("tarball"))
+
+        strategy = self._fetch(1)
+        self.assertEqual(("1.0", "1"), (strategy.version, strategy.release))
+        names = [os.path.basename(path) for path in strategy.sources]
+        self.assertEqual(["foo-1.0.tar.gz", "foo-extra.tar.gz", "local.txt",
+            "foo.conf"], names)
+        for path, content in zip(strategy.sources,
+                ["tarball", "extra", "local", "conf"]):
+            self.assertEqual(content, open(path).read())
+        self.assertEqual(2, len(self.server.requests))
+
+        # A second build downloads nothing, and links the cached sources:
+        strategy = self._fetch(2)
+        self.assertEqual(2, len(self.server.requests))
+        self.assertEqual("tarball", open(strategy.sources[0]).read())
+        self.assertTrue(os.stat(strategy.sources[0]).st_nlink > 1)
+
+    def test_checksum_mismatch(self):
+        self._write(os.path.join(self.start_dir, "sources"),
+            "SHA512 (foo-1.0.tar.gz) = %s\n" % ("0" * 128))
+        with Capture(silent=True):
+            self.assertRaises(SystemExit, self._fetch, 1)
+
+        # Nothing unverified made it into the cache:
+        cache_dir = os.path.join(self.work_dir, "build", ".cache", "sources")
+        self.assertFalse([name for name in os.listdir(cache_dir)
+            if name.startswith("sha512-")])
+
+    def test_read_sources_file(self):
+        path = os.path.join(self.start_dir, "sources")
+        self._write(path, "SHA512 (a.tar.gz) = ABC123\n"
+            "0123456789abcdef0123456789abcdef  b.tar.gz\n")
+        self.assertEqual({
+            'a.tar.gz': ('sha512', 'abc123'),
+            'b.tar.gz': ('md5', '0123456789abcdef0123456789abcdef'),
+        }, read_sources_file(path))
+        self.assertEqual({}, read_sources_file(path + ".missing"))
@@ -0,0 +1,124 @@
+# Copyright (c) 2008-2014 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import patch
+
+from tito.builder import GitAnnexBuilder
+from unit import make_builder
+
+
+class GitAnnexBuilderTests(unittest.TestCase):
+
+    def setUp(self):
+        self.old_cwd = os.getcwd()
+        self.git_root = tempfile.mkdtemp()
+        self.calls = []
+
+        # A locked annexed file is a symlink into the annex object store,
+        # dangling until its content has been fetched:
+        self.objects = os.path.join(self.git_root, ".git", "annex", "objects")
+        os.makedirs(self.objects)
+        for name in ["foo-1.0.tar.gz", "foo-0.9.tar.gz"]:
+            os.symlink(os.path.join(self.objects, name),
+                os.path.join(self.git_root, name))
+
+        gitcopy = os.path.join(self.git_root, "gitcopy")
+        builder = make_builder(GitAnnexBuilder, self.git_root,
+            relative_project_dir="", rpmbuild_gitcopy=gitcopy,
+            spec_file=os.path.join(gitcopy, "foo.spec"), annex_jobs=2)
+        os.makedirs(builder.rpmbuild_gitcopy)
+        for name in ["foo-1.0.tar.gz", "foo-0.9.tar.gz"]:
+            os.symlink("../.git/annex/objects/%s" % name,
+                os.path.join(builder.rpmbuild_gitcopy, name))
+        self.builder = builder
+        os.chdir(self.git_root)
+
+    def tearDown(self):
+        os.chdir(self.old_cwd)
+        shutil.rmtree(self.git_root)
+
+    def _run_command(self, cmd):
+        self.calls.append(cmd)
+        if cmd.startswith("/usr/bin/spectool"):
+            return "foo-1.0.tar.gz\nfoo-1.0-fix.patch"
+        if cmd.startswith("git-annex find"):
+            return "foo-0.9.tar.gz\nfoo-1.0.tar.gz"
+        if cmd.startswith("git-annex version"):
+            return "git-annex version: 10.20230126\nbuild flags: ..."
+        if cmd.startswith("git-annex get"):
+            f = open(os.path.join(self.objects, "foo-1.0.tar.gz"), 'w')
+            f.write("tarball")
+            f.close()
+        return ""
+
+    @patch("tito.builder.main.NoTgzBuilder._setup_sources")
+    @patch("tito.builder.main.getstatusoutput")
+    def test_gets_spec_sources(self, mock_status, mock_setup_sources):
+        mock_status.return_value = (0, "/usr/bin/git-annex")
+        with patch("tito.builder.main.run_command", self._run_command):
+            self.builder._setup_sources()
+
+        gets = [cmd for cmd in self.calls if cmd.startswith("git-annex get")]
+        self.assertEqual(["git-annex get -J2 -- 'foo-1.0.tar.gz'"], gets)
+        for cmd in self.calls:
+            self.assertFalse("lock" in cmd)
+
+        # The content is linked in, the unused source is left alone:
+        source = os.path.join(self.builder.rpmbuild_gitcopy, "foo-1.0.tar.gz")
+        self.assertFalse(os.path.islink(source))
+        self.assertEqual("tarball", open(source).read())
+        self.assertTrue(os.path.islink(os.path.join(
+            self.builder.rpmbuild_gitcopy, "foo-0.9.tar.gz")))
+        self.assertTrue(os.path.islink(os.path.join(self.git_root,
+            "foo-1.0.tar.gz")))
+
+    @patch("tito.builder.main.NoTgzBuilder._setup_sources")
+    @patch("tito.builder.main.getstatusoutput")
+    def test_source_in_subdirectory(self, mock_status, mock_setup_sources):
+        mock_status.return_value = (0, "/usr/bin/git-annex")
+        os.mkdir(os.path.join(self.git_root, "sources"))
+        os.symlink(os.path.join(self.objects, "foo-1.0.tar.gz"),
+            os.path.join(self.git_root, "sources", "foo-1.0.tar.gz"))
+        os.mkdir(os.path.join(self.builder.rpmbuild_gitcopy, "sources"))
+        os.symlink("../../.git/annex/objects/foo-1.0.tar.gz",
+            os.path.join(self.builder.rpmbuild_gitcopy, "sources",
+            "foo-1.0.tar.gz"))
+
+        def run_command(cmd):
+            if cmd.startswith("git-annex find"):
+                self.calls.append(cmd)
+                return "foo-0.9.tar.gz\nsources/foo-1.0.tar.gz"
+            return self._run_command(cmd)
+        with patch("tito.builder.main.run_command", run_command):
+            self.builder._setup_sources()
+
+        gets = [cmd for cmd in self.calls if cmd.startswith("git-annex get")]
+        self.assertEqual(["git-annex get -J2 -- 'sources/foo-1.0.tar.gz'"],
+            gets)
+        # Where rpmbuild looks for it, without the dangling link:
+        source = os.path.join(self.builder.rpmbuild_gitcopy, "foo-1.0.tar.gz")
+        self.assertFalse(os.path.islink(source))
+        self.assertEqual("tarball", open(source).read())
+        self.assertFalse(os.path.lexists(os.path.join(
+            self.builder.rpmbuild_gitcopy, "sources", "foo-1.0.tar.gz")))
+
+    def test_jobs_supported(self):
+        self.assertTrue(self.builder._jobs_supported('10.20230126'))
+        self.assertTrue(self.builder._jobs_supported('5.20151208'))
+        self.assertFalse(self.builder._jobs_supported('5.20150731'))
+        self.assertFalse(self.builder._jobs_supported('3.20120522'))
@@ -0,0 +1,107 @@
+# Copyright (c) 2008-2014 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+
+import sys
+import unittest
+
+from mock import patch
+
+from tito.builder.main import InstallQueue, Dnf, Rpm, same_version
+from unit import Capture
+
+
+class StubDnf(Dnf):
+
+    def __init__(self, installed):
+        self.installed = installed
+        self.queries = []
+
+    def installed_versions(self, packages):
+        self.queries.append(packages)
+        return dict((p, self.installed[p]) for p in packages
+            if p in self.installed)
+
+
+class InstallQueueTests(unittest.TestCase):
+
+    def setUp(self):
+        self.installs = []
+        self.manager = StubDnf({'bar': '2.0-1.fc40', 'baz': '0.9-1.fc40'})
+
+    def _install(self, queue):
+        with patch("tito.builder.main.package_manager",
+                lambda: self.manager):
+            with patch("tito.builder.main.run_command_print",
+                    self.installs.append):
+                with Capture(silent=True):
+                    queue.install()
+
+    def test_single_transaction(self):
+        queue = InstallQueue({'NO_AUTO_INSTALL': 'debuginfo'})
+        queue.add("foo", "1.0-1", ["/tmp/tito/foo-1.0-1.tar.gz",
+            "/tmp/tito/foo-1.0-1.src.rpm",
+            "/tmp/tito/x86_64/foo-1.0-1.fc40.x86_64.rpm",
+            "/tmp/tito/x86_64/foo-debuginfo-1.0-1.fc40.x86_64.rpm"])
+        queue.add("baz", "1.0-1", ["/tmp/tito/noarch/baz-1.0-1.fc40.noarch.rpm"])
+        queue.add("empty", "1.0-1", ["/tmp/tito/empty-1.0-1.src.rpm"])
+        self._install(queue)
+
+        self.assertEqual([["foo", "baz"]], self.manager.queries)
+        self.assertEqual(["sudo dnf install -C -y "
+            "/tmp/tito/x86_64/foo-1.0-1.fc40.x86_64.rpm "
+            "/tmp/tito/noarch/baz-1.0-1.fc40.noarch.rpm"], self.installs)
+
+        # Nothing left to install:
+        self._install(queue)
+        self.assertEqual(1, len(self.installs))
+
+    def test_reinstall(self):
+        queue = InstallQueue(escalate=False)
+        queue.add("foo", "1.0-1", ["/tmp/tito/foo-1.0-1.fc40.noarch.rpm"])
+        queue.add("bar", "2.0-1", ["/tmp/tito/bar-2.0-1.fc40.noarch.rpm"])
+        self._install(queue)
+        self.assertEqual([
+            "dnf install -C -y /tmp/tito/foo-1.0-1.fc40.noarch.rpm",
+            "dnf reinstall -C -y /tmp/tito/bar-2.0-1.fc40.noarch.rpm",
+        ], self.installs)
+
+    def test_on_install(self):
+        queue = InstallQueue()
+        seconds = []
+        self.assertTrue(queue.add("foo", "1.0-1",
+            ["/tmp/tito/foo-1.0-1.fc40.noarch.rpm"], seconds.append))
+        self.assertFalse(queue.add("bar", "1.0-1",
+            ["/tmp/tito/bar-1.0-1.src.rpm"], seconds.append))
+        self._install(queue)
+        self.assertEqual(1, len(seconds))
+        self._install(queue)
+        self.assertEqual(1, len(seconds))
+
+    def test_same_version(self):
+        self.assertTrue(same_version("1.0-1.fc40", "1.0-1"))
+        self.assertFalse(same_version("1.0-2.fc40", "1.0-1"))
+        self.assertFalse(same_version(None, "1.0-1"))
+
+
+class InstalledVersionsTests(unittest.TestCase):
+
+    @patch("tito.builder.main.getstatusoutput")
+    def test_without_rpm_bindings(self, getstatusoutput):
+        getstatusoutput.return_value = (1, "foo 1.0-1.fc40\n"
+            "package bar is not installed")
+        with patch.dict(sys.modules, {'rpm': None}):
+            self.assertEqual({'foo': '1.0-1.fc40'},
+                Rpm().installed_versions(["foo", "bar"]))
+        self.assertEqual(1, getstatusoutput.call_count)
+        self.assertTrue(getstatusoutput.call_args[0][0].endswith(
+            "\\n' foo bar"))
@@ -0,0 +1,147 @@
+# Copyright (c) 2008-2014 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+
+import base64
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+try:
+    from SimpleXMLRPCServer import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+except ImportError:
+    from xmlrpc.server import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+
+from tito.exception import TitoException
+from tito.release.kojiapi import KojiSession
+
+
+class StubHandler(SimpleXMLRPCRequestHandler):
+    # Koji passes the session in the query string:
+    rpc_paths = ()
+
+    def do_POST(self):
+        self.server.hub.paths.append(self.path)
+        SimpleXMLRPCRequestHandler.do_POST(self)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubHub(object):
+    """ Just enough of a Koji hub to submit builds to. """
+
+    def __init__(self):
+        self.paths = []
+        self.calls = []
+        self.uploaded = {}
+        self.tasks = {}
+
+    def login(self, user, password, opts):
+        self.calls.append('login')
+        return {'session-id': 1, 'session-key': 'key'}
+
+    def logout(self):
+        self.calls.append('logout')
+
+    def uploadFile(self, path, name, size, checksum, offset, data):
+        self.calls.append('uploadFile')
+        key = "%s/%s" % (path, name)
+        if offset == -1:
+            return len(self.uploaded[key]) == size
+        self.uploaded[key] = self.uploaded.get(key, b'') + \
+            base64.b64decode(data)
+        return True
+
+    def build(self, source, target, opts):
+        if target == "missing-tag":
+            raise Exception("No such target: %s" % target)
+        task_id = len(self.tasks) + 1
+        self.tasks[task_id] = [1, 2]
+        return task_id
+
+    def getTaskInfo(self, task_id):
+        states = self.tasks[task_id]
+        return {'id': task_id, 'state': states.pop(0) if len(states) > 1
+            else states[0]}
+
+    def multiCall(self, calls):
+        self.calls.append('multiCall')
+        results = []
+        for call in calls:
+            try:
+                results.append([getattr(self, call['methodName'])(
+                    *call['params'])])
+            except Exception:
+                results.append({'faultCode': 1, 'faultString': 'failed'})
+        return results
+
+
+class KojiSessionTests(unittest.TestCase):
+
+    def setUp(self):
+        self.hub = StubHub()
+        self.server = SimpleXMLRPCServer(("127.0.0.1", 0),
+            requestHandler=StubHandler, allow_none=True, logRequests=False)
+        self.server.hub = self.hub
+        self.server.register_instance(self.hub)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+        self.session = KojiSession("http://127.0.0.1:%s/kojihub" %
+            self.server.server_address[1])
+        self.session.login("user", "password")
+
+        self.work_dir = tempfile.mkdtemp()
+        self.srpm = os.path.join(self.work_dir, "foo-1.0-1.src.rpm")
+        f = open(self.srpm, 'wb')
+        f.write(b'srpm' * 1000)
+        f.close()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.work_dir)
+
+    def test_upload_once(self):
+        source = self.session.upload(self.srpm)
+        self.assertTrue(source.startswith("cli-build/"))
+        self.assertTrue(source.endswith("/foo-1.0-1.src.rpm"))
+        self.assertEqual(b'srpm' * 1000, self.hub.uploaded[source])
+
+        self.assertEqual(source, self.session.upload(self.srpm))
+        self.assertEqual(2, self.hub.calls.count('uploadFile'))
+
+    def test_build_and_watch(self):
+        source = self.session.upload(self.srpm)
+        task_ids = self.session.build([(source, "tag-a"), (source, "tag-b")],
+            {'scratch': True})
+        self.assertEqual([1, 2], task_ids)
+        self.assertEqual(1, self.hub.calls.count('multiCall'))
+
+        changes = []
+        states = self.session.wait_for_tasks(task_ids, interval=0.01,
+            callback=lambda task_id, state: changes.append((task_id, state)))
+        self.assertEqual({1: 'CLOSED', 2: 'CLOSED'}, states)
+        self.assertEqual([(1, 'OPEN'), (2, 'OPEN'), (1, 'CLOSED'),
+            (2, 'CLOSED')], changes)
+
+        # Every call after logging in carried the session:
+        for path in self.hub.paths[1:]:
+            self.assertTrue("session-id=1&session-key=key" in path)
+
+    def test_failed_build(self):
+        self.assertRaises(TitoException, self.session.build,
+            [("src", "tag-a"), ("src", "missing-tag")])
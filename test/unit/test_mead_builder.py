@@ -0,0 +1,116 @@
+# Copyright (c) 2008-2014 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from tito.builder import MeadBuilder
+from tito.cache import get_cache_dir
+from tito.common import run_command, chdir
+from unit import make_builder
+
+GIT = "git -c user.name=Tito -c user.email=tito@example.com"
+
+
+class MeadCheckoutTests(unittest.TestCase):
+
+    def setUp(self):
+        self.repo = os.path.realpath(tempfile.mkdtemp())
+        self.build_dir = tempfile.mkdtemp()
+        with chdir(self.repo):
+            run_command("git init -q")
+            self._write("pom.xml", "1")
+            run_command("%s add -A && %s commit -q -m 'one'" % (GIT, GIT))
+            self.commit = run_command("git rev-parse HEAD")
+            self._write("pom.xml", "2")
+            run_command("%s commit -q -a -m 'two'" % GIT)
+
+        # Skip the Builder setup, only the checkout is of interest:
+        self.builder = make_builder(MeadBuilder, self.build_dir,
+            git_root=self.repo, git_commit_id=self.commit,
+            rpmbuild_dir=tempfile.mkdtemp(dir=self.build_dir),
+            deploy_dir=tempfile.mkdtemp(dir=self.build_dir),
+            maven_clone_dir=tempfile.mkdtemp(dir=self.build_dir),
+            ran_worktree=False, deploy_cached=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.repo)
+        shutil.rmtree(self.build_dir)
+
+    def _write(self, path, content):
+        f = open(path, 'w')
+        f.write(content)
+        f.close()
+
+    def _checkout(self, strategy):
+        self.builder.checkout = strategy
+        with chdir(self.repo):
+            checkout_dir = self.builder._checkout_source()
+        f = open(os.path.join(checkout_dir, "pom.xml"))
+        self.assertEqual("1", f.read())
+        f.close()
+        return checkout_dir
+
+    def test_worktree(self):
+        self._checkout('worktree')
+        self.assertTrue(self.builder.ran_worktree)
+        with chdir(self.repo):
+            self.assertEqual(2, len(run_command("git worktree list").split("\n")))
+            self.builder.cleanup()
+            self.assertEqual(1, len(run_command("git worktree list").split("\n")))
+        self.assertFalse(os.path.exists(self.builder.maven_clone_dir))
+
+    def test_shared_clone(self):
+        checkout_dir = self._checkout('shared')
+        self.assertTrue(os.path.exists(os.path.join(checkout_dir,
+            ".git", "objects", "info", "alternates")))
+
+    def test_full_clone(self):
+        self.assertEqual(self.builder.maven_clone_dir, self._checkout('clone'))
+
+
+class MeadDeployCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.build_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.build_dir)
+
+    def _builder(self, properties):
+        return make_builder(MeadBuilder, self.build_dir,
+            git_commit_id="abcdef1234567890", maven_properties=properties,
+            maven_args=['-B'], deploy_dir=tempfile.mkdtemp(dir=self.build_dir),
+            deploy_cache=get_cache_dir(self.build_dir, "maven", "deploy"),
+            deploy_cached=False,
+            maven_repo=get_cache_dir(self.build_dir, "maven", "repository"),
+            maven_cache_size=1024 * 1024)
+
+    def test_reuse_deploy(self):
+        first = self._builder(["maven.test.skip=true"])
+        self.assertFalse(first._use_cached_deploy())
+        open(os.path.join(first.deploy_dir, "foo-1.0.tar.gz"), 'w').close()
+        first._cache_deploy()
+        self.assertTrue(first.deploy_cached)
+
+        second = self._builder(["maven.test.skip=true"])
+        temp_deploy_dir = second.deploy_dir
+        self.assertTrue(second._use_cached_deploy())
+        self.assertEqual(first.deploy_dir, second.deploy_dir)
+        self.assertFalse(os.path.exists(temp_deploy_dir))
+        self.assertEqual(["foo-1.0.tar.gz"], os.listdir(second.deploy_dir))
+
+        # Different Maven settings need their own build:
+        self.assertFalse(self._builder([])._use_cached_deploy())
@@ -0,0 +1,205 @@
+# Copyright (c) 2008-2014 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from mock import patch
+
+from tito.builder import Builder, MockBuilder
+from tito.exception import TitoException
+from unit import Capture, make_builder
+
+
+class StubWorkers(object):
+    """ Pretends to run mock on a worker, which built a single rpm. """
+
+    def __init__(self):
+        self.jobs = []
+
+    def run(self, command, files, collect, dest_dir, log=None):
+        self.jobs.append((command, files, collect, dest_dir))
+        result_dir = os.path.join(dest_dir, os.path.dirname(collect[0]))
+        os.makedirs(result_dir)
+        paths = []
+        for name in ["foo-1.0-1.x86_64.rpm", "foo-1.0-1.src.rpm"]:
+            paths.append(os.path.join(result_dir, name))
+            open(paths[-1], 'w').close()
+        return paths
+
+
+class BrokenWorkers(object):
+    """ Pretends the worker went away during the build. """
+
+    def run(self, command, files, collect, dest_dir, log=None):
+        raise TitoException("Worker builder1 exited during: %s" % command)
+
+
+class MockBuilderTests(unittest.TestCase):
+
+    def setUp(self):
+        self.build_dir = tempfile.mkdtemp()
+        self.calls = []
+        self.lock = threading.Lock()
+
+        # Skip the normal builder and git lookups, only the mock calls are
+        # of interest:
+        self.builder = make_builder(MockBuilder, self.build_dir,
+            display_version="1.0",
+            srpm_location=os.path.join(self.build_dir, "foo-1.0-1.src.rpm"),
+            mock_cmd_args="", speedup=False, single_run=False, mock_jobs=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.build_dir)
+
+    def _run_command(self, cmd):
+        with self.lock:
+            self.calls.append(cmd)
+        args = cmd.split()
+        if "--copyout" in args:
+            # Pretend the chroot built an rpm named after itself:
+            out_dir = args[-1]
+            os.makedirs(out_dir)
+            mock_tag = os.path.basename(args[args.index("-r") + 1])
+            open(os.path.join(out_dir, "foo-1.0-1.%s.rpm" % mock_tag),
+                'w').close()
+        elif "--resultdir" in cmd:
+            out_dir = cmd.split("--resultdir=")[1]
+            os.makedirs(out_dir)
+            for name in ["foo-1.0-1.x86_64.rpm", "foo-1.0-1.src.rpm",
+                    "build.log"]:
+                open(os.path.join(out_dir, name), 'w').close()
+        return ""
+
+    def test_single_chroot(self):
+        self.builder.mock_tags = ["fedora-rawhide-x86_64"]
+        self.builder.mock_tag = self.builder.mock_tags[0]
+        with patch("tito.builder.main.run_command", self._run_command):
+            self.builder.rpm()
+        self.assertEqual([os.path.join(self.build_dir,
+            "foo-1.0-1.fedora-rawhide-x86_64.rpm")], self.builder.artifacts)
+        for cmd in self.calls:
+            self.assertFalse("--uniqueext" in cmd)
+
+    def test_multiple_chroots(self):
+        self.builder.mock_tags = ["epel-8-x86_64", "epel-9-x86_64",
+            "fedora-rawhide-x86_64"]
+        self.builder.mock_tag = self.builder.mock_tags[0]
+        with patch("tito.builder.main.run_command", self._run_command):
+            self.builder.rpm()
+
+        expected = [os.path.join(self.build_dir, tag, "foo-1.0-1.%s.rpm" %
+            tag) for tag in self.builder.mock_tags]
+        self.assertEqual(sorted(expected), sorted(self.builder.artifacts))
+        for path in expected:
+            self.assertTrue(os.path.exists(path))
+
+        self.assertEqual(sorted(["mock:%s" % tag for tag in
+            self.builder.mock_tags]), sorted(self.builder.timer.stages))
+
+        rebuilds = [cmd for cmd in self.calls if "--rebuild" in cmd]
+        self.assertEqual(3, len(rebuilds))
+        for cmd in rebuilds:
+            self.assertTrue("--uniqueext=tito%s" % os.getpid() in cmd)
+            self.assertTrue(self.builder.srpm_location in cmd)
+
+    def test_config_file_chroots(self):
+        config = os.path.join(self.build_dir, "mock", "custom.cfg")
+        self.builder.mock_tags = [config, "epel-9-x86_64"]
+        self.builder.mock_tag = self.builder.mock_tags[0]
+        with patch("tito.builder.main.run_command", self._run_command):
+            self.builder.rpm()
+
+        # Output goes in the build dir, named after the config file:
+        self.assertEqual(sorted([
+            os.path.join(self.build_dir, "custom", "foo-1.0-1.custom.cfg.rpm"),
+            os.path.join(self.build_dir, "epel-9-x86_64",
+                "foo-1.0-1.epel-9-x86_64.rpm"),
+        ]), sorted(self.builder.artifacts))
+        self.assertFalse(os.path.exists(os.path.dirname(config)))
+        self.assertTrue(os.path.isdir(os.path.join(
+            self.builder.rpmbuild_dir, "mockoutput-custom")))
+        # Though mock itself is still given the path:
+        self.assertEqual(1, len([cmd for cmd in self.calls
+            if "--rebuild" in cmd and " -r %s " % config in cmd]))
+
+    def test_single_run(self):
+        self.builder.mock_tags = ["fedora-rawhide-x86_64"]
+        self.builder.mock_tag = self.builder.mock_tags[0]
+        self.builder.single_run = True
+        with patch("tito.builder.main.run_command", self._run_command):
+            self.builder.rpm()
+
+        self.assertEqual(1, len(self.calls))
+        self.assertTrue(" --rebuild %s --resultdir=" %
+            self.builder.srpm_location in self.calls[0])
+        rpm_path = os.path.join(self.build_dir, "foo-1.0-1.x86_64.rpm")
+        self.assertEqual([rpm_path], self.builder.artifacts)
+        self.assertTrue(os.path.exists(rpm_path))
+
+    def test_worker(self):
+        self.builder.mock_tags = ["fedora-rawhide-x86_64"]
+        self.builder.mock_tag = self.builder.mock_tags[0]
+        self.builder.workers = StubWorkers()
+        open(self.builder.srpm_location, 'w').close()
+        with patch("tito.builder.main.run_command", self._run_command):
+            self.builder.rpm()
+
+        # Only the srpm's name is known to the worker, and nothing ran here:
+        self.assertEqual([], self.calls)
+        command, files, collect, dest_dir = self.builder.workers.jobs[0]
+        self.assertTrue(" --rebuild foo-1.0-1.src.rpm "
+            "--resultdir=$PWD/mockresult-fedora-rawhide-x86_64" in command)
+        self.assertEqual([self.builder.srpm_location], files)
+        self.assertEqual(self.builder.rpmbuild_dir, dest_dir)
+        self.assertEqual([os.path.join(self.build_dir,
+            "foo-1.0-1.x86_64.rpm")], self.builder.artifacts)
+
+    def test_worker_lost(self):
+        self.builder.mock_tags = ["fedora-rawhide-x86_64"]
+        self.builder.mock_tag = self.builder.mock_tags[0]
+        self.builder.workers = BrokenWorkers()
+        with Capture(silent=True) as capture:
+            self.assertRaises(SystemExit, self.builder.rpm)
+        self.assertTrue("Build worker failed: Worker builder1 exited" in
+            capture.err)
+
+    def test_rpmbuild_worker_lost(self):
+        builder = make_builder(Builder, self.build_dir,
+            workers=BrokenWorkers(), quiet=True,
+            srpm_location=self.builder.srpm_location)
+        with patch("tito.builder.main.scl_to_rpm_option",
+                lambda scl, silent=False: ""):
+            with Capture(silent=True) as capture:
+                self.assertRaises(SystemExit, builder._rpm_on_worker)
+        self.assertTrue("Build worker failed: Worker builder1 exited" in
+            capture.err)
+
+    @patch("tito.builder.main.Builder.__init__", lambda *a, **kw: None)
+    @patch("tito.builder.main.create_builder")
+    def test_cache_args(self, create_builder):
+        builder = MockBuilder(args={
+            'mock': ['epel-9-x86_64'],
+            'mock_root_cache': ['0'],
+            'mock_package_cache': ['1'],
+            'mock_bootstrap_image': ['quay.io/centos/centos:stream9'],
+            'mock_single_run': ['1'],
+        })
+        self.assertEqual(" --disable-plugin=root_cache "
+            "--enable-plugin=yum_cache --use-bootstrap-image "
+            "--bootstrap-image=quay.io/centos/centos:stream9",
+            builder.mock_cmd_args)
+        self.assertTrue(builder.single_run)
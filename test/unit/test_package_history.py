@@ -0,0 +1,162 @@
+# Copyright (c) 2008-2014 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import Mock, patch
+
+from tito.common import run_command, chdir
+from tito.exception import TitoException
+from tito.tagger.main import PackageHistory, VersionTagger
+
+GIT = "git -c user.name=Tito -c user.email=tito@example.com"
+
+
+class PackageHistoryTests(unittest.TestCase):
+
+    def setUp(self):
+        self.repo = tempfile.mkdtemp()
+        with chdir(self.repo):
+            run_command("git init -q")
+            for pkg in ["a", "b", "c"]:
+                os.mkdir(pkg)
+                self._write("%s/file" % pkg, "1")
+            self._commit("initial")
+            run_command("git tag a-1.0-1 && git tag b-1.0-1")
+            self._write("a/file", "2")
+            self._commit("change a")
+            run_command("git tag c-1.0-1")
+            self._write("b/file", "3")
+            self._commit("change b")
+            self._write("a/file", "4")
+            self._write("c/file", "4")
+            self._commit("change a and c")
+
+    def tearDown(self):
+        shutil.rmtree(self.repo)
+
+    def _write(self, path, content):
+        f = open(path, 'w')
+        f.write(content)
+        f.close()
+
+    def _commit(self, msg):
+        run_command("%s add -A && %s commit -q -m '%s'" % (GIT, GIT, msg))
+
+    def _history(self):
+        packages = {}
+        for pkg in ["a", "b", "c"]:
+            commit = run_command("git rev-parse %s-1.0-1^{commit}" % pkg)
+            packages[pkg] = (commit, "%s/" % pkg)
+        packages["root"] = (commit, "./")
+        return PackageHistory(packages)
+
+    def test_changes_since_each_tag(self):
+        with chdir(self.repo):
+            history = self._history()
+            self.assertEqual(["a", "b", "c", "root"],
+                history.changed_packages())
+            self.assertEqual("change a and c\nchange a",
+                history.log("a", "%s"))
+            self.assertEqual("change b", history.log("b", "%s"))
+            self.assertEqual("change a and c", history.log("c", "%s"))
+            self.assertEqual("change a and c (tito@example.com)",
+                history.log("c", "%s (%ae)"))
+
+    def test_unchanged_package(self):
+        with chdir(self.repo):
+            run_command("git tag b-1.0-2")
+            commit = run_command("git rev-parse HEAD")
+            history = PackageHistory({"b": (commit, "b/")})
+            self.assertEqual([], history.changed_packages())
+            self.assertEqual("", history.log("b", "%s"))
+
+    def test_merges(self):
+        with chdir(self.repo):
+            # Only the side branch changes a:
+            run_command("git checkout -q -b side")
+            self._write("a/file", "5")
+            self._commit("side changes a")
+            run_command("git checkout -q -")
+            self._write("b/file", "5")
+            self._commit("change b again")
+            run_command("%s merge -q --no-ff -m 'merge side' side" % GIT)
+            # Both sides change a:
+            run_command("git checkout -q -b other")
+            self._write("a/other", "6")
+            self._commit("other changes a")
+            run_command("git checkout -q -")
+            self._write("a/more", "6")
+            self._commit("change a again")
+            run_command("%s merge -q --no-ff -m 'merge other' other" % GIT)
+
+            history = self._history()
+            for no_merges in [True, False]:
+                git_log = "git log --pretty=%%s %s a-1.0-1..HEAD -- a" % (
+                    no_merges and "--no-merges" or "")
+                # The same commits, if not in the same order when they
+                # share a timestamp:
+                self.assertEqual(sorted(run_command(git_log).split("\n")),
+                    sorted(history.log("a", "%s",
+                    no_merges=no_merges).split("\n")))
+            self.assertTrue("merge other" in history.log("a", "%s",
+                no_merges=False))
+
+
+class RunBulkTests(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.options = Mock()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def _tagger(self, name, new_version):
+        tagger = Mock(spec=VersionTagger)
+        tagger.project_name = name
+        tagger.full_project_dir = self.work_dir
+        tagger.run.return_value = new_version
+
+        def commit_message(version):
+            return "Automatic commit of package [%s] [%s]." % (name, version)
+        tagger._get_commit_message.side_effect = commit_message
+        tagger._get_new_tag.side_effect = lambda v: "%s-%s" % (name, v)
+        return tagger
+
+    @patch("tito.tagger.main.run_command")
+    def test_commit_and_tag(self, run_command):
+        taggers = [self._tagger("a", "1.0-2"), self._tagger("b", "2.0-1")]
+        with patch("sys.stdout"):
+            VersionTagger.run_bulk(taggers, self.options, None)
+        self.assertTrue("[a] [1.0-2]" in run_command.call_args[0][0])
+        self.assertTrue("[b] [2.0-1]" in run_command.call_args[0][0])
+        taggers[0]._create_tag.assert_called_once_with("1.0-2")
+        taggers[1]._create_tag.assert_called_once_with("2.0-1")
+
+    @patch("tito.tagger.main.run_command")
+    def test_unsupported_tagger(self, run_command):
+        # Refused before any package is touched:
+        taggers = [self._tagger("a", "1.0-2"), Mock(project_name="b")]
+        self.assertRaises(TitoException, VersionTagger.run_bulk, taggers,
+            self.options, None)
+        self.assertEqual(0, taggers[0].run.call_count)
+
+        # A custom tagger which doesn't stage a version:
+        taggers = [self._tagger("a", "1.0-2"), self._tagger("b", None)]
+        self.assertRaises(TitoException, VersionTagger.run_bulk, taggers,
+            self.options, None)
+        self.assertEqual(0, run_command.call_count)
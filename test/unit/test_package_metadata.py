@@ -0,0 +1,67 @@
+# Copyright (c) 2008-2014 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from tito.common import PackageMetadataIndex, get_package_metadata_index
+
+
+class PackageMetadataIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        self.git_root = tempfile.mkdtemp()
+        self.metadata_dir = os.path.join(self.git_root, ".tito", "packages")
+        os.makedirs(self.metadata_dir)
+        self._write(".readme", "the .tito/packages directory contains...\n")
+        self._write("pkg-a", "1.0-1 a/\n")
+        self._write("pkg-b", "2.3-4 b/\n")
+        self._write("pkg-b-old", "2.0-1 b/\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.git_root)
+
+    def _write(self, name, content):
+        f = open(os.path.join(self.metadata_dir, name), 'w')
+        f.write(content)
+        f.close()
+
+    def test_lookups(self):
+        index = PackageMetadataIndex(self.metadata_dir)
+        self.assertEqual(["pkg-a", "pkg-b", "pkg-b-old"], index.names())
+        self.assertEqual(("2.3-4", "b/"), index.get("pkg-b"))
+        self.assertEqual("1.0-1", index.get_version("pkg-a"))
+        self.assertEqual(None, index.get_version("missing"))
+        self.assertEqual(["pkg-b", "pkg-b-old"], index.packages_in_dir("b/"))
+        self.assertEqual([], index.packages_in_dir("c/"))
+
+    def test_update_and_remove(self):
+        index = PackageMetadataIndex(self.metadata_dir)
+        index.remove("pkg-b-old")
+        index.update("pkg-b", "2.4-1", "b/")
+        index.update("pkg-c", "0.1-1", "c/")
+        self.assertEqual(["pkg-b"], index.packages_in_dir("b/"))
+        self.assertEqual(["pkg-c"], index.packages_in_dir("c/"))
+        self.assertEqual("2.4-1", index.get_version("pkg-b"))
+
+    def test_loaded_once(self):
+        index = get_package_metadata_index(self.git_root)
+        self.assertTrue(index is get_package_metadata_index(self.git_root))
+
+        # New files (i.e. from a git checkout) are noticed:
+        self._write("pkg-new", "0.0.1-1 new/\n")
+        os.utime(self.metadata_dir, (0, 0))
+        self.assertEqual("0.0.1-1",
+            get_package_metadata_index(self.git_root).get_version("pkg-new"))
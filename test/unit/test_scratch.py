@@ -0,0 +1,151 @@
+# Copyright (c) 2008-2014 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from mock import patch
+
+from tito.builder import Builder, NoTgzBuilder
+from tito.scratch import get_scratch_space, estimate_size, record_size, \
+    ScratchSpace
+from unit import Capture, make_builder
+
+MB = 1024 * 1024
+
+
+class ScratchSpaceTests(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.scratch = ScratchSpace(os.path.join(self.work_dir, "scratch"),
+            10 * MB)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_get_scratch_space(self):
+        self.assertEqual(None, get_scratch_space({}))
+        scratch = get_scratch_space({'SCRATCH_DIR': '/dev/shm/tito',
+            'SCRATCH_SIZE': '100'})
+        self.assertEqual('/dev/shm/tito', scratch.path)
+        self.assertEqual(100 * MB, scratch.size)
+        with Capture(silent=True):
+            scratch = get_scratch_space({'SCRATCH_DIR': '/dev/shm/tito',
+                'SCRATCH_SIZE': 'lots'})
+        self.assertEqual(2048 * MB, scratch.size)
+
+    def test_estimate_size(self):
+        source = os.path.join(self.work_dir, "foo-1.0.tar.gz")
+        f = open(source, 'wb')
+        f.write(b"x" * 1000)
+        f.close()
+        history = os.path.join(self.work_dir, "foo.json")
+        self.assertEqual(5000, estimate_size(history, [source]))
+        record_size(history, 4000)
+        self.assertEqual(5000, estimate_size(history, []))
+
+    def test_budget(self):
+        first = self.scratch.reserve("rpmbuild-foo", 6 * MB)
+        self.assertTrue(first.startswith(self.scratch.path))
+        self.assertTrue(os.path.isdir(first))
+        # A concurrent build would oversubscribe it:
+        self.assertEqual(None, self.scratch.reserve("rpmbuild-bar", 6 * MB))
+        second = self.scratch.reserve("rpmbuild-bar", 4 * MB)
+        self.assertTrue(second)
+
+        self.scratch.release(first)
+        self.assertFalse(os.path.exists(first))
+        self.assertTrue(self.scratch.reserve("rpmbuild-bar", 6 * MB))
+
+    def test_stale_reservation(self):
+        process = subprocess.Popen(["true"])
+        process.wait()
+        stale = self.scratch.reserve("rpmbuild-foo", 6 * MB)
+        reservation = os.path.join(self.scratch.reservations_dir,
+            os.path.basename(stale))
+        f = open(reservation, 'w')
+        json.dump({'pid': process.pid, 'size': 6 * MB}, f)
+        f.close()
+
+        self.assertTrue(self.scratch.reserve("rpmbuild-bar", 6 * MB))
+        self.assertFalse(os.path.exists(stale))
+        self.assertFalse(os.path.exists(reservation))
+
+
+class BuilderScratchTests(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.builder = make_builder(Builder, self.work_dir,
+            scratch=ScratchSpace(os.path.join(self.work_dir, "scratch"),
+            10 * MB))
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_reserve_and_release(self):
+        builder = self.builder
+        builder._reserve_scratch()
+        scratch_dir = builder.scratch_dir
+        self.assertEqual(os.path.join(scratch_dir, "BUILD"),
+            builder.rpmbuild_builddir)
+        self.assertEqual("", builder._get_clean_option())
+
+        f = open(os.path.join(builder.rpmbuild_builddir, "foo.o"), 'wb')
+        f.write(b"x" * 1000)
+        f.close()
+        builder._release_scratch()
+        self.assertFalse(os.path.exists(scratch_dir))
+        self.assertEqual(os.path.join(builder.rpmbuild_dir, "BUILD"),
+            builder.rpmbuild_builddir)
+        self.assertEqual("--clean", builder._get_clean_option())
+
+        # Sized from the last build this time:
+        reserved = []
+        builder.scratch.reserve = lambda name, size: reserved.append(size)
+        with patch("tito.builder.main.info_out"):
+            builder._reserve_scratch()
+        self.assertEqual([1250], reserved)
+
+    def test_no_room(self):
+        builder = self.builder
+        source = os.path.join(self.work_dir, "foo-1.0.tar.gz")
+        f = open(source, 'wb')
+        f.seek(3 * MB)
+        f.write(b"x")
+        f.close()
+        builder.sources = [source]
+        with patch("tito.builder.main.info_out") as info_out:
+            builder._reserve_scratch()
+        self.assertEqual(None, builder.scratch_dir)
+        self.assertEqual(os.path.join(builder.rpmbuild_dir, "BUILD"),
+            builder.rpmbuild_builddir)
+        self.assertTrue(info_out.call_args[0][0].startswith(
+            "Not enough scratch space"))
+
+    def test_no_tgz_sources_reusable(self):
+        builder = make_builder(NoTgzBuilder, self.work_dir,
+            rpmbuild_gitcopy=self.work_dir, scratch=self.builder.scratch,
+            _setup_sources=lambda: None,
+            _list_spec_sources=lambda: ["foo-1.0.tar.gz"])
+        builder.tgz()
+
+        builder._reserve_scratch()
+        builder.scratch.release(builder.scratch_dir)
+        self.assertEqual([os.path.join(self.work_dir, "foo-1.0.tar.gz")],
+            list(builder.sources))
@@ -0,0 +1,71 @@
+# Copyright (c) 2008-2014 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+"""
+Guards against tito's command line startup getting slow again.
+"""
+
+import os
+import subprocess
+import sys
+import unittest
+
+import tito
+
+# Seconds importing the CLI may take. Deliberately generous, a regression
+# (i.e. pulling in every builder and rpm) blows well past it:
+STARTUP_BUDGET = 1.0
+
+# Modules which only the subcommands that need them should be importing:
+HEAVY_MODULES = [
+    'rpm',
+    'bugzilla',
+    'koji',
+    'pkg_resources',
+    'tito.builder',
+    'tito.release',
+    'tito.tagger',
+]
+
+IMPORT_CLI = """
+import sys
+import time
+start = time.time()
+import tito.cli
+print(time.time() - start)
+print(" ".join(sys.modules.keys()))
+"""
+
+
+class StartupTests(unittest.TestCase):
+
+    def setUp(self):
+        env = os.environ.copy()
+        src_dir = os.path.dirname(os.path.dirname(tito.__file__))
+        env['PYTHONPATH'] = os.pathsep.join(
+            [src_dir] + sys.path[1:])
+        p = subprocess.Popen([sys.executable, "-c", IMPORT_CLI],
+            stdout=subprocess.PIPE, env=env, universal_newlines=True)
+        output = p.communicate()[0]
+        self.assertEqual(0, p.returncode)
+        lines = output.split("\n")
+        self.elapsed = float(lines[0])
+        self.modules = lines[1].split()
+
+    def test_heavy_modules_not_imported(self):
+        for module in HEAVY_MODULES:
+            self.assertFalse(module in self.modules,
+                "importing tito.cli imported %s" % module)
+
+    def test_startup_budget(self):
+        self.assertTrue(self.elapsed < STARTUP_BUDGET,
+            "importing tito.cli took %.2fs" % self.elapsed)
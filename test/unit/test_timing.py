@@ -0,0 +1,161 @@
+# Copyright (c) 2008-2014 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from mock import Mock, patch
+
+from tito.builder import Builder
+from tito.builder.main import InstallQueue
+from tito.release import Releaser
+from tito.timing import BuildTimer, HISTORY_FILENAME, read_history, \
+    percentile, trend, format_report
+from unit import Capture, make_builder
+
+
+class BuildTimerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.build_dir = tempfile.mkdtemp()
+        self.history = os.path.join(self.build_dir, HISTORY_FILENAME)
+
+    def tearDown(self):
+        shutil.rmtree(self.build_dir)
+
+    def test_record_and_read(self):
+        rpm = os.path.join(self.build_dir, "foo-1.0-1.noarch.rpm")
+        f = open(rpm, 'wb')
+        f.write(b'x' * 10)
+        f.close()
+
+        timer = BuildTimer()
+        with timer.stage("srpm"):
+            pass
+        timer.add("rpm", 2.0)
+        timer.add("rpm", 1.0)
+        timer.cache_hit("srpm")
+        timer.record(self.history, "foo", "foo-1.0-1", "Builder", [rpm])
+        timer.reset()
+        timer.add("rpm", 5.0)
+        timer.record(self.history, "bar", "bar-2.0-1", "Builder", [], False)
+
+        # A partially written line is skipped:
+        f = open(self.history, 'a')
+        f.write('{"package": "fo')
+        f.close()
+
+        entries = read_history(self.history)
+        self.assertEqual(["foo", "bar"], [e['package'] for e in entries])
+        foo = read_history(self.history, "foo")[0]
+        self.assertEqual(3.0, foo['stages']['rpm'])
+        self.assertTrue('srpm' in foo['stages'])
+        self.assertEqual(["srpm"], foo['cache_hits'])
+        self.assertEqual({"foo-1.0-1.noarch.rpm": 10}, foo['artifacts'])
+        self.assertTrue(foo['ok'])
+        self.assertFalse(entries[1]['ok'])
+        self.assertEqual([], read_history(self.history + ".missing"))
+
+    def test_statistics(self):
+        self.assertEqual(2.5, percentile([4, 1, 3, 2], 50))
+        self.assertEqual(4, percentile([4, 1, 3, 2], 100))
+        self.assertEqual(None, percentile([], 50))
+        self.assertEqual(None, trend([1] * 9))
+        self.assertEqual(1.0, trend([1] * 5 + [2] * 5))
+
+    def test_report(self):
+        entries = []
+        for i in range(10):
+            entries.append({'package': 'foo', 'time': i, 'total': 10 + i,
+                'stages': {'rpm': 1 + i}, 'cache_hits': i % 2 and ['srpm'] or
+                [], 'artifacts': {'foo.rpm': 1024 * 1024}, 'ok': True})
+        entries.append({'package': 'foo', 'time': 10, 'total': 100,
+            'stages': {'rpm': 100}, 'cache_hits': [], 'artifacts': {},
+            'ok': False})
+        lines = format_report(entries)
+        self.assertTrue(lines[0].startswith("foo (10 builds, last "))
+        self.assertEqual(["total", "rpm"], [line.split()[0] for line in
+            lines[2:4]])
+        rpm = lines[3].split()
+        self.assertEqual(["10", "5.5s", "9.1s", "10.0s", "+167%"], rpm[1:])
+        self.assertEqual("  cache hits: srpm 5/10", lines[4])
+        self.assertEqual("  artifacts: 1.0 MB", lines[5])
+
+
+class BuilderTimingTests(unittest.TestCase):
+
+    def setUp(self):
+        self.build_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.build_dir)
+
+    def test_run_records_stages(self):
+        builder = make_builder(Builder, self.build_dir,
+            build_tag="foo-1.0-1", tgz=Mock(), srpm=Mock(), cleanup=Mock())
+
+        options = Mock(tgz=True, srpm=True, rpm=False, no_cleanup=False)
+        with Capture(silent=True):
+            builder.run(options)
+            builder.srpm.side_effect = SystemExit(1)
+            self.assertRaises(SystemExit, builder.run, options)
+
+        entries = read_history(os.path.join(self.build_dir, HISTORY_FILENAME))
+        self.assertEqual([True, False], [e['ok'] for e in entries])
+        self.assertEqual(["srpm", "tgz"], sorted(entries[0]['stages']))
+        self.assertEqual("Builder", entries[0]['builder'])
+
+    def test_shared_install_recorded_after_install(self):
+        builder = make_builder(Builder, self.build_dir,
+            build_tag="foo-1.0-1", build_version="1.0-1", auto_install=True,
+            install_queue=InstallQueue(), rpm=Mock(), cleanup=Mock(),
+            _check_build_deps=Mock())
+        rpm = os.path.join(self.build_dir, "foo-1.0-1.noarch.rpm")
+
+        def build():
+            builder.artifacts.append(rpm)
+        builder.rpm.side_effect = build
+
+        options = Mock(tgz=False, srpm=False, rpm=True, no_cleanup=False)
+        with Capture(silent=True):
+            builder.run(options)
+        history = os.path.join(self.build_dir, HISTORY_FILENAME)
+        self.assertEqual([], read_history(history))
+
+        with patch.object(builder.install_queue, "_install") as install:
+            install.side_effect = lambda builds: time.sleep(0.01)
+            builder.install_queue.install()
+        entries = read_history(history)
+        self.assertEqual(1, len(entries))
+        self.assertTrue(entries[0]['stages']['_auto_install'] >= 0.01)
+
+    def test_release_records_stages(self):
+        builder = make_builder(Builder, self.build_dir,
+            build_tag="foo-1.0-1")
+        releaser = Releaser.__new__(Releaser)
+        releaser.builder = builder
+
+        # Nothing was built:
+        releaser.record_build_times(True)
+        history = os.path.join(self.build_dir, HISTORY_FILENAME)
+        self.assertEqual([], read_history(history))
+
+        with builder.timer.stage("srpm"):
+            pass
+        releaser.record_build_times(False)
+        entries = read_history(history)
+        self.assertEqual([False], [e['ok'] for e in entries])
+        self.assertEqual(["srpm"], list(entries[0]['stages']))
@@ -0,0 +1,170 @@
+# Copyright (c) 2008-2014 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import patch
+
+from tito.builder import UpstreamBuilder
+from tito.distributionbuilder import DistributionBuilder
+from tito.common import run_command, chdir
+from unit import Capture, make_builder
+
+GIT = "git -c user.name=Tito -c user.email=tito@example.com"
+
+SPEC = """Name: foo
+Version: 1.0
+Release: 2
+Source0: foo-1.0.tar.gz
+
+%prep
+%setup -q
+
+%build
+"""
+
+
+class UpstreamPatchTests(unittest.TestCase):
+
+    def setUp(self):
+        self.old_cwd = os.getcwd()
+        self.repo = os.path.realpath(tempfile.mkdtemp())
+        self.build_dir = tempfile.mkdtemp()
+        with chdir(self.repo):
+            run_command("git init -q")
+            self._write("foo.txt", "one\n")
+            run_command("%s add -A && %s commit -q -m 'one'" % (GIT, GIT))
+            run_command("git tag foo-1.0-1")
+            self._write("foo.txt", "two\n")
+            run_command("%s commit -q -a -m 'two'" % GIT)
+        self.calls = []
+
+    def tearDown(self):
+        os.chdir(self.old_cwd)
+        shutil.rmtree(self.repo)
+        shutil.rmtree(self.build_dir)
+
+    def _write(self, path, content, mode='w'):
+        f = open(path, mode)
+        f.write(content)
+        f.close()
+
+    def _builder(self):
+        # Skip the Builder setup, only the patch generation is of interest:
+        with chdir(self.repo):
+            commit = run_command("git rev-parse HEAD")
+        builder = make_builder(UpstreamBuilder, self.build_dir,
+            build_version="1.0-2", upstream_tag="foo-1.0-1",
+            git_root=self.repo, relative_project_dir="/",
+            git_commit_id=commit,
+            rpmbuild_gitcopy=tempfile.mkdtemp(dir=self.build_dir),
+            rpmbuild_sourcedir=tempfile.mkdtemp(dir=self.build_dir))
+        builder.spec_file = os.path.join(builder.rpmbuild_sourcedir,
+            "foo.spec")
+        self._write(builder.spec_file, SPEC)
+        return builder
+
+    def _run_command(self, cmd):
+        self.calls.append(cmd)
+        return run_command(cmd)
+
+    def _patch(self, builder):
+        with patch("tito.builder.main.run_command", self._run_command):
+            with Capture(silent=True):
+                builder.patch_upstream()
+        return os.path.join(builder.rpmbuild_sourcedir,
+            "foo-1.0-1-to-foo-1.0-2.patch")
+
+    def test_patch_cached(self):
+        patch_file = self._patch(self._builder())
+        self.assertTrue("+two\n" in open(patch_file).read())
+        diffs = [cmd for cmd in self.calls if cmd.startswith("git diff ")]
+        self.assertEqual(2, len(diffs))
+
+        # Another build of the same commit reuses the patch:
+        builder = self._builder()
+        patch_file = self._patch(builder)
+        self.assertTrue("+two\n" in open(patch_file).read())
+        diffs = [cmd for cmd in self.calls if cmd.startswith("git diff ")]
+        self.assertEqual(2, len(diffs))
+        self.assertEqual(["patches"], builder.timer.cache_hits)
+        spec = open(builder.spec_file).read()
+        self.assertTrue("Patch0: foo-1.0-1-to-foo-1.0-2.patch\n" in spec)
+        self.assertTrue("%patch0 -p1\n" in spec)
+
+        # A new commit does not:
+        with chdir(self.repo):
+            self._write("foo.txt", "three\n")
+            run_command("%s commit -q -a -m 'three'" % GIT)
+        patch_file = self._patch(self._builder())
+        self.assertTrue("+three\n" in open(patch_file).read())
+
+    def test_binary_changes(self):
+        with chdir(self.repo):
+            self._write("foo.bin", b"\0\1\2", 'wb')
+            run_command("%s add foo.bin && %s commit -q -m 'binary'" %
+                (GIT, GIT))
+        builder = self._builder()
+        with Capture(silent=True):
+            self.assertRaises(SystemExit, self._patch, builder)
+
+
+class DistributionPatchTests(UpstreamPatchTests):
+
+    def _builder(self):
+        builder = UpstreamPatchTests._builder(self)
+        builder.__class__ = DistributionBuilder
+        builder.upstream_version = "1.0"
+        builder.patch_files = []
+        return builder
+
+    def _generate_patches(self, cmd):
+        # Stands in for generate-patches.pl, one patch per release:
+        self.calls.append(cmd)
+        out_dir = cmd.split()[2]
+        names = []
+        for release in [2, 3]:
+            name = "foo-1.0-1-to-foo-1.0-%s.patch" % release
+            content = "+release %s\n" % release
+            if self.binary:
+                content = "Binary files a/foo.bin and b/foo.bin differ\n"
+            self._write(os.path.join(out_dir, name), content)
+            names.append(name)
+        return "\n".join(names)
+
+    def _patch(self, builder):
+        with patch("tito.distributionbuilder.run_command",
+                self._generate_patches):
+            builder.patch_upstream()
+        return builder
+
+    def test_patch_cached(self):
+        self.binary = False
+        self._patch(self._builder())
+        builder = self._patch(self._builder())
+        self.assertEqual(1, len(self.calls))
+        self.assertEqual(["foo-1.0-1-to-foo-1.0-2.patch",
+            "foo-1.0-1-to-foo-1.0-3.patch"], builder.patch_files)
+        for name in builder.patch_files:
+            self.assertTrue(os.path.exists(os.path.join(
+                builder.rpmbuild_sourcedir, name)))
+        spec = open(builder.spec_file).read()
+        self.assertTrue("Patch1: foo-1.0-1-to-foo-1.0-3.patch\n" in spec)
+
+    def test_binary_changes(self):
+        self.binary = True
+        with Capture(silent=True):
+            self.assertRaises(SystemExit, self._patch, self._builder())
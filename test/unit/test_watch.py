@@ -0,0 +1,116 @@
+# Copyright (c) 2008-2014 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+
+from tito.common import update_tgz
+from tito.watch import PollingWatcher, InotifyWatcher
+
+
+def write(path, content):
+    f = open(path, 'w')
+    f.write(content)
+    f.close()
+
+
+class WatcherTests(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.root, "src"))
+        os.makedirs(os.path.join(self.root, ".git"))
+        write(os.path.join(self.root, "foo.spec"), "Name: foo\n")
+        write(os.path.join(self.root, "src", "old.py"), "old\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _make_changes(self):
+        write(os.path.join(self.root, "foo.spec"), "Name: foo\nVersion: 2\n")
+        write(os.path.join(self.root, "src", "new.py"), "new\n")
+        write(os.path.join(self.root, ".git", "index"), "ignored\n")
+        os.remove(os.path.join(self.root, "src", "old.py"))
+
+    def test_polling_watcher(self):
+        watcher = PollingWatcher(self.root, interval=0.01)
+        self.assertEqual(set(), watcher.poll(0))
+        self._make_changes()
+        self.assertEqual(set(["foo.spec", "src/new.py", "src/old.py"]),
+            watcher.poll(1))
+        self.assertEqual(set(), watcher.poll(0))
+
+    def test_inotify_watcher(self):
+        try:
+            watcher = InotifyWatcher(self.root)
+        except OSError:
+            self.skipTest("inotify not available")
+        try:
+            self._make_changes()
+            os.makedirs(os.path.join(self.root, "newdir"))
+            write(os.path.join(self.root, "newdir", "a.txt"), "a\n")
+            changed = set()
+            while True:
+                more = watcher.poll(0.2)
+                if not more:
+                    break
+                changed.update(more)
+            self.assertEqual(set(["foo.spec", "src/new.py", "src/old.py",
+                "newdir/a.txt"]), changed)
+        finally:
+            watcher.close()
+
+
+class UpdateTgzTests(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.project = os.path.join(self.workdir, "project")
+        os.makedirs(self.project)
+        write(os.path.join(self.project, "keep.txt"), "keep\n")
+        write(os.path.join(self.project, "change.txt"), "before\n")
+        write(os.path.join(self.project, "remove.txt"), "remove\n")
+
+        # Stand in for what create_tgz leaves behind:
+        self.tgz = os.path.join(self.workdir, "foo-1.0.tar.gz")
+        tar = tarfile.open(os.path.join(self.workdir, "foo-1.0.tar.tar"), "w",
+            format=tarfile.PAX_FORMAT, pax_headers={"comment": "abc123"})
+        for name in ["keep.txt", "change.txt", "remove.txt"]:
+            tar.add(os.path.join(self.project, name), "foo-1.0/%s" % name)
+        tar.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def test_update_tgz(self):
+        write(os.path.join(self.project, "change.txt"), "after\n")
+        write(os.path.join(self.project, "add.txt"), "added\n")
+        os.remove(os.path.join(self.project, "remove.txt"))
+
+        update_tgz(self.project, "foo-1.0",
+            ["change.txt", "add.txt", "remove.txt"], self.tgz)
+
+        tar = tarfile.open(self.tgz, "r:gz")
+        try:
+            self.assertEqual(["foo-1.0/add.txt", "foo-1.0/change.txt",
+                "foo-1.0/keep.txt"], sorted(tar.getnames()))
+            self.assertEqual(b"after\n",
+                tar.extractfile("foo-1.0/change.txt").read())
+            self.assertEqual(b"keep\n",
+                tar.extractfile("foo-1.0/keep.txt").read())
+            self.assertEqual("abc123", tar.pax_headers["comment"])
+        finally:
+            tar.close()
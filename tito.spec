@@ -67,9 +67,9 @@ Requires: fedpkg
 Requires: fedora-cert
 Requires: fedora-packager
 Requires: rpmdevtools
-# Cheetah doesn't exist for Python 3, but it's what Mead uses.  We
-# install it and call via the command line instead of importing the
-# potentially incompatible code
+# Cheetah is what Mead uses. Templates are rendered in-process when the
+# library can be imported by the Python tito runs under, otherwise via the
+# command line
 Requires: python-cheetah
 
 %description